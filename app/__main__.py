@@ -0,0 +1,96 @@
+# app/__main__.py
+# Run the server with settings from the environment: python -m app
+# Import users from a file: python -m app import-users users.csv
+# Pick the bcrypt cost for this host: python -m app calibrate-bcrypt --target-ms 250
+import argparse
+import asyncio
+import json
+import os
+import time
+from dataclasses import asdict
+
+import uvicorn
+
+# chunk size when streaming an import file
+READ_CHUNK_SIZE = 1 << 16
+
+
+def serve(args):
+    from app.config import load_env
+
+    load_env()
+    # WebSocket protocol pings are answered by every client, whatever frame format it asked for,
+    # so they detect dead peers of text clients too; the server closes a socket that stops answering
+    ping_interval = float(os.getenv("NOTI_PING_INTERVAL", "20")) or None
+    ping_timeout = ping_interval and ping_interval * int(os.getenv("NOTI_MAX_MISSED_PONGS", "2"))
+    uvicorn.run(
+        "app.main:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+        # permessage-deflate is negotiated per connection and compresses every frame for every
+        # recipient, turn it off on notification nodes where fan-out CPU matters more than bytes
+        ws_per_message_deflate=os.getenv("WS_PER_MESSAGE_DEFLATE", "true").lower() in ("1", "true", "yes"),
+        ws_ping_interval=ping_interval,
+        ws_ping_timeout=ping_timeout,
+    )
+
+
+async def _read_chunks(path: str):
+    with open(path, "rb") as f:
+        while chunk := await asyncio.to_thread(f.read, READ_CHUNK_SIZE):
+            yield chunk
+
+
+async def _import_users(path: str, fmt: str):
+    # app modules read their configuration at import, after the environment is loaded
+    from app.database import dispose_engines, init_db
+    from app.services.user_import import import_users
+    from app.utils.security import configure_password_hashing, shutdown_hash_pool
+
+    init_db()
+    configure_password_hashing()
+    try:
+        return await import_users(_read_chunks(path), fmt)
+    finally:
+        await dispose_engines()
+        shutdown_hash_pool()
+
+
+def import_users_command(args):
+    from app.config import load_env
+
+    load_env()
+    fmt = args.format or ("jsonl" if args.file.endswith((".jsonl", ".ndjson")) else "csv")
+    report = asyncio.run(_import_users(args.file, fmt))
+    print(json.dumps(asdict(report), indent=2))
+
+
+def calibrate_bcrypt_command(args):
+    from app.utils.security import calibrate_bcrypt_rounds, get_password_hash
+
+    rounds = calibrate_bcrypt_rounds(args.target_ms / 1000)
+    # check the extrapolation with one real hash at the chosen cost
+    start = time.perf_counter()
+    get_password_hash("calibration", rounds)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"BCRYPT_ROUNDS={rounds}  # {elapsed_ms:.0f} ms per hash on this host, target {args.target_ms:g} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("serve", help="run the server (default)").set_defaults(func=serve)
+    importer = commands.add_parser("import-users", help="bulk import users from a CSV or JSON lines file")
+    importer.add_argument("file", help="CSV with an email,password or email,hashed_password header, or JSON lines")
+    importer.add_argument("--format", choices=("csv", "jsonl"), help="guessed from the file extension by default")
+    importer.set_defaults(func=import_users_command)
+    calibrate = commands.add_parser("calibrate-bcrypt", help="print the bcrypt rounds that fit a time per hash")
+    calibrate.add_argument("--target-ms", type=float, default=250, help="time one hash should take (250)")
+    calibrate.set_defaults(func=calibrate_bcrypt_command)
+    args = parser.parse_args()
+    getattr(args, "func", serve)(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import hmac
+import os
+from dataclasses import asdict
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from starlette.requests import Request
+
+from app.services.outbox import outbox_dispatcher
+from app.services.user_import import ImportFormat, import_users
+
+# Shared secret for the admin endpoints, sent in the X-Admin-Token header. Unset disables them.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+router = APIRouter(prefix="/admin")
+
+
+def require_admin(x_admin_token: str = Header(default="")) -> None:
+    if not ADMIN_TOKEN or not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+@router.post("/users/import", dependencies=[Depends(require_admin)])
+async def import_users_endpoint(request: Request, format: ImportFormat = "csv"):
+    # the body is streamed, never held in memory as a whole
+    try:
+        report = await import_users(request.stream(), format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # the summary notification is in the outbox, deliver it now
+    outbox_dispatcher.wake()
+    return asdict(report)
@@ -0,0 +1,56 @@
+import time
+
+from fastapi import APIRouter
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.utils.metrics import registry
+
+router = APIRouter()
+
+HTTP_REQUESTS = registry.counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds", "Time from request to the end of the response body", ("method", "route"))
+
+
+def _route_label(scope: Scope) -> str:
+    # the route template keeps the label set bounded, mounts (static files) report their prefix
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    return scope.get("root_path") or "unmatched"
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware: unlike BaseHTTPMiddleware it adds no task per request
+    and leaves streaming responses (SSE) untouched."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = _route_label(scope)
+            HTTP_REQUESTS.labels(scope["method"], route, str(status)).inc()
+            HTTP_REQUEST_SECONDS.labels(scope["method"], route).observe(time.perf_counter() - start)
+
+
+@router.get("/metrics")
+async def metrics():
+    # everything is rendered here, nothing is aggregated between scrapes
+    return Response(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
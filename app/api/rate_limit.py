@@ -0,0 +1,47 @@
+import math
+from contextlib import asynccontextmanager
+
+from fastapi import Form, HTTPException
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+from app.models.user import UserCreate
+from app.services.rate_limit import rate_limiter
+from app.utils.security import HashPoolBusy
+
+
+async def _enforce(action: str, request: Request, email: str) -> None:
+    # the direct peer, run uvicorn with --proxy-headers behind a load balancer
+    ip = request.client.host if request.client else None
+    retry_after = await rate_limiter.check(action, ip, email)
+    if retry_after:
+        raise HTTPException(status_code=429, detail="Too many attempts",
+                            headers={"Retry-After": str(math.ceil(retry_after))})
+
+
+@asynccontextmanager
+async def _limited(action: str, request: Request, email: str):
+    await _enforce(action, request, email)
+    try:
+        yield
+    except HTTPException as e:
+        # wrong password, or an email that is already registered
+        if e.status_code in (400, 401):
+            await rate_limiter.record_failure(action, email)
+        raise
+
+
+# Route dependencies, they run before the route's own so a limited request never reaches bcrypt
+async def limit_login(request: Request, email: str = Form(...)):
+    async with _limited("login", request, email):
+        yield
+
+
+async def limit_register(request: Request, user_in: UserCreate):
+    async with _limited("register", request, user_in.email):
+        yield
+
+
+async def hash_pool_busy_handler(request: Request, exc: HashPoolBusy) -> JSONResponse:
+    return JSONResponse({"detail": "Server busy, retry later"}, status_code=503,
+                        headers={"Retry-After": str(exc.retry_after)})
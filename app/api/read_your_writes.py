@@ -0,0 +1,26 @@
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app import database
+from app.services.jwt_auth import RECENT_WRITE_COOKIE, recent_write_email
+
+
+class ReadYourWritesMiddleware:
+    """Reads the user named by the client's recent write cookie from the primary.
+
+    The cookie is set by /register, so the login that follows sees the new row on any
+    worker, not only on the one that wrote it, while the replicas catch up.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        email = None
+        if scope["type"] in ("http", "websocket"):
+            email = recent_write_email(HTTPConnection(scope).cookies.get(RECENT_WRITE_COOKIE))
+        if email is None:
+            await self.app(scope, receive, send)
+            return
+        with database.replica_router.stick_to_primary(email):
+            await self.app(scope, receive, send)
@@ -0,0 +1,25 @@
+import os
+
+from fastapi import APIRouter
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.config import STATIC_DIR
+from app.utils.static_cache import StaticCache
+
+# Rebuild a static file when it changes on disk, for development
+STATIC_RELOAD = os.getenv("STATIC_RELOAD", "false").lower() in ("1", "true", "yes")
+# Seconds browsers may reuse /static assets before revalidating them
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", "300"))
+
+# HTML pages are always revalidated, a 304 costs a round trip but no body
+PAGE_CACHE_CONTROL = "no-cache"
+
+static_pages = StaticCache(STATIC_DIR, reload=STATIC_RELOAD)
+
+router = APIRouter()
+
+
+@router.api_route("/static/{path:path}", methods=["GET", "HEAD"])
+async def get_static_file(request: Request, path: str) -> Response:
+    return static_pages.response(request, path, f"public, max-age={STATIC_MAX_AGE}")
@@ -1,19 +1,30 @@
+import math
 from datetime import timedelta
+from typing import Literal
 
 import logging
 from fastapi import Depends, Form, HTTPException, APIRouter
-from sqlmodel import Session
 from starlette.requests import Request
-from starlette.responses import HTMLResponse, RedirectResponse, JSONResponse, FileResponse
+from starlette.responses import HTMLResponse, RedirectResponse, JSONResponse, Response, StreamingResponse
 from starlette.websockets import WebSocket, WebSocketDisconnect, WebSocketState
 
+from app import database
 from app.services.jwt_auth import manager
-from app.database import get_session
 from app.models.user import UserCreate
 from app.services.noti_service import noti_manager
+from app.services.outbox import outbox_dispatcher
 from app.services.user_service import create_user, authenticate_user
-from app.services.jwt_auth import extract_email_from_ws_cookie
-from app.config import STATIC_DIR
+from app.services.jwt_auth import (
+    extract_email_from_ws_cookie,
+    invalidate_user,
+    authenticate_request,
+    create_user_token,
+    revoke_request_token,
+    RECENT_WRITE_COOKIE,
+    create_recent_write_token,
+)
+from app.api.rate_limit import limit_login, limit_register
+from app.api.static import PAGE_CACHE_CONTROL, static_pages
 
 logger = logging.getLogger(__name__)
 
@@ -32,8 +43,8 @@ async def root(request: Request):
     token = request.cookies.get("access_token")
     if token:
         try:
-            # Try to load user from token
-            await manager(request)
+            # Try to authorize from token
+            await authenticate_request(request)
             return RedirectResponse("/welcome")
         except Exception:
             logger.exception("access path / failed ")
@@ -41,27 +52,28 @@ async def root(request: Request):
     return RedirectResponse("/login")
 
 
-@router.post("/register")
-async def register(user_in: UserCreate, user=Depends(create_user)):
+@router.post("/register", dependencies=[Depends(limit_register)])
+async def register(user_in: UserCreate, response: Response, user=Depends(create_user)):
     logger.info("Register request: %s", user_in.email)
 
-    await noti_manager.broadcast(f"New user registered: {user.email}")
+    # the notification was committed to the outbox with the user, deliver it off the request path
+    outbox_dispatcher.wake()
+    # the login that follows may reach another worker, the cookie keeps its lookup on the primary
+    window = database.DB_READ_YOUR_WRITES_WINDOW
+    response.set_cookie(RECENT_WRITE_COOKIE, create_recent_write_token(user.email, window),
+                        max_age=math.ceil(window), secure=True, httponly=True, samesite="lax")
 
     return {"message": "User registered successfully", "email": user.email}
 
 
-@router.post("/login")
-def login(
+@router.post("/login", dependencies=[Depends(limit_login)])
+async def login(
         request: Request,
         email: str = Form(...),
         password: str = Form(...),
-        session: Session = Depends(get_session)
 ):
-    user = authenticate_user(email, password, session)
-    access_token = manager.create_access_token(
-        data={"sub": user.email},
-        expires=timedelta(hours=24)
-    )
+    user = await authenticate_user(email, password)
+    access_token = create_user_token(user, expires=timedelta(hours=24))
 
     response = JSONResponse({"message": "Login successful"})
     # set httponly=True to avoid security problems
@@ -76,6 +88,8 @@ async def logout(request: Request):
         user = await manager(request)
         logger.info("logout user email: %s", user.email)
         noti_manager.unsubscribe(user.email)
+        invalidate_user(user.email)
+        await revoke_request_token(request)
     except HTTPException:
         logger.exception("Logout failed")
 
@@ -85,46 +99,106 @@ async def logout(request: Request):
 
 
 @router.websocket("/ws/notifications")
-async def notifications_ws_handler(websocket: WebSocket):
-    email = None
+async def notifications_ws_handler(
+        websocket: WebSocket,
+        topics: str = "",
+        format: Literal["text", "json"] = "text",
+        binary: bool = False,
+        last_id: int | None = None,
+):
+    subscription = None
 
     await websocket.accept()
     logger.info("a new ws conn is coming")
     try:
         # generally is "access_token"
-        email = extract_email_from_ws_cookie(websocket)
+        email = await extract_email_from_ws_cookie(websocket)
         logger.info("ws connect from email:%s", email)
-        await noti_manager.subscribe(email, websocket)
-
+        # optional comma separated topics, e.g. /ws/notifications?topics=a,b
+        # binary=true receives UTF-8 frames encoded once for all recipients,
+        # last_id (the id of the last json frame seen) replays what was missed while offline
+        subscription = await noti_manager.subscribe(
+            email,
+            websocket,
+            topics=[t for t in topics.split(",") if t],
+            format=format,
+            binary=binary,
+            last_id=last_id,
+        )
+
+        # ASGI only reports pongs and disconnects through receive: json clients are checked by the manager's
+        # timer wheel, a peer that stops answering the server's protocol pings ends up as a disconnect here
         while True:
             await websocket.receive_text()
+            noti_manager.mark_alive(subscription)
     except WebSocketDisconnect:
-        if email:
-            noti_manager.unsubscribe(email)
+        pass
     except Exception as e:
         logger.exception("WebSocket error: %s", e)
     finally:
+        # only drop this socket, the user's other tabs stay subscribed
+        if subscription is not None:
+            noti_manager.unsubscribe_connection(subscription)
         if websocket.client_state == WebSocketState.CONNECTED:
             await websocket.close()
 
 
+@router.get("/sse/notifications")
+async def notifications_sse_handler(
+        request: Request,
+        topics: str = "",
+        format: Literal["text", "json"] = "text",
+        last_id: int | None = None,
+):
+    try:
+        email = await extract_email_from_ws_cookie(request)
+    except Exception:
+        logger.info("sse connection rejected")
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+
+    # EventSource sends the id of the last event it received when it reconnects
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id and last_event_id.isdigit():
+        last_id = int(last_event_id)
+
+    logger.info("sse connect from email:%s", email)
+
+    async def event_stream():
+        # registered once the body starts, a client gone before that leaves nothing to clean up
+        subscription = await noti_manager.subscribe_sse(
+            email, topics=[t for t in topics.split(",") if t], format=format, last_id=last_id
+        )
+        try:
+            async for chunk in subscription.stream():
+                yield chunk
+        finally:
+            # the server cancels the stream when the client goes away
+            noti_manager.unsubscribe_connection(subscription)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # Login page
 @router.get("/login", response_class=HTMLResponse)
-def get_login_page():
-    return FileResponse(STATIC_DIR / "login.html")
+async def get_login_page(request: Request):
+    return static_pages.response(request, "login.html", PAGE_CACHE_CONTROL)
 
 
 # Register page
 @router.get("/register", response_class=HTMLResponse)
-def get_register_page():
-    return FileResponse(STATIC_DIR / "register.html")
+async def get_register_page(request: Request):
+    return static_pages.response(request, "register.html", PAGE_CACHE_CONTROL)
 
 
 # Welcome page
 @router.get("/welcome", response_class=HTMLResponse)
 async def get_welcome_page(request: Request):
     try:
-        user = await manager(request)
+        user = await authenticate_request(request)
         if user is None:
             logger.info("user is none")
             return RedirectResponse("/login", status_code=303)
@@ -132,4 +206,5 @@ async def get_welcome_page(request: Request):
     except HTTPException:
         return RedirectResponse("/login", status_code=303)
 
-    return FileResponse(STATIC_DIR / "welcome.html")
+    # the page itself is the same for everyone, but only sent to logged in users
+    return static_pages.response(request, "welcome.html", f"private, {PAGE_CACHE_CONTROL}")
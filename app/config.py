@@ -1,4 +1,15 @@
+import os
 from pathlib import Path
 
+from dotenv import load_dotenv
+
 BASE_DIR = Path(__file__).resolve().parent
 STATIC_DIR = BASE_DIR / "static"
+
+
+def load_env() -> None:
+    """Load different configs according to different environment, before any module reads them."""
+    if os.getenv("APP_ENV") == "docker":
+        load_dotenv(".env.docker")
+    else:
+        load_dotenv(".env.local")
@@ -1,20 +1,301 @@
 # app/database.py
-from sqlmodel import SQLModel, create_engine, Session
+import asyncio
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Sequence
+
+from sqlalchemy import exc, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlmodel import SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 import os
 
+from app.utils.cache import TTLCache
+from app.utils.histogram import Histogram
+from app.utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
 DB_HOST = os.getenv("DB_HOST")
 DB_DATABASE = os.getenv("DB_DATABASE")
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
-DATABASE_URL = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_DATABASE}"
+# Full sync URL override, e.g. sqlite:///./app.db
+DATABASE_URL = os.getenv("DATABASE_URL", f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_DATABASE}")
+# Async driver used by the request path: aiomysql or asyncmy
+DB_ASYNC_DRIVER = os.getenv("DB_ASYNC_DRIVER", "aiomysql")
+# Full async URL override, e.g. sqlite+aiosqlite:///./app.db
+ASYNC_DATABASE_URL = os.getenv(
+    "ASYNC_DATABASE_URL",
+    f"mysql+{DB_ASYNC_DRIVER}://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_DATABASE}",
+)
+
+# Connections the database server grants this app, split between the workers of a host
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "40"))
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+# Extra short-lived connections opened when a pool is exhausted, per engine
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+# Connections of the sync engine, only used by the outbox dispatcher and the replay log reads
+DB_BACKGROUND_POOL_SIZE = int(os.getenv("DB_BACKGROUND_POOL_SIZE", "2"))
+# Connections one worker may hold on the primary: both engines' pools and overflows
+_WORKER_BUDGET = DB_MAX_CONNECTIONS // WEB_CONCURRENCY
+_DEFAULT_POOL_SIZE = _WORKER_BUDGET - DB_BACKGROUND_POOL_SIZE - 2 * DB_MAX_OVERFLOW
+# Persistent request-path connections per worker, by default what is left of its share of the budget.
+# Each replica pool has the same size and overflow on its own server, so it fits that server's budget too.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", str(max(2, _DEFAULT_POOL_SIZE))))
+if DB_POOL_SIZE + DB_BACKGROUND_POOL_SIZE + 2 * DB_MAX_OVERFLOW > _WORKER_BUDGET:
+    logger.warning("Database pools may open %d connections per worker, more than the %d of DB_MAX_CONNECTIONS",
+                   DB_POOL_SIZE + DB_BACKGROUND_POOL_SIZE + 2 * DB_MAX_OVERFLOW, _WORKER_BUDGET)
+# Seconds to wait for a free connection before failing the request
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Replace connections older than this, keep it below MySQL's wait_timeout
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Test each connection on checkout so a server-side close costs a reconnect, not a failed request
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Connections opened at startup so the first requests don't pay the connect
+DB_POOL_WARMUP = int(os.getenv("DB_POOL_WARMUP", str(DB_POOL_SIZE)))
+# Comma separated async URLs of read replicas, reads stay on the primary when empty
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+# Seconds between replica health checks
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "5"))
+# Seconds reads of a just written key go to the primary, should cover the replication lag
+DB_READ_YOUR_WRITES_WINDOW = float(os.getenv("DB_READ_YOUR_WRITES_WINDOW", "10"))
+# Log every SQL statement, for debugging only
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() in ("1", "true", "yes")
+
+
+class _CheckoutTimingMixin:
+    """Records how long each checkout waited for a connection, pre-ping and reconnects included."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_time = Histogram()
+        self.timeouts = 0
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            logger.warning("Connection pool exhausted: %s", self.status())
+            raise
+        finally:
+            self.wait_time.observe(time.perf_counter() - start)
+
+
+class InstrumentedQueuePool(_CheckoutTimingMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_CheckoutTimingMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def _pool_options(pool_size: int) -> dict:
+    return {
+        "pool_size": pool_size,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "echo": DB_ECHO,
+    }
+
+
+# Sync engine for schema setup and the background workers that run in threads
+engine = create_engine(DATABASE_URL, poolclass=InstrumentedQueuePool, **_pool_options(DB_BACKGROUND_POOL_SIZE))
+# Async engine for request handlers, queries don't block the event loop
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL, poolclass=InstrumentedAsyncQueuePool, **_pool_options(DB_POOL_SIZE)
+)
+
+
+# Key the current request reads from the primary, set from the client's recent write cookie
+_sticky_key: ContextVar[str | None] = ContextVar("sticky_key", default=None)
+
+
+class ReplicaRouter:
+    """Spreads reads over the healthy replicas round-robin and keeps writes on the primary.
+
+    Keys written within `sticky_window` seconds (e.g. a new user's email) are read from
+    the primary so a lagging replica can't hide them: by this worker from memory, by the
+    others inside `stick_to_primary`, which follows the client. Replicas failing a health
+    check or a query are skipped until the next successful check.
+    """
+
+    def __init__(self, primary: AsyncEngine, replicas: Sequence[AsyncEngine] = (),
+                 sticky_window: float = DB_READ_YOUR_WRITES_WINDOW,
+                 check_interval: float = DB_REPLICA_CHECK_INTERVAL):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.check_interval = check_interval
+        self._down: set[AsyncEngine] = set()
+        self._cursor = itertools.count()
+        self._recent_writes = TTLCache(maxsize=100000, ttl=sticky_window)
+        self._task: asyncio.Task | None = None
+
+    def healthy_replicas(self) -> list[AsyncEngine]:
+        return [replica for replica in self.replicas if replica not in self._down]
+
+    def read_engine(self, key: str | None = None) -> AsyncEngine:
+        if key is not None and (key == _sticky_key.get() or self._recent_writes.get(key) is not None):
+            return self.primary
+        healthy = self.healthy_replicas()
+        if not healthy:
+            return self.primary
+        return healthy[next(self._cursor) % len(healthy)]
+
+    def note_write(self, key: str) -> None:
+        self._recent_writes.set(key, True)
 
-engine = create_engine(DATABASE_URL, echo=True)
+    @contextmanager
+    def stick_to_primary(self, key: str) -> Iterator[None]:
+        """Read `key` from the primary in the current task, for a key written by another worker."""
+        token = _sticky_key.set(key)
+        try:
+            yield
+        finally:
+            _sticky_key.reset(token)
 
+    def mark_down(self, replica: AsyncEngine) -> None:
+        if replica is not self.primary and replica not in self._down:
+            logger.warning("Replica %s marked down", replica.url.render_as_string())
+            self._down.add(replica)
 
-def get_session():
-    with Session(engine) as session:
+    async def check(self) -> None:
+        """Ping every replica and update which ones take reads."""
+        for replica in self.replicas:
+            try:
+                async with asyncio.timeout(self.check_interval):
+                    async with replica.connect() as conn:
+                        await conn.execute(text("SELECT 1"))
+            except Exception:
+                self.mark_down(replica)
+            else:
+                if replica in self._down:
+                    logger.info("Replica %s is back", replica.url.render_as_string())
+                    self._down.discard(replica)
+
+    async def _run(self) -> None:
+        while True:
+            await self.check()
+            await asyncio.sleep(self.check_interval)
+
+    async def start(self) -> None:
+        if self.replicas and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+replica_router = ReplicaRouter(
+    async_engine,
+    [create_async_engine(url, poolclass=InstrumentedAsyncQueuePool, **_pool_options(DB_POOL_SIZE))
+     for url in DATABASE_REPLICA_URLS],
+)
+
+
+DB_SESSION_SECONDS = registry.histogram(
+    "db_session_seconds", "Time a connection or session is held, by use", ("use",))
+
+
+async def get_async_session():
+    # not timed as a whole: the session only checks a connection out on its first statement,
+    # the handler may await other work (bcrypt) before that, callers time the part holding it
+    # objects stay usable after commit, handlers return them after the session is done
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
         yield session
 
 
 def init_db():
     SQLModel.metadata.create_all(engine)
+
+
+async def dispose_engines() -> None:
+    """Close every pooled connection, async drivers keep a thread or socket per connection."""
+    for replica in replica_router.replicas:
+        await replica.dispose()
+    await async_engine.dispose()
+    engine.dispose()
+
+
+async def _open_connection() -> AsyncConnection:
+    conn = await async_engine.connect()
+    try:
+        await conn.execute(text("SELECT 1"))
+    except BaseException:
+        await conn.close()
+        raise
+    return conn
+
+
+async def warm_up_pool(count: int = DB_POOL_WARMUP) -> int:
+    """Open `count` request-path connections at once so they all land in the pool."""
+    # held concurrently, opening them one after another would reuse the same connection
+    results = await asyncio.gather(*(_open_connection() for _ in range(count)), return_exceptions=True)
+    opened = [conn for conn in results if isinstance(conn, AsyncConnection)]
+    for conn in opened:
+        await conn.close()
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if errors:
+        logger.warning("Pool warm-up opened %d of %d connections: %s", len(opened), count, errors[0])
+    return len(opened)
+
+
+def _pool_stats(sync_engine: Engine) -> dict:
+    pool = sync_engine.pool
+    stats = {"status": pool.status()}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+        })
+    if isinstance(pool, _CheckoutTimingMixin):
+        stats.update({"timeouts": pool.timeouts, "wait_time": pool.wait_time.snapshot()})
+    return stats
+
+
+def pool_stats() -> dict:
+    """Occupancy and checkout wait times of both engines' pools."""
+    stats = {"sync": _pool_stats(engine), "async": _pool_stats(async_engine.sync_engine)}
+    for index, replica in enumerate(replica_router.replicas):
+        stats[f"replica_{index}"] = {**_pool_stats(replica.sync_engine), "down": replica in replica_router._down}
+    return stats
+
+
+def _pools() -> dict:
+    pools = {"sync": engine.pool, "async": async_engine.sync_engine.pool}
+    for index, replica in enumerate(replica_router.replicas):
+        pools[f"replica_{index}"] = replica.sync_engine.pool
+    return pools
+
+
+def _queue_pools() -> dict:
+    return {name: pool for name, pool in _pools().items() if isinstance(pool, QueuePool)}
+
+
+registry.callback("gauge", "db_pool_checked_out", "Connections in use",
+                  lambda: {(name,): pool.checkedout() for name, pool in _queue_pools().items()}, ("engine",))
+registry.callback("gauge", "db_pool_overflow", "Overflow connections open, negative while the pool is not full",
+                  lambda: {(name,): pool.overflow() for name, pool in _queue_pools().items()}, ("engine",))
+registry.callback("counter", "db_pool_timeouts_total", "Checkouts that gave up waiting for a connection",
+                  lambda: {(name,): pool.timeouts for name, pool in _pools().items()
+                           if isinstance(pool, _CheckoutTimingMixin)}, ("engine",))
+registry.callback("histogram", "db_pool_wait_seconds", "Time to check out a connection",
+                  lambda: {(name,): pool.wait_time.snapshot() for name, pool in _pools().items()
+                           if isinstance(pool, _CheckoutTimingMixin)}, ("engine",))
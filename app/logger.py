@@ -1,19 +1,110 @@
 # app/logger.py
+import atexit
+import json
 import logging
+import os
+import queue
 import sys
-from logging.handlers import TimedRotatingFileHandler
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+from typing import Callable
+
 from app.config import BASE_DIR
 
 LOG_DIR = BASE_DIR.parent / "logs"
 LOG_DIR.mkdir(exist_ok=True)
 
+# Output format of both handlers: text or json (one object per line)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+# Max INFO/DEBUG records per second per module, e.g. app.services.noti_service=20,app.api=100
+LOG_RATE_LIMITS = os.getenv("LOG_RATE_LIMITS", "")
+
+_listener: QueueListener | None = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, for log shippers."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket per configured logger prefix, drops INFO/DEBUG records above the rate.
+
+    Warnings and errors always pass. The next record let through after a drop
+    reports how many were suppressed.
+    """
+
+    def __init__(self, rates: dict[str, float], timer: Callable[[], float] = time.monotonic):
+        super().__init__()
+        # longest prefix first so app.services.noti_service wins over app.services
+        self._rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+        self._timer = timer
+        self._lock = threading.Lock()
+        # prefix -> [tokens, last refill, suppressed]
+        self._buckets = {prefix: [rate, timer(), 0] for prefix, rate in self._rates}
+
+    def _match(self, name: str) -> tuple[str, float] | None:
+        for prefix, rate in self._rates:
+            if name == prefix or name.startswith(prefix + "."):
+                return prefix, rate
+        return None
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        match = self._match(record.name)
+        if match is None:
+            return True
+        prefix, rate = match
+        with self._lock:
+            bucket = self._buckets[prefix]
+            now = self._timer()
+            bucket[0] = min(rate, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            suppressed, bucket[2] = bucket[2], 0
+        if suppressed:
+            record.msg = f"{record.msg} ({suppressed} similar records suppressed)"
+        return True
+
+
+def parse_rate_limits(spec: str) -> dict[str, float]:
+    rates = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, rate = item.split("=", 1)
+            rates[name.strip()] = float(rate)
+    return rates
+
+
 def init_logging(level: int = logging.INFO) -> None:
+    """Route all records through a queue; a listener thread does the formatting and I/O
+    so logging never blocks the event loop or a request thread on a write."""
+    global _listener
     if logging.getLogger().hasHandlers():
         return
 
-    formatter = logging.Formatter(
-        "[%(asctime)s] [%(levelname)s] [%(name)s] - %(message)s"
-    )
+    if LOG_FORMAT == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            "[%(asctime)s] [%(levelname)s] [%(name)s] - %(message)s"
+        )
 
     # Console handler
     stream_handler = logging.StreamHandler(sys.stdout)
@@ -30,10 +121,27 @@ def init_logging(level: int = logging.INFO) -> None:
     )
     file_handler.setFormatter(formatter)
 
+    # unbounded so a slow disk never blocks callers, the listener drains it
+    queue_handler = QueueHandler(queue.SimpleQueue())
+    rates = parse_rate_limits(LOG_RATE_LIMITS)
+    if rates:
+        queue_handler.addFilter(RateLimitFilter(rates))
+
+    _listener = QueueListener(queue_handler.queue, stream_handler, file_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
     root_logger = logging.getLogger()
     root_logger.setLevel(level)
-    root_logger.addHandler(stream_handler)
-    root_logger.addHandler(file_handler)
+    root_logger.addHandler(queue_handler)
 
     # supress warnings of passlib
     logging.getLogger('passlib').setLevel(logging.ERROR)
+
+
+def shutdown_logging() -> None:
+    """Flush the queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,24 +1,22 @@
 # app/main.py
 
 # load different configs according to different environment
-from dotenv import load_dotenv
-import os
+from app.config import load_env
 
-if os.getenv("APP_ENV") == "docker":
-    load_dotenv(".env.docker")
-else:
-    load_dotenv(".env.local")
+load_env()
 
 import logging
 
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
 
-from app.database import init_db
-from app.logger import init_logging
+from app.database import dispose_engines, init_db, replica_router, warm_up_pool
+from app.utils.security import HashPoolBusy, configure_password_hashing, shutdown_hash_pool
+from app.services.noti_service import noti_manager
+from app.services.outbox import outbox_dispatcher
+from app.services.user_service import drain_rehashes
+from app.logger import init_logging, shutdown_logging
 from contextlib import asynccontextmanager
-from app.api import user
-from app.config import BASE_DIR
+from app.api import admin, metrics, rate_limit, read_your_writes, static, user
 
 
 @asynccontextmanager
@@ -26,19 +24,35 @@ async def lifespan(app: FastAPI):
     # Initialize resources before FastAPI starts
     init_db()
     init_logging()
+    configure_password_hashing()
+    await warm_up_pool()
+    await replica_router.start()
+    await noti_manager.start()
+    await outbox_dispatcher.start()
 
     yield
 
     # Clean up resources after FastAPI shuts down (if needed)
+    await outbox_dispatcher.stop()
+    await noti_manager.close()
+    await drain_rehashes()
+    await replica_router.stop()
+    await dispose_engines()
+    shutdown_hash_pool()
+    shutdown_logging()
 
 
 logger = logging.getLogger(__name__)
 
 
 app = FastAPI(lifespan=lifespan)
-app.mount(
-    "/static",
-    StaticFiles(directory=os.path.join(BASE_DIR, "static")),
-    name="static"
-)
+app.add_middleware(metrics.MetricsMiddleware)
+# a login right after /register may land on another worker while the replicas lag
+app.add_middleware(read_your_writes.ReadYourWritesMiddleware)
+# a saturated bcrypt pool sheds logins and registrations with a 503 instead of queueing them
+app.add_exception_handler(HashPoolBusy, rate_limit.hash_pool_busy_handler)
+# served from memory with precompressed variants, see app/api/static.py
+app.include_router(static.router, prefix="")
 app.include_router(user.router, prefix="")
+app.include_router(metrics.router, prefix="")
+app.include_router(admin.router)
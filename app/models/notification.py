@@ -0,0 +1,13 @@
+# app/models/notification.py
+from sqlmodel import SQLModel, Field
+from typing import Optional
+from datetime import datetime, timezone
+
+
+class Notification(SQLModel, table=True):
+    """Notification event, inserted in the same transaction as the change that triggers it
+    (transactional outbox) and marked once handed to the NotificationManager."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    message: str
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    dispatched_at: Optional[datetime] = Field(default=None, index=True)
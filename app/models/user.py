@@ -1,4 +1,5 @@
 # app/user.py
+from dataclasses import dataclass
 from sqlmodel import SQLModel, Field
 from typing import Optional
 from datetime import datetime, timezone
@@ -18,5 +19,15 @@ class UserCreate(UserBase):
 class User(UserBase, table=True):
     """Database model for storing users."""
     id: Optional[int] = Field(default=None, primary_key=True)
+    # unique index keeps lookups by email O(log n) and lets the DB reject duplicate registrations
+    email: EmailStr = Field(unique=True, index=True)
     hashed_password: str
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+@dataclass(frozen=True, slots=True)
+class UserRecord:
+    """Columns the auth paths need, read without ORM hydration or the identity map."""
+    id: int
+    email: str
+    hashed_password: str
@@ -1,34 +1,137 @@
 # app/jwt_auth.py
+import hashlib
 import os
+import time
+import uuid
 import jwt
 import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
 from fastapi_login import LoginManager
-from starlette.websockets import WebSocket
+from starlette.requests import HTTPConnection, Request
 
-from sqlmodel import select, Session
-from app.database import engine
-from app.models.user import User
+from app.models.user import User, UserRecord
+from app.services.user_service import get_user_by_email
+from app.services.token_revocation import revocation_store
+from app.utils.cache import TTLCache
+from app.utils.metrics import registry
 
 logger = logging.getLogger(__name__)
 
 # Load secret key from environment
 SECRET_KEY = os.getenv("SECRET_KEY", "super-secret-key")
+# Signs the recent write cookie, a key of its own so that cookie can never pass for an access token
+_RECENT_WRITE_KEY = hashlib.sha256(f"recent-write:{SECRET_KEY}".encode()).hexdigest()
+# Cookie naming the user a client just registered, so every worker reads that user from the primary
+RECENT_WRITE_COOKIE = "recent_write"
+
+
+async def is_token_revoked(payload: dict) -> bool:
+    subject = payload.get("sub")
+    # a token without iat predates every cutoff
+    return subject is not None and await revocation_store.is_revoked(subject, payload.get("iat", 0))
+
+
+class RevocableLoginManager(LoginManager):
+    """LoginManager that also rejects tokens revoked on logout."""
+
+    async def _get_current_user(self, payload: dict):
+        # checked here, the payload is decoded synchronously and the store may wait on its file
+        if await is_token_revoked(payload):
+            raise self.not_authenticated_exception
+        return await super()._get_current_user(payload)
+
 
 # Initialize token manager
-manager = LoginManager(SECRET_KEY, token_url="/login", use_cookie=True)
+manager = RevocableLoginManager(SECRET_KEY, token_url="/login", use_cookie=True)
 manager.cookie_name = "access_token"
 
+# Stateless mode: tokens carry the user id and a token version, so page routes
+# authorize from the verified claims and skip the user lookup
+JWT_STATELESS_AUTH = os.getenv("JWT_STATELESS_AUTH", "false").lower() in ("1", "true", "yes")
+# Bump to send every previously issued token back through the DB lookup
+TOKEN_VERSION = int(os.getenv("TOKEN_VERSION", "1"))
 
-@manager.user_loader()
-def load_user(email: str) -> User | None:
+
+@dataclass(frozen=True, slots=True)
+class AuthIdentity:
+    """Minimal view of the authenticated user needed by the page routes."""
+    email: str
+    user_id: int | None = None
+
+
+# Cache of loaded users keyed by email, saves a query on every authenticated request
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+USER_CACHE_MAXSIZE = int(os.getenv("USER_CACHE_MAXSIZE", "10000"))
+user_cache = TTLCache(maxsize=USER_CACHE_MAXSIZE, ttl=USER_CACHE_TTL)
+
+LOAD_USER_SECONDS = registry.histogram("load_user_seconds", "Time to load the user of a token, cache hits included")
+registry.callback("counter", "user_cache_requests_total", "User cache lookups by result",
+                  lambda: {("hit",): user_cache.hits, ("miss",): user_cache.misses}, ("result",))
+registry.callback("counter", "user_cache_evictions_total", "Users evicted from the cache to stay within its size",
+                  lambda: {(): user_cache.evictions})
+registry.callback("gauge", "user_cache_size", "Users in the cache", lambda: {(): len(user_cache)})
+
+
+async def _query_user(email: str) -> UserRecord | None:
     logger.info("load user with email: %s", email)
-    with Session(engine) as session:
-        user = session.exec(select(User).where(User.email == email)).first()
-        return user
+    return await get_user_by_email(email)
+
+
+# fastapi-login awaits coroutine loaders, so the lookup runs on the event loop
+@manager.user_loader()
+async def load_user(email: str) -> UserRecord | None:
+    with LOAD_USER_SECONDS.time():
+        return await user_cache.get_or_load_async(email, _query_user)
+
 
+def invalidate_user(email: str) -> None:
+    """Drop the cached user, must be called whenever a user row changes or logs out."""
+    user_cache.invalidate(email)
 
-# fastapi-login doesn't provide a method to extract info from WebSocket request
-def extract_email_from_ws_cookie(websocket: WebSocket) -> str:
+
+def create_user_token(user: User | UserRecord, expires: timedelta) -> str:
+    # iat keeps sub-second precision, a login right after a logout must be newer than its cutoff
+    data = {"sub": user.email, "jti": uuid.uuid4().hex, "iat": time.time()}
+    if JWT_STATELESS_AUTH:
+        data.update({"uid": user.id, "ver": TOKEN_VERSION})
+    return manager.create_access_token(data=data, expires=expires)
+
+
+async def revoke_request_token(request: Request) -> None:
+    """Revoke the token carried by the request, and the older ones of the same user, until it expires."""
+    token = request.cookies.get(manager.cookie_name)
+    if not token:
+        return
+    payload = manager._get_payload(token)
+    if payload.get("sub") and payload.get("exp"):
+        await revocation_store.revoke(payload["sub"], payload.get("iat", 0), payload["exp"])
+
+
+def _has_current_claims(payload: dict) -> bool:
+    return JWT_STATELESS_AUTH and payload.get("uid") is not None and payload.get("ver") == TOKEN_VERSION
+
+
+async def authenticate_request(request: Request) -> AuthIdentity:
+    """Authorize from the token claims in stateless mode, otherwise (or when the
+    claims are missing or stale) load the user through the LoginManager.
+    Raises `manager.not_authenticated_exception` on failure."""
+    if JWT_STATELESS_AUTH:
+        token = request.cookies.get(manager.cookie_name)
+        if token:
+            payload = manager._get_payload(token)
+            if payload.get("sub") and _has_current_claims(payload):
+                if await is_token_revoked(payload):
+                    raise manager.not_authenticated_exception
+                return AuthIdentity(email=payload["sub"], user_id=payload["uid"])
+
+    user = await manager(request)
+    return AuthIdentity(email=user.email, user_id=user.id)
+
+
+# fastapi-login doesn't provide a method to extract info from WebSocket request,
+# also used by the SSE endpoint which authenticates the same way
+async def extract_email_from_ws_cookie(websocket: HTTPConnection) -> str:
     token = websocket.cookies.get(manager.cookie_name)
     if not token:
         raise ValueError("Missing token")
@@ -36,4 +139,25 @@ def extract_email_from_ws_cookie(websocket: WebSocket) -> str:
     email = payload.get("sub")
     if not email:
         raise ValueError("Missing 'sub' in token")
+    if await is_token_revoked(payload):
+        raise ValueError("Token revoked")
+    if JWT_STATELESS_AUTH and not _has_current_claims(payload):
+        # claims are missing or stale, make sure the user still exists
+        if await load_user(email) is None:
+            raise ValueError("Unknown user in token")
     return email
+
+
+def create_recent_write_token(email: str, window: float) -> str:
+    expires = datetime.now(timezone.utc) + timedelta(seconds=window)
+    return jwt.encode({"sub": email, "exp": expires}, _RECENT_WRITE_KEY, algorithm="HS256")
+
+
+def recent_write_email(token: str | None) -> str | None:
+    """The email of a valid, unexpired recent write cookie, None otherwise."""
+    if not token:
+        return None
+    try:
+        return jwt.decode(token, _RECENT_WRITE_KEY, algorithms=["HS256"]).get("sub")
+    except jwt.InvalidTokenError:
+        return None
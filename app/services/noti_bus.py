@@ -0,0 +1,169 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Callable
+
+from app.utils.local_sqlite import LocalSqlite, sqlite_url_path
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two flush/poll rounds of a shared bus
+NOTI_BUS_POLL_INTERVAL = float(os.getenv("NOTI_BUS_POLL_INTERVAL", "0.05"))
+# Max events read from a shared bus per round
+NOTI_BUS_BATCH_SIZE = int(os.getenv("NOTI_BUS_BATCH_SIZE", "500"))
+# Seconds events stay in a shared bus before being pruned
+NOTI_BUS_RETENTION = float(os.getenv("NOTI_BUS_RETENTION", "60"))
+
+
+class NotificationBus(ABC):
+    """Pub/sub channel between the NotificationManagers of all workers.
+
+    Events are dicts, `publish` never waits for delivery. The bound callback
+    receives events in batches and is called on the event loop.
+    """
+
+    def __init__(self):
+        self._deliver: Callable[[list[dict]], None] | None = None
+
+    def bind(self, deliver: Callable[[list[dict]], None]) -> None:
+        self._deliver = deliver
+
+    @abstractmethod
+    def publish(self, event: dict) -> None:
+        ...
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+
+class InProcessBus(NotificationBus):
+    """Delivers events straight to the local manager, for a single worker and tests."""
+
+    def publish(self, event: dict) -> None:
+        self._deliver([event])
+
+
+class SqliteBus(NotificationBus):
+    """Bus shared by all workers on one host through a local SQLite file.
+
+    Local events are delivered immediately and buffered, every poll round
+    writes the buffer in one transaction and reads the other workers' events
+    in batches, so cross-worker traffic costs one write and one read per round.
+    """
+
+    def __init__(
+            self,
+            path: str,
+            poll_interval: float = NOTI_BUS_POLL_INTERVAL,
+            batch_size: int = NOTI_BUS_BATCH_SIZE,
+            retention: float = NOTI_BUS_RETENTION,
+    ):
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.retention = retention
+        self.origin = uuid.uuid4().hex
+        self._pending: list[dict] = []
+        self._last_id = 0
+        self._caught_up = True
+        self._db = LocalSqlite(path)
+        self._task: asyncio.Task | None = None
+        self._stopping = asyncio.Event()
+
+    def publish(self, event: dict) -> None:
+        self._deliver([event])
+        if self._task is not None:
+            self._pending.append(event)
+
+    def _open(self) -> None:
+        conn = self._db.connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS noti_bus "
+            "(id INTEGER PRIMARY KEY AUTOINCREMENT, origin TEXT NOT NULL, payload TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM noti_bus").fetchone()[0]
+
+    def _exchange(self, outgoing: list[dict]) -> list[dict]:
+        now = time.time()
+        conn = self._db.connect()
+        if outgoing:
+            conn.execute("BEGIN")
+            try:
+                conn.executemany(
+                    "INSERT INTO noti_bus (origin, payload, created_at) VALUES (?, ?, ?)",
+                    [(self.origin, json.dumps(event), now) for event in outgoing],
+                )
+                conn.execute("DELETE FROM noti_bus WHERE created_at < ?", (now - self.retention,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        rows = conn.execute(
+            "SELECT id, origin, payload FROM noti_bus WHERE id > ? ORDER BY id LIMIT ?",
+            (self._last_id, self.batch_size),
+        ).fetchall()
+        if rows:
+            self._last_id = rows[-1][0]
+        self._caught_up = len(rows) < self.batch_size
+        return [json.loads(payload) for _, origin, payload in rows if origin != self.origin]
+
+    async def _pause(self) -> None:
+        # a poll interval, cut short by stop()
+        try:
+            async with asyncio.timeout(self.poll_interval):
+                await self._stopping.wait()
+        except TimeoutError:
+            pass
+
+    async def _run(self) -> None:
+        while not self._stopping.is_set():
+            outgoing, self._pending = self._pending, []
+            try:
+                incoming = await asyncio.to_thread(self._exchange, outgoing)
+            except Exception:
+                logger.exception("Notification bus round failed, retrying")
+                self._pending[:0] = outgoing
+                await self._pause()
+                continue
+            if incoming:
+                self._deliver(incoming)
+            # keep reading without pause while other workers have a backlog
+            if self._caught_up:
+                await self._pause()
+
+    async def start(self) -> None:
+        await asyncio.to_thread(self._open)
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            # cancelling would not stop an exchange already running in its thread, which
+            # could then race the final flush and close on the same connection
+            self._stopping.set()
+            await self._task
+            self._task = None
+        # events are only queued while the bus runs
+        if self._pending:
+            outgoing, self._pending = self._pending, []
+            await asyncio.to_thread(self._exchange, outgoing)
+        self._db.close()
+
+
+def create_notification_bus(url: str) -> NotificationBus:
+    """`memory` for a single worker, a `sqlite:///` file to relay events between the workers of a host."""
+    if url == "memory":
+        return InProcessBus()
+    path = sqlite_url_path(url)
+    if path is not None:
+        return SqliteBus(path)
+    raise ValueError(f"Unsupported notification bus: {url}")
@@ -0,0 +1,101 @@
+import asyncio
+import os
+from collections import deque
+
+from sqlalchemy import Engine
+from sqlmodel import Session, select
+
+from app import database
+from app.models.notification import Notification
+
+# Recent events kept in memory to serve reconnecting clients without touching the database
+NOTI_LOG_SIZE = int(os.getenv("NOTI_LOG_SIZE", "10000"))
+
+
+class NotificationLog:
+    """Ring buffer of the latest published events sorted by Notification id, backed by the
+    notification table for older gaps.
+
+    Ids mostly arrive in order, but outbox batches claimed by different workers may reach the
+    bus interleaved: late ids are inserted at their place, ids already held are skipped.
+    """
+
+    def __init__(self, size: int = NOTI_LOG_SIZE, engine: Engine | None = None):
+        self.size = size
+        self._events: deque[dict] = deque()
+        self._ids: set[int] = set()
+        # newest id published or loaded, may be above the ring when nothing newer was kept
+        self._newest_id: int | None = None
+        self._engine = engine
+
+    @property
+    def engine(self) -> Engine:
+        return self._engine or database.engine
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def append(self, event: dict) -> None:
+        event_id = event["id"]
+        if self._newest_id is None or event_id > self._newest_id:
+            self._newest_id = event_id
+        # the bus delivers at-least-once
+        if event_id in self._ids:
+            return
+        if self._events and event_id < self._events[-1]["id"]:
+            if len(self._events) >= self.size and event_id < self._events[0]["id"]:
+                # older than everything kept, replays read it from the database
+                return
+            # late ids land near the newest end, walk back from there
+            index = len(self._events) - 1
+            while index > 0 and self._events[index - 1]["id"] > event_id:
+                index -= 1
+            self._events.insert(index, event)
+        else:
+            self._events.append(event)
+        self._ids.add(event_id)
+        if len(self._events) > self.size:
+            self._ids.discard(self._events.popleft()["id"])
+
+    def oldest_id(self) -> int | None:
+        return self._events[0]["id"] if self._events else None
+
+    def newest_id(self) -> int | None:
+        """The newest id this log knows of, None until an event is published or `load` ran."""
+        return self._newest_id
+
+    async def load(self) -> None:
+        """Fill the ring with the newest dispatched events, so replays after a restart don't hit the database."""
+        for event in await self.read_range(0, None, self.size):
+            self.append(event)
+        if self._newest_id is None:
+            # nothing was ever dispatched, there is nothing a client could have missed
+            self._newest_id = 0
+
+    def since(self, last_id: int) -> list[dict]:
+        """Events in the ring with an id greater than `last_id`."""
+        if not self._events or self._events[-1]["id"] <= last_id:
+            return []
+        # ids are sorted, walk back from the newest end which is where reconnecting clients are
+        result = []
+        for event in reversed(self._events):
+            if event["id"] <= last_id:
+                break
+            result.append(event)
+        result.reverse()
+        return result
+
+    def _read_range(self, after_id: int, before_id: int | None, limit: int) -> list[dict]:
+        # the newest `limit` dispatched events in (after_id, before_id), a range scan on the primary key
+        statement = select(Notification.id, Notification.message).where(
+            Notification.id > after_id, Notification.dispatched_at.is_not(None)
+        )
+        if before_id is not None:
+            statement = statement.where(Notification.id < before_id)
+        statement = statement.order_by(Notification.id.desc()).limit(limit)
+        with Session(self.engine) as session:
+            rows = session.exec(statement).all()
+        return [{"id": row.id, "message": row.message} for row in reversed(rows)]
+
+    async def read_range(self, after_id: int, before_id: int | None, limit: int) -> list[dict]:
+        return await asyncio.to_thread(self._read_range, after_id, before_id, limit)
@@ -1,31 +1,542 @@
+import asyncio
+import json
 import logging
+import os
+from typing import Iterable
 from fastapi import WebSocket
+from starlette.websockets import WebSocketState
+
+from app.services.noti_bus import NotificationBus, create_notification_bus
+from app.services.noti_log import NotificationLog
+from app.utils.metrics import registry
+from app.utils.timer_wheel import Timer, TimerWheel
 
 logger=logging.getLogger(__name__)
 
+# Max messages waiting for one client before the overflow policy applies
+NOTI_QUEUE_SIZE = int(os.getenv("NOTI_QUEUE_SIZE", "100"))
+# Seconds a single send may take before the client is considered stalled
+NOTI_SEND_TIMEOUT = float(os.getenv("NOTI_SEND_TIMEOUT", "5"))
+# "disconnect" drops the slow client, "drop_message" drops the new message for that client only
+NOTI_OVERFLOW_POLICY = os.getenv("NOTI_OVERFLOW_POLICY", "disconnect")
+# "memory" for a single worker, "sqlite:///path/bus.db" to reach the sockets of all workers on the host
+NOTI_BUS = os.getenv("NOTI_BUS", "memory")
+# Max missed events replayed to a reconnecting client
+NOTI_REPLAY_LIMIT = int(os.getenv("NOTI_REPLAY_LIMIT", "1000"))
+# Seconds broadcasts are gathered into one batched frame, 0 sends every event on its own
+NOTI_COALESCE_WINDOW = float(os.getenv("NOTI_COALESCE_WINDOW", "0"))
+# A batch is sent as soon as it holds this many events, even before the window ends
+NOTI_COALESCE_MAX_BATCH = int(os.getenv("NOTI_COALESCE_MAX_BATCH", "100"))
+# Seconds between two heartbeats, 0 disables them. json clients get a ping frame they answer
+# from the page, every client gets WebSocket protocol pings from the server (see app/__main__.py),
+# SSE streams get a comment that keeps idle proxies from closing them
+NOTI_PING_INTERVAL = float(os.getenv("NOTI_PING_INTERVAL", "20"))
+# Unanswered pings after which the connection is considered dead and evicted
+NOTI_MAX_MISSED_PONGS = int(os.getenv("NOTI_MAX_MISSED_PONGS", "2"))
+
+OVERFLOW_POLICIES = ("disconnect", "drop_message")
+# "text" sends the bare message, "json" sends the whole event as a JSON object
+FRAME_FORMATS = ("text", "json")
+
+FANOUT_SECONDS = registry.histogram("noti_fanout_seconds", "Time to queue one frame for all its recipients")
+FANOUT_RECIPIENTS = registry.histogram(
+    "noti_fanout_recipients", "Recipients per fanned out frame", buckets=(1, 10, 100, 1000, 10000, 100000))
+SEND_FAILURES = registry.counter("noti_send_failures_total", "Notifications not delivered to a client", ("reason",))
+
+
+class Frame:
+    """One notification, serialized at most once per wire format and shared by all recipients.
+
+    The cached value is the ASGI send message itself, so fan-out to N sockets
+    builds one payload (and one UTF-8 encoding for binary frames) instead of N.
+    """
+
+    __slots__ = ("event", "_messages")
+
+    def __init__(self, event: dict):
+        self.event = event
+        self._messages: dict[tuple[str, bool], dict | bytes] = {}
+
+    def payload(self, format: str) -> str:
+        if format == "json":
+            return json.dumps(self.event, separators=(",", ":"))
+        if "events" in self.event:
+            # coalesced batch, one line per event
+            return "\n".join(event["message"] for event in self.event["events"])
+        return self.event["message"]
+
+    def sse_message(self, format: str = "text") -> bytes:
+        """The frame as an encoded Server-Sent Events message."""
+        message = self._messages.get((format, "sse"))
+        if message is None:
+            lines = []
+            event_id = self.event.get("id")
+            if event_id is None and "events" in self.event:
+                event_id = self.event["events"][-1].get("id")
+            if event_id is not None:
+                lines.append(f"id: {event_id}")
+            lines.extend(f"data: {line}" for line in self.payload(format).split("\n"))
+            message = ("\n".join(lines) + "\n\n").encode()
+            self._messages[(format, "sse")] = message
+        return message
+
+    def asgi_message(self, format: str = "text", binary: bool = False) -> dict:
+        message = self._messages.get((format, binary))
+        if message is None:
+            payload = self.payload(format)
+            if binary:
+                message = {"type": "websocket.send", "bytes": payload.encode()}
+            else:
+                message = {"type": "websocket.send", "text": payload}
+            self._messages[(format, binary)] = message
+        return message
+
+
+class Subscription:
+    """A connected client with its own bounded outbound queue drained by a writer task,
+    so a stalled socket never blocks the senders or the other clients."""
+
+    # unanswered pings mean a dead peer
+    answers_pings = True
+
+    def __init__(
+            self,
+            email: str,
+            websocket: WebSocket,
+            queue_size: int,
+            send_timeout: float,
+            on_failure,
+            format: str = "text",
+            binary: bool = False,
+    ):
+        if format not in FRAME_FORMATS:
+            raise ValueError(f"Unknown frame format: {format}")
+        self.email = email
+        self.websocket = websocket
+        self.format = format
+        self.binary = binary
+        self.queue: asyncio.Queue[Frame] = asyncio.Queue(maxsize=queue_size)
+        self.send_timeout = send_timeout
+        self.topics: set[str] = set()
+        # missed events to send before anything from the queue, filled on reconnect
+        self.backlog: list[Frame] = []
+        self.missed_pongs = 0
+        self.ping_timer: Timer | None = None
+        self._on_failure = on_failure
+        self._writer: asyncio.Task | None = None
+
+    def wants_pings(self) -> bool:
+        # only json clients can tell a ping frame from a notification, text clients rely on protocol pings
+        return self.format == "json"
+
+    def start(self) -> None:
+        self._writer = asyncio.create_task(self._run())
+
+    def offer(self, frame: Frame) -> bool:
+        """Enqueue without waiting, returns False when the queue is full."""
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def _send(self, frame: Frame) -> None:
+        # the shared ASGI message skips per-recipient serialization
+        message = frame.asgi_message(self.format, self.binary)
+        # asyncio.timeout doesn't spawn a task per send like wait_for does
+        async with asyncio.timeout(self.send_timeout):
+            await self.websocket.send(message)
+
+    async def _run(self) -> None:
+        try:
+            backlog, self.backlog = self.backlog, []
+            for frame in backlog:
+                await self._send(frame)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Failed to replay messages to %s, disconnecting", self.email)
+            SEND_FAILURES.labels("error").inc()
+            self._on_failure(self)
+            return
+
+        while True:
+            frame = await self.queue.get()
+            try:
+                await self._send(frame)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Failed to send message to %s, disconnecting", self.email)
+                SEND_FAILURES.labels("error").inc()
+                self.queue.task_done()
+                self._on_failure(self)
+                return
+            self.queue.task_done()
+
+    async def join(self) -> None:
+        """Wait until every queued message has been handed to the socket or the writer stopped."""
+        if self._writer is None or self._writer.done():
+            return
+        joined = asyncio.ensure_future(self.queue.join())
+        await asyncio.wait({joined, self._writer}, return_when=asyncio.FIRST_COMPLETED)
+        joined.cancel()
+
+    def stop(self) -> None:
+        if self._writer is not None and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+
+    async def close_transport(self) -> None:
+        try:
+            if self.websocket.client_state == WebSocketState.CONNECTED:
+                await asyncio.wait_for(self.websocket.close(), self.send_timeout)
+        except Exception:
+            logger.debug("Closing evicted websocket failed", exc_info=True)
+
+
+class SseSubscription(Subscription):
+    """A Server-Sent Events client. There is no writer task, the streaming
+    response iterates `stream()` which reads the same bounded queue."""
+
+    # EventSource can't answer, pings are sent as `: ping` comments so idle proxies keep the
+    # stream open; a dead peer fails the write and the HTTP server ends the response
+    answers_pings = False
+
+    def __init__(self, email: str, queue_size: int, on_failure, format: str = "text"):
+        super().__init__(email, None, queue_size, 0, on_failure, format=format)
+        self._closed = False
+
+    def wants_pings(self) -> bool:
+        return True
+
+    def start(self) -> None:
+        pass
+
+    async def stream(self):
+        backlog, self.backlog = self.backlog, []
+        for frame in backlog:
+            yield frame.sse_message(self.format)
+        while not self._closed:
+            frame = await self.queue.get()
+            self.queue.task_done()
+            if frame is None:
+                return
+            yield SSE_PING if frame is PING_FRAME else frame.sse_message(self.format)
+
+    def stop(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        # wake the stream with the end marker, make room for it if the queue is full
+        while True:
+            try:
+                self.queue.put_nowait(None)
+                return
+            except asyncio.QueueFull:
+                self.queue.get_nowait()
+                self.queue.task_done()
+
+    async def close_transport(self) -> None:
+        self.stop()
+
+
+# shared by every heartbeat, serialized once
+PING_FRAME = Frame({"type": "ping"})
+# an SSE comment, ignored by EventSource
+SSE_PING = b": ping\n\n"
+
+
 # implement realtime notification based on WebSocket
 class NotificationManager:
-    def __init__(self):
-        self.active_connections: dict[str, WebSocket] = {}
+    """Registry of live subscriptions indexed by user and by topic.
+
+    A user may hold several sockets (one per tab), subscribe/unsubscribe are O(1)
+    per connection and targeted sends only touch the recipients' subscriptions.
+    """
+
+    def __init__(
+            self,
+            queue_size: int = NOTI_QUEUE_SIZE,
+            send_timeout: float = NOTI_SEND_TIMEOUT,
+            overflow_policy: str = NOTI_OVERFLOW_POLICY,
+            bus: NotificationBus | None = None,
+            log: NotificationLog | None = None,
+            replay_limit: int = NOTI_REPLAY_LIMIT,
+            coalesce_window: float = NOTI_COALESCE_WINDOW,
+            coalesce_max_batch: int = NOTI_COALESCE_MAX_BATCH,
+            ping_interval: float = NOTI_PING_INTERVAL,
+            max_missed_pongs: int = NOTI_MAX_MISSED_PONGS,
+    ):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.overflow_policy = overflow_policy
+        self.connections: set[Subscription] = set()
+        # email -> subscriptions of that user
+        self.active_connections: dict[str, set[Subscription]] = {}
+        # topic -> subscriptions listening to it
+        self.topics: dict[str, set[Subscription]] = {}
+        self._closing: set[asyncio.Task] = set()
+        self.bus = bus or create_notification_bus("memory")
+        self.bus.bind(self._deliver)
+        self.log = log if log is not None else NotificationLog()
+        self.replay_limit = replay_limit
+        self.coalesce_window = coalesce_window
+        self.coalesce_max_batch = coalesce_max_batch
+        self._coalesced: list[dict] = []
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self.ping_interval = ping_interval
+        self.max_missed_pongs = max_missed_pongs
+        # a single wheel drives the heartbeats of all connections, tick is a fraction of the interval
+        self.wheel = TimerWheel(tick=max(ping_interval / 20, 0.05))
+        self.pings_sent = 0
+        self.pongs_received = 0
+        self.heartbeat_evictions = 0
+
+    async def start(self):
+        """Load the replay ring, start receiving events published by the other workers and the heartbeat timer."""
+        try:
+            await self.log.load()
+        except Exception:
+            # live delivery doesn't need the database, replays read it on demand
+            logger.exception("Failed to load recent notifications into the replay log")
+        await self.bus.start()
+        if self.ping_interval > 0:
+            self.wheel.start()
 
-    async def subscribe(self, email: str, websocket: WebSocket):
-        self.active_connections[email] = websocket
-        logger.info(f"{email} subscribed")
-        logger.info("current notification list:%s", self.active_connections.keys())
+    async def subscribe(
+            self,
+            email: str,
+            websocket: WebSocket,
+            topics: Iterable[str] = (),
+            format: str = "text",
+            binary: bool = False,
+            last_id: int | None = None,
+    ) -> Subscription:
+        """Register a socket, with `last_id` the events published after that id are sent first."""
+        subscription = Subscription(
+            email, websocket, self.queue_size, self.send_timeout, self._evict, format=format, binary=binary
+        )
+        return await self._register(subscription, topics, last_id)
+
+    async def subscribe_sse(
+            self,
+            email: str,
+            topics: Iterable[str] = (),
+            format: str = "text",
+            last_id: int | None = None,
+    ) -> SseSubscription:
+        """Register a Server-Sent Events client, its response streams `subscription.stream()`."""
+        subscription = SseSubscription(email, self.queue_size, self._evict, format=format)
+        return await self._register(subscription, topics, last_id)
+
+    async def _register(self, subscription: Subscription, topics: Iterable[str], last_id: int | None):
+        if last_id is not None:
+            await self._load_backlog(subscription, last_id)
+        # no await between the ring buffer read in _load_backlog and the registration below,
+        # so every event is either replayed or delivered live, never both or neither
+        subscription.start()
+        if self.ping_interval > 0 and subscription.wants_pings():
+            self._schedule_ping(subscription)
+        email = subscription.email
+        self.connections.add(subscription)
+        self.active_connections.setdefault(email, set()).add(subscription)
+        for topic in topics:
+            self.subscribe_topic(subscription, topic)
+        # counts only, dumping every subscribed email is O(n) per call
+        logger.info("%s subscribed, %d users / %d connections",
+                    email, len(self.active_connections), len(self.connections))
+        return subscription
+
+    async def _load_backlog(self, subscription: Subscription, last_id: int):
+        newest = self.log.newest_id()
+        if newest is not None and last_id >= newest:
+            # the client is up to date, the common case of a mass reconnect
+            return
+        events = []
+        cursor = last_id
+        # read what is older than the ring buffer from the database, the ring may move while awaiting
+        try:
+            while True:
+                oldest = self.log.oldest_id()
+                if oldest is not None and oldest <= cursor + 1:
+                    break
+                rows = await self.log.read_range(cursor, oldest, self.replay_limit)
+                events.extend(rows)
+                if rows:
+                    cursor = rows[-1]["id"]
+                if self.log.oldest_id() == oldest:
+                    break
+        except Exception:
+            # closing the socket would only bring the client back with the same last_id
+            logger.exception("Failed to read missed notifications of %s, delivering live ones only",
+                             subscription.email)
+            return
+        events.extend(self.log.since(cursor))
+        subscription.backlog = [Frame(event) for event in events[-self.replay_limit:]]
+
+    def subscribe_topic(self, subscription: Subscription, topic: str):
+        subscription.topics.add(topic)
+        self.topics.setdefault(topic, set()).add(subscription)
+
+    def unsubscribe_topic(self, subscription: Subscription, topic: str):
+        subscription.topics.discard(topic)
+        _discard_from_index(self.topics, topic, subscription)
+
+    def unsubscribe_connection(self, subscription: Subscription):
+        """Remove a single connection, the user's other sockets stay subscribed."""
+        if subscription not in self.connections:
+            return
+        self.connections.discard(subscription)
+        if subscription.ping_timer is not None:
+            self.wheel.cancel(subscription.ping_timer)
+            subscription.ping_timer = None
+        _discard_from_index(self.active_connections, subscription.email, subscription)
+        for topic in subscription.topics:
+            _discard_from_index(self.topics, topic, subscription)
+        subscription.stop()
 
     def unsubscribe(self, email: str):
-        self.active_connections.pop(email, None)
-        logger.info(f"{email} unsubscribed")
-        logger.info("current notification list:%s", self.active_connections.keys())
+        """Remove every connection of the user, e.g. on logout."""
+        for subscription in list(self.active_connections.get(email, ())):
+            self.unsubscribe_connection(subscription)
+        logger.info("%s unsubscribed, %d users / %d connections",
+                    email, len(self.active_connections), len(self.connections))
 
-    async def broadcast(self, message: str):
-        for email, websocket in list(self.active_connections.items()):
-            try:
-                await websocket.send_text(message)
-            except Exception:
-                logger.exception("Failed to send message to %s, disconnecting", email)
-                self.unsubscribe(email)
+    def _schedule_ping(self, subscription: Subscription):
+        subscription.ping_timer = self.wheel.schedule(self.ping_interval, lambda: self._ping(subscription))
+
+    def _ping(self, subscription: Subscription):
+        subscription.ping_timer = None
+        if subscription not in self.connections:
+            return
+        if subscription.answers_pings:
+            if subscription.missed_pongs >= self.max_missed_pongs:
+                logger.info("%s missed %s pongs, evicting", subscription.email, subscription.missed_pongs)
+                self.heartbeat_evictions += 1
+                self._evict(subscription)
+                return
+            subscription.missed_pongs += 1
+        if subscription.offer(PING_FRAME):
+            self.pings_sent += 1
+        self._schedule_ping(subscription)
+
+    def mark_alive(self, subscription: Subscription):
+        """Record a message (pong or anything else) received from the client."""
+        subscription.missed_pongs = 0
+        self.pongs_received += 1
+
+    def _evict(self, subscription: Subscription):
+        self.unsubscribe_connection(subscription)
+        task = asyncio.create_task(subscription.close_transport())
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def broadcast(self, message: str, id: int | None = None):
+        """Publish the message to the subscribers of every worker without waiting for the sends.
+        Events with the `id` of their Notification row are kept for replay."""
+        event = {"message": message} if id is None else {"id": id, "message": message}
+        self.bus.publish(event)
+
+    async def send_to_user(self, email: str, message: str):
+        """Publish the message to every socket of one user."""
+        self.bus.publish({"message": message, "user": email})
+
+    async def publish(self, topic: str, message: str):
+        """Publish the message to the sockets subscribed to the topic."""
+        self.bus.publish({"message": message, "topic": topic})
+
+    def _deliver(self, events: list[dict]):
+        for event in events:
+            if "id" in event:
+                self.log.append(event)
+            if "user" in event:
+                recipients = self.active_connections.get(event["user"], ())
+            elif "topic" in event:
+                recipients = self.topics.get(event["topic"], ())
+            elif self.coalesce_window > 0:
+                self._coalesce(event)
+                continue
+            else:
+                recipients = self.connections
+            self._fanout(recipients, Frame(event))
+
+    def _coalesce(self, event: dict):
+        # during a burst every socket gets one frame per window instead of one per event
+        self._coalesced.append(event)
+        if len(self._coalesced) >= self.coalesce_max_batch:
+            self._flush_coalesced()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.coalesce_window, self._flush_coalesced)
+
+    def _flush_coalesced(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        events, self._coalesced = self._coalesced, []
+        if not events:
+            return
+        # a lone event keeps the regular per-event format
+        frame = Frame(events[0]) if len(events) == 1 else Frame({"events": events})
+        self._fanout(self.connections, frame)
+
+    def _fanout(self, recipients: Iterable[Subscription], frame: Frame):
+        with FANOUT_SECONDS.time():
+            recipients = list(recipients)
+            for subscription in recipients:
+                if subscription.offer(frame):
+                    continue
+                SEND_FAILURES.labels("queue_full").inc()
+                if self.overflow_policy == "disconnect":
+                    logger.warning("Send queue of %s is full, disconnecting", subscription.email)
+                    self._evict(subscription)
+                else:
+                    logger.warning("Send queue of %s is full, dropping message", subscription.email)
+        FANOUT_RECIPIENTS.observe(len(recipients))
+
+    async def drain(self):
+        """Wait until all queued messages have been sent, mainly for tests and shutdown."""
+        self._flush_coalesced()
+        await asyncio.gather(*(s.join() for s in list(self.connections)))
+
+    async def close(self):
+        """Stop every writer task and close the sockets, called on shutdown."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        subscriptions = list(self.connections)
+        for subscription in subscriptions:
+            self.unsubscribe_connection(subscription)
+        await asyncio.gather(*(s.close_transport() for s in subscriptions), *self._closing)
+        await self.wheel.stop()
+        await self.bus.stop()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "connections": len(self.connections),
+            "users": len(self.active_connections),
+            "topics": len(self.topics),
+            "pings_sent": self.pings_sent,
+            "pongs_received": self.pongs_received,
+            "heartbeat_evictions": self.heartbeat_evictions,
+        }
+
+
+def _discard_from_index(index: dict[str, set[Subscription]], key: str, subscription: Subscription):
+    members = index.get(key)
+    if members is None:
+        return
+    members.discard(subscription)
+    if not members:
+        del index[key]
+
+
+noti_manager = NotificationManager(bus=create_notification_bus(NOTI_BUS))
 
-        logger.info("Finished sending notification. email list:%s", self.active_connections.keys())
 
-noti_manager = NotificationManager()
+registry.callback("gauge", "noti_connections", "Open notification connections", lambda: {(): len(noti_manager.connections)})
+registry.callback("gauge", "noti_users", "Users with at least one open connection",
+                  lambda: {(): len(noti_manager.active_connections)})
+registry.callback("counter", "noti_heartbeat_evictions_total", "Connections evicted after missed pongs",
+                  lambda: {(): noti_manager.heartbeat_evictions})
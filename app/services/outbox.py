@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import Engine, delete, update
+from sqlmodel import Session, select
+
+from app import database
+from app.models.notification import Notification
+from app.services.noti_service import NotificationManager, noti_manager
+
+logger = logging.getLogger(__name__)
+
+# Max outbox rows handed to the NotificationManager per round
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+# Seconds between polls when nobody wakes the dispatcher (events committed by other workers, crash recovery)
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1"))
+# Seconds dispatched rows are kept, also how far back reconnecting clients can be replayed
+OUTBOX_RETENTION = float(os.getenv("OUTBOX_RETENTION", "3600"))
+# Seconds between two deletions of expired rows
+OUTBOX_PURGE_INTERVAL = 60
+
+
+class OutboxDispatcher:
+    """Drains undispatched Notification rows in batches and publishes them.
+
+    Rows are marked dispatched only after publishing, so delivery is at-least-once:
+    a crash between the two steps re-publishes the batch on the next round.
+    """
+
+    def __init__(
+            self,
+            manager: NotificationManager,
+            engine: Engine | None = None,
+            batch_size: int = OUTBOX_BATCH_SIZE,
+            poll_interval: float = OUTBOX_POLL_INTERVAL,
+            retention: float = OUTBOX_RETENTION,
+    ):
+        self.manager = manager
+        self._engine = engine
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._last_purge = 0.0
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def engine(self) -> Engine:
+        return self._engine or database.engine
+
+    def _claim_batch(self) -> tuple[Session, list[Notification]]:
+        session = Session(self.engine)
+        try:
+            # SKIP LOCKED lets several workers drain the outbox without handing out the same rows
+            statement = (
+                select(Notification)
+                .where(Notification.dispatched_at.is_(None))
+                .order_by(Notification.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            return session, list(session.exec(statement).all())
+        except Exception:
+            session.close()
+            raise
+
+    def _mark_dispatched(self, session: Session, ids: list[int]) -> None:
+        try:
+            session.exec(
+                update(Notification)
+                .where(Notification.id.in_(ids))
+                .values(dispatched_at=datetime.now(timezone.utc))
+            )
+            session.commit()
+        finally:
+            session.close()
+
+    async def dispatch_once(self) -> int:
+        """Publish one batch, returns the number of events handed over."""
+        session, rows = await asyncio.to_thread(self._claim_batch)
+        try:
+            for row in rows:
+                await self.manager.broadcast(row.message, id=row.id)
+        except BaseException:
+            session.close()
+            raise
+        if not rows:
+            session.close()
+            return 0
+        await asyncio.to_thread(self._mark_dispatched, session, [row.id for row in rows])
+        return len(rows)
+
+    def _purge(self) -> int:
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.retention)
+        deleted = 0
+        with Session(self.engine) as session:
+            # in batches so the table isn't locked for the whole backlog at once
+            while True:
+                ids = session.exec(
+                    select(Notification.id).where(Notification.dispatched_at < cutoff).limit(self.batch_size)
+                ).all()
+                if not ids:
+                    return deleted
+                session.exec(delete(Notification).where(Notification.id.in_(ids)))
+                session.commit()
+                deleted += len(ids)
+
+    async def purge_dispatched(self) -> int:
+        """Delete rows dispatched longer than `retention` ago, returns how many."""
+        self._last_purge = time.monotonic()
+        return await asyncio.to_thread(self._purge)
+
+    def wake(self) -> None:
+        """Ask for an immediate round, called after committing new events."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                dispatched = await self.dispatch_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Outbox dispatch failed, retrying")
+                dispatched = 0
+            if time.monotonic() - self._last_purge >= OUTBOX_PURGE_INTERVAL:
+                try:
+                    await self.purge_dispatched()
+                except Exception:
+                    logger.exception("Outbox purge failed")
+            # keep going without waiting while there is a backlog
+            if dispatched < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._wakeup = None
+
+
+outbox_dispatcher = OutboxDispatcher(noti_manager)
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+
+from app.utils.local_sqlite import LocalSqlite, sqlite_url_path
+from app.utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Sliding window of the limits below, in seconds
+RATE_LIMIT_WINDOW = float(os.getenv("RATE_LIMIT_WINDOW", "60"))
+# Attempts per window on /login and /register from one client IP, 0 disables the limit
+RATE_LIMIT_PER_IP = int(os.getenv("RATE_LIMIT_PER_IP", "60"))
+# Failed attempts per window on /login and /register for one email, 0 disables the limit
+RATE_LIMIT_PER_EMAIL = int(os.getenv("RATE_LIMIT_PER_EMAIL", "10"))
+
+RATE_LIMITED = registry.counter("rate_limited_total", "Requests rejected by the rate limiter", ("action", "key"))
+
+
+class RateLimitStore(ABC):
+    """Sliding-window counters: `hit` records an attempt if `key` is below `limit` in the
+    last `window` seconds and returns 0, otherwise it returns the seconds until it would be.
+    With `record=False` it only checks."""
+
+    @abstractmethod
+    async def hit(self, key: str, limit: int, window: float, record: bool = True) -> float:
+        ...
+
+    @abstractmethod
+    def clear(self) -> None:
+        ...
+
+
+class InMemoryRateLimitStore(RateLimitStore):
+    """Per-process store keeping the attempt times of each key, at most `limit` per key.
+
+    Keys are evicted least recently used first beyond `maxsize`, so a flood of distinct
+    IPs or emails can't grow it without bound.
+    """
+
+    def __init__(self, maxsize: int = 100_000, timer=time.monotonic):
+        self.maxsize = maxsize
+        self._timer = timer
+        self._lock = threading.Lock()
+        self._hits: OrderedDict[str, deque[float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._hits)
+
+    async def hit(self, key: str, limit: int, window: float, record: bool = True) -> float:
+        now = self._timer()
+        with self._lock:
+            hits = self._hits.get(key)
+            if hits is None:
+                if not record:
+                    return 0.0
+                hits = self._hits[key] = deque()
+                if len(self._hits) > self.maxsize:
+                    self._hits.popitem(last=False)
+            else:
+                self._hits.move_to_end(key)
+            while hits and hits[0] <= now - window:
+                hits.popleft()
+            if len(hits) >= limit:
+                return hits[0] + window - now
+            if record:
+                hits.append(now)
+            return 0.0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._hits.clear()
+
+
+class SqliteRateLimitStore(RateLimitStore):
+    """Store backed by a local SQLite file, shared by all workers on the same host.
+
+    Each hit is one write transaction, so the count and the insert are atomic across workers.
+    It runs in a thread: waiting for another worker's lock must not stall the event loop.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = LocalSqlite(path)
+        self._last_purge = 0.0
+        conn = self._db.connect()
+        conn.execute("CREATE TABLE IF NOT EXISTS rate_limit_hit (key TEXT NOT NULL, at REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_rate_limit_hit_key_at ON rate_limit_hit (key, at)")
+
+    async def hit(self, key: str, limit: int, window: float, record: bool = True) -> float:
+        return await asyncio.to_thread(self._hit, key, limit, window, record)
+
+    def _hit(self, key: str, limit: int, window: float, record: bool) -> float:
+        # wall clock, the timestamps are compared across processes
+        now = time.time()
+        conn = self._db.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if now - self._last_purge >= window:
+                # keys that are never hit again would otherwise keep their rows forever
+                conn.execute("DELETE FROM rate_limit_hit WHERE at <= ?", (now - window,))
+                self._last_purge = now
+            else:
+                conn.execute("DELETE FROM rate_limit_hit WHERE key = ? AND at <= ?", (key, now - window))
+            count, oldest = conn.execute(
+                "SELECT COUNT(*), MIN(at) FROM rate_limit_hit WHERE key = ?", (key,)
+            ).fetchone()
+            if count >= limit:
+                return oldest + window - now
+            if record:
+                conn.execute("INSERT INTO rate_limit_hit (key, at) VALUES (?, ?)", (key, now))
+            return 0.0
+        finally:
+            conn.execute("COMMIT")
+
+    def clear(self) -> None:
+        self._db.connect().execute("DELETE FROM rate_limit_hit")
+
+
+def create_rate_limit_store(url: str) -> RateLimitStore:
+    """`memory` counts per worker, a `sqlite:///` file counts the attempts of all workers of a host together."""
+    if url == "memory":
+        return InMemoryRateLimitStore(maxsize=int(os.getenv("RATE_LIMIT_MAXSIZE", "100000")))
+    path = sqlite_url_path(url)
+    if path is not None:
+        return SqliteRateLimitStore(path)
+    raise ValueError(f"Unsupported rate limit store: {url}")
+
+
+class RateLimiter:
+    """Per client IP and per email limits of one action (login, register).
+
+    Every attempt counts toward the IP limit, only failed ones toward the email limit:
+    otherwise anyone could lock a user out by sending attempts for their email.
+    """
+
+    def __init__(self, store: RateLimitStore, per_ip: int = RATE_LIMIT_PER_IP,
+                 per_email: int = RATE_LIMIT_PER_EMAIL, window: float = RATE_LIMIT_WINDOW):
+        self.store = store
+        self.per_ip = per_ip
+        self.per_email = per_email
+        self.window = window
+
+    @staticmethod
+    def _email_key(action: str, email: str) -> str:
+        return f"{action}:email:{email.strip().lower()}"
+
+    async def check(self, action: str, ip: str | None, email: str) -> float:
+        """Record the attempt, returns 0 when allowed or the seconds to wait before retrying."""
+        if self.per_ip > 0 and ip is not None:
+            retry_after = await self.store.hit(f"{action}:ip:{ip}", self.per_ip, self.window)
+            if retry_after:
+                RATE_LIMITED.labels(action, "ip").inc()
+                return retry_after
+        if self.per_email > 0:
+            retry_after = await self.store.hit(self._email_key(action, email), self.per_email, self.window,
+                                               record=False)
+            if retry_after:
+                RATE_LIMITED.labels(action, "email").inc()
+                logger.info("Rate limited %s attempts for email: %s", action, email)
+                return retry_after
+        return 0.0
+
+    async def record_failure(self, action: str, email: str) -> None:
+        if self.per_email > 0:
+            await self.store.hit(self._email_key(action, email), self.per_email, self.window)
+
+
+rate_limiter = RateLimiter(create_rate_limit_store(os.getenv("RATE_LIMIT_STORE", "memory")))
@@ -0,0 +1,153 @@
+import asyncio
+import heapq
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from app.utils.local_sqlite import LocalSqlite, sqlite_url_path
+
+logger = logging.getLogger(__name__)
+
+
+class RevocationStore(ABC):
+    """Per user cutoffs: the tokens of `subject` issued at or before `issued_at` are revoked.
+
+    One entry per user, so the store is bounded by the user count however often they log in
+    and out. Each entry is kept until `expires_at`, when the tokens it revokes have expired anyway.
+    """
+
+    @abstractmethod
+    async def revoke(self, subject: str, issued_at: float, expires_at: float) -> None:
+        ...
+
+    @abstractmethod
+    async def is_revoked(self, subject: str, issued_at: float) -> bool:
+        ...
+
+    @abstractmethod
+    def clear(self) -> None:
+        ...
+
+
+class InMemoryRevocationStore(RevocationStore):
+    """Per-process store with O(1) lookups.
+
+    A min-heap ordered by expiry lets expired entries be purged without a full scan.
+    Live entries are never dropped, that would make logged-out tokens valid again:
+    beyond `maxsize` users the store keeps growing and logs an error, switch to the SQLite store then.
+    """
+
+    def __init__(self, maxsize: int = 100_000, timer=time.time):
+        self.maxsize = maxsize
+        self._timer = timer
+        self._lock = threading.Lock()
+        # subject -> (tokens issued at or before this are revoked, when the entry can go)
+        self._cutoffs: dict[str, tuple[float, float]] = {}
+        self._heap: list[tuple[float, str]] = []
+        self._over_maxsize = False
+
+    def __len__(self) -> int:
+        return len(self._cutoffs)
+
+    def _purge(self, now: float) -> None:
+        # caller must hold the lock
+        while self._heap and self._heap[0][0] <= now:
+            _, subject = heapq.heappop(self._heap)
+            entry = self._cutoffs.get(subject)
+            if entry is None:
+                continue
+            if entry[1] <= now:
+                del self._cutoffs[subject]
+            else:
+                # extended by a later logout, one heap item per user is moved instead of one per logout
+                heapq.heappush(self._heap, (entry[1], subject))
+
+    async def revoke(self, subject: str, issued_at: float, expires_at: float) -> None:
+        now = self._timer()
+        if expires_at <= now:
+            return
+        with self._lock:
+            self._purge(now)
+            entry = self._cutoffs.get(subject)
+            if entry is not None:
+                issued_at, expires_at = max(issued_at, entry[0]), max(expires_at, entry[1])
+            over_maxsize = len(self._cutoffs) + (entry is None) > self.maxsize
+            if over_maxsize and not self._over_maxsize:
+                # once per crossing, not on every revocation while above it
+                logger.error("Revocation store holds %d users, above its maxsize of %d, "
+                             "use TOKEN_REVOCATION_STORE=sqlite:///...", len(self._cutoffs), self.maxsize)
+            self._over_maxsize = over_maxsize
+            self._cutoffs[subject] = (issued_at, expires_at)
+            if entry is None:
+                heapq.heappush(self._heap, (expires_at, subject))
+
+    async def is_revoked(self, subject: str, issued_at: float) -> bool:
+        entry = self._cutoffs.get(subject)
+        return entry is not None and issued_at <= entry[0] and entry[1] > self._timer()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cutoffs.clear()
+            self._heap.clear()
+
+
+class SqliteRevocationStore(RevocationStore):
+    """Store backed by a local SQLite file, shared by all workers on the same host.
+
+    Lookups are primary-key reads on a local file, expired rows are deleted on write.
+    They run in a thread: waiting for another worker's lock must not stall the event loop.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = LocalSqlite(path)
+        with self._db.connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS revoked_subject "
+                "(subject TEXT PRIMARY KEY, issued_before REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_revoked_subject_expires_at ON revoked_subject (expires_at)")
+
+    async def revoke(self, subject: str, issued_at: float, expires_at: float) -> None:
+        await asyncio.to_thread(self._revoke, subject, issued_at, expires_at)
+
+    def _revoke(self, subject: str, issued_at: float, expires_at: float) -> None:
+        now = time.time()
+        if expires_at <= now:
+            return
+        conn = self._db.connect()
+        conn.execute("DELETE FROM revoked_subject WHERE expires_at <= ?", (now,))
+        conn.execute(
+            "INSERT INTO revoked_subject (subject, issued_before, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (subject) DO UPDATE SET issued_before = max(issued_before, excluded.issued_before), "
+            "expires_at = max(expires_at, excluded.expires_at)",
+            (subject, issued_at, expires_at),
+        )
+
+    async def is_revoked(self, subject: str, issued_at: float) -> bool:
+        return await asyncio.to_thread(self._is_revoked, subject, issued_at)
+
+    def _is_revoked(self, subject: str, issued_at: float) -> bool:
+        row = self._db.connect().execute(
+            "SELECT 1 FROM revoked_subject WHERE subject = ? AND issued_before >= ? AND expires_at > ?",
+            (subject, issued_at, time.time()),
+        ).fetchone()
+        return row is not None
+
+    def clear(self) -> None:
+        self._db.connect().execute("DELETE FROM revoked_subject")
+
+
+def create_revocation_store(url: str) -> RevocationStore:
+    """`memory` keeps logouts in this worker, a `sqlite:///` file makes them apply on every worker of a host."""
+    if url == "memory":
+        return InMemoryRevocationStore(maxsize=int(os.getenv("TOKEN_REVOCATION_MAXSIZE", "100000")))
+    path = sqlite_url_path(url)
+    if path is not None:
+        return SqliteRevocationStore(path)
+    raise ValueError(f"Unsupported token revocation store: {url}")
+
+
+revocation_store = create_revocation_store(os.getenv("TOKEN_REVOCATION_STORE", "memory"))
@@ -0,0 +1,176 @@
+import codecs
+import csv
+import json
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import AsyncIterable, AsyncIterator, Literal
+
+from pydantic import EmailStr, TypeAdapter, ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app import database
+from app.models.notification import Notification
+from app.models.user import User
+from app.utils.security import hash_passwords_async
+
+logger = logging.getLogger(__name__)
+
+# Rows per multi-row INSERT, also the unit of hashing and of the duplicate lookup
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+# Duplicate emails and line errors listed in the report, the counts are always complete
+REPORT_LIMIT = 100
+
+ImportFormat = Literal["csv", "jsonl"]
+
+_email_adapter = TypeAdapter(EmailStr)
+# what passlib's bcrypt handler produces, anything else would never verify
+_BCRYPT_HASH = re.compile(r"^\$2[aby]\$\d{2}\$[./A-Za-z0-9]{53}$")
+
+
+@dataclass
+class ImportReport:
+    total: int = 0
+    imported: int = 0
+    duplicates: int = 0
+    invalid: int = 0
+    duplicate_emails: list[str] = field(default_factory=list)
+    errors: list[str] = field(default_factory=list)
+
+    def add_duplicate(self, email: str | None) -> None:
+        self.duplicates += 1
+        if email is not None and len(self.duplicate_emails) < REPORT_LIMIT:
+            self.duplicate_emails.append(email)
+
+    def add_error(self, line: int, reason: str) -> None:
+        self.invalid += 1
+        if len(self.errors) < REPORT_LIMIT:
+            self.errors.append(f"line {line}: {reason}")
+
+
+@dataclass(frozen=True, slots=True)
+class _Entry:
+    email: str
+    password: str | None
+    hashed_password: str | None
+
+
+async def _lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    # decoded incrementally, a multi-byte character may be split between two chunks
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *complete, pending = pending.split("\n")
+        for line in complete:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+def _entry(email, password, hashed_password) -> _Entry:
+    if not isinstance(email, str):
+        raise ValueError("missing email")
+    try:
+        email = _email_adapter.validate_python(email.strip())
+    except ValidationError:
+        raise ValueError("invalid email")
+    if hashed_password:
+        if not isinstance(hashed_password, str) or not _BCRYPT_HASH.match(hashed_password):
+            raise ValueError("hashed_password is not a bcrypt hash")
+        return _Entry(email, None, hashed_password)
+    if not isinstance(password, str) or not password:
+        raise ValueError("missing password")
+    return _Entry(email, password, None)
+
+
+async def _entries(lines: AsyncIterator[str], fmt: ImportFormat, report: ImportReport) -> AsyncIterator[_Entry]:
+    """Parse the file one line at a time, invalid lines are counted in the report and skipped."""
+    columns = None
+    number = 0
+    async for line in lines:
+        number += 1
+        if not line.strip():
+            continue
+        if fmt == "csv" and columns is None:
+            columns = [name.strip() for name in next(csv.reader([line]))]
+            if "email" not in columns or not {"password", "hashed_password"} & set(columns):
+                raise ValueError("CSV header needs an email column and a password or hashed_password column")
+            continue
+        report.total += 1
+        try:
+            if fmt == "csv":
+                record = dict(zip(columns, next(csv.reader([line]))))
+            else:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError("not a JSON object")
+            yield _entry(record.get("email"), record.get("password"), record.get("hashed_password"))
+        except (ValueError, csv.Error) as e:
+            report.add_error(number, str(e))
+
+
+async def _import_batch(engine: AsyncEngine, batch: list[_Entry], report: ImportReport) -> None:
+    unique = {}
+    for entry in batch:
+        if entry.email in unique:
+            report.add_duplicate(entry.email)
+        else:
+            unique[entry.email] = entry
+
+    # earlier batches are committed already, so this also catches duplicates across the file
+    async with engine.connect() as conn:
+        existing = set((await conn.execute(select(User.email).where(User.email.in_(unique)))).scalars())
+    for email in existing:
+        report.add_duplicate(email)
+    fresh = [entry for email, entry in unique.items() if email not in existing]
+    if not fresh:
+        return
+
+    # pre-hashed values skip bcrypt entirely, the rest is hashed across all pool workers
+    hashed = iter(await hash_passwords_async([entry.password for entry in fresh if entry.hashed_password is None]))
+    # Core inserts don't run the model's default_factory
+    now = datetime.now(timezone.utc)
+    rows = [
+        {"email": entry.email, "hashed_password": entry.hashed_password or next(hashed), "created_at": now}
+        for entry in fresh
+    ]
+    # one multi-row statement; rows registered concurrently since the lookup are skipped, not fatal
+    statement = insert(User).prefix_with("IGNORE", dialect="mysql").prefix_with("OR IGNORE", dialect="sqlite")
+    async with engine.begin() as conn:
+        result = await conn.execute(statement.values(rows))
+    report.imported += result.rowcount
+    for _ in range(len(rows) - result.rowcount):
+        report.add_duplicate(None)
+
+
+async def import_users(chunks: AsyncIterable[bytes], fmt: ImportFormat,
+                       batch_size: int = IMPORT_BATCH_SIZE) -> ImportReport:
+    """Import users from a CSV or JSON lines stream.
+
+    Each record has an email and either a plain `password` or a bcrypt `hashed_password`.
+    Duplicates and invalid records are reported instead of aborting the import, and a
+    single summary notification is written to the outbox at the end.
+    """
+    engine = database.replica_router.primary
+    report = ImportReport()
+    batch = []
+    async for entry in _entries(_lines(chunks), fmt, report):
+        batch.append(entry)
+        if len(batch) >= batch_size:
+            await _import_batch(engine, batch, report)
+            batch = []
+    if batch:
+        await _import_batch(engine, batch, report)
+
+    if report.imported:
+        async with engine.begin() as conn:
+            await conn.execute(insert(Notification).values(
+                message=f"{report.imported} users imported", created_at=datetime.now(timezone.utc)))
+    logger.info("Imported %d of %d users, %d duplicates, %d invalid",
+                report.imported, report.total, report.duplicates, report.invalid)
+    return report
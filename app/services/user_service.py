@@ -1,37 +1,121 @@
+import asyncio
 import logging
 from fastapi import Depends, HTTPException
-from sqlmodel import Session, select
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.database import get_session
-from app.models.user import UserCreate, User
-from app.utils.security import get_password_hash, verify_password
+from app import database
+from app.database import DB_SESSION_SECONDS, get_async_session
+from app.models.notification import Notification
+from app.models.user import UserCreate, User, UserRecord
+from app.utils.security import HashPoolBusy, hash_password_async, needs_rehash, verify_password_async
 
 
 logger = logging.getLogger(__name__)
 
+# Built once: SQLAlchemy keys its compiled-SQL cache on the statement shape, reusing the
+# same object also skips rebuilding it per call. Only the columns auth needs are fetched.
+_USER_BY_EMAIL = select(User.id, User.email, User.hashed_password).where(User.email == bindparam("email"))
+
+# rehashes started by logins, referenced until done so they aren't garbage collected mid-way
+_rehash_tasks: set[asyncio.Task] = set()
 
-def create_user(user_in: UserCreate, session: Session = Depends(get_session)) -> User:
-    """Register a new user with hashed password."""
-    existing_user = session.exec(select(User).where(User.email == user_in.email)).first()
-    if existing_user:
-        raise HTTPException(status_code=400, detail="Email already registered")
 
-    hashed_password = get_password_hash(user_in.password)
+async def create_user(user_in: UserCreate, session: AsyncSession = Depends(get_async_session)) -> User:
+    """Register a new user with hashed password."""
+    # hash before touching the session so no connection is held while bcrypt is running
+    hashed_password = await hash_password_async(user_in.password)
     user = User(email=user_in.email, hashed_password=hashed_password)
     session.add(user)
-    session.commit()
-    session.refresh(user)
+    # committed together with the user, the outbox dispatcher broadcasts it afterwards
+    session.add(Notification(message=f"New user registered: {user_in.email}"))
+    # the commit checks the connection out and releases it, so this is the time it is held
+    with DB_SESSION_SECONDS.labels("register").time():
+        try:
+            # single INSERT, the unique index on email rejects duplicates atomically
+            await session.commit()
+        except IntegrityError:
+            await session.rollback()
+            raise HTTPException(status_code=400, detail="Email already registered")
+    # the login that usually follows must not miss the row on a lagging replica
+    database.replica_router.note_write(user.email)
 
     logger.info("New user registered: %s", user.email)
     return user
 
 
-def authenticate_user(email: str, password: str, session: Session) -> User:
+async def _fetch_user(engine: AsyncEngine, email: str) -> UserRecord | None:
+    # a plain connection, no ORM session or identity map for a single-row read
+    with DB_SESSION_SECONDS.labels("user_lookup").time():
+        async with engine.connect() as conn:
+            row = (await conn.execute(_USER_BY_EMAIL, {"email": email})).first()
+    return UserRecord(*row) if row is not None else None
+
+
+async def get_user_by_email(email: str) -> UserRecord | None:
+    """Look the user up on a read replica, or on the primary when the row was written recently
+    (by this worker, or by another one per the client's recent write cookie) or the replica
+    fails. A miss on the replica is final: unknown emails, what credential stuffing sends,
+    never cost a second query on the primary."""
+    router = database.replica_router
+    engine = router.read_engine(email)
+    if engine is not router.primary:
+        try:
+            return await _fetch_user(engine, email)
+        except DBAPIError:
+            logger.exception("Replica read failed, retrying on the primary")
+            router.mark_down(engine)
+    return await _fetch_user(router.primary, email)
+
+
+async def authenticate_user(email: str, password: str) -> UserRecord:
     """Authenticate user and check password."""
-    user = session.exec(select(User).where(User.email == email)).first()
-    if not user or not verify_password(password, user.hashed_password):
+    # the connection is released before bcrypt runs so none is held meanwhile
+    user = await get_user_by_email(email)
+
+    if not user or not await verify_password_async(password, user.hashed_password):
         logger.info("Login failed for email: %s", email)
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
-    logger.info("fetch user:%s ", user.model_dump())
-    return user
\ No newline at end of file
+    logger.info("Login succeeded for email: %s", email)
+    if needs_rehash(user.hashed_password):
+        # the plain password is only known now, the new hash is written after the response
+        task = asyncio.create_task(_rehash_password(user, password))
+        _rehash_tasks.add(task)
+        task.add_done_callback(_rehash_tasks.discard)
+    return user
+
+
+async def _rehash_password(user: UserRecord, password: str) -> None:
+    """Store the password again with the current bcrypt cost."""
+    # jwt_auth imports this module
+    from app.services.jwt_auth import invalidate_user
+
+    try:
+        hashed_password = await hash_password_async(password)
+        router = database.replica_router
+        async with router.primary.begin() as conn:
+            # only replace the hash that was verified, a password changed meanwhile wins
+            result = await conn.execute(
+                update(User)
+                .where(User.id == user.id, User.hashed_password == user.hashed_password)
+                .values(hashed_password=hashed_password)
+            )
+    except HashPoolBusy:
+        # the next login tries again
+        return
+    except Exception:
+        logger.exception("Rehashing the password failed for email: %s", user.email)
+        return
+    if result.rowcount:
+        router.note_write(user.email)
+        invalidate_user(user.email)
+        logger.info("Rehashed password for email: %s", user.email)
+
+
+async def drain_rehashes() -> None:
+    """Wait for the rehashes in flight, called on shutdown before the engines are disposed."""
+    if _rehash_tasks:
+        await asyncio.gather(*_rehash_tasks)
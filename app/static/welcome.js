@@ -3,37 +3,35 @@ let reconnectInterval = 3000;
 let notificationVisible = false;
 let detailsVisible = false;
 let unread = false;
+// highest notification id received, sent on reconnect to get what was missed
+let lastId = null;
+// ids already shown, delivery is at-least-once and events from other workers may arrive out of order
+const seenIds = new Set();
+const SEEN_IDS_LIMIT = 1000;
+const decoder = new TextDecoder();
 
 function connectWebSocket() {
-    socket = new WebSocket(`ws://${window.location.host}/ws/notifications`);
+    // binary frames are encoded once on the server and shared by all recipients
+    let url = `ws://${window.location.host}/ws/notifications?binary=true&format=json`;
+    if (lastId !== null) {
+        url += `&last_id=${lastId}`;
+    }
+    socket = new WebSocket(url);
+    socket.binaryType = "arraybuffer";
 
     socket.onopen = () => {
         console.log("🔌 WebSocket connected");
     };
 
     socket.onmessage = (event) => {
-        const msg = event.data;
-
-        const bar = document.getElementById("notification");
-        const label = document.getElementById("notification-label");
-        const list = document.getElementById("notification-list");
-
-        // 显示通知栏（初次）
-        if (!notificationVisible) {
-            bar.style.display = "block";
-            notificationVisible = true;
-        }
-
-        // 有未读消息，变黄+修改文案
-        if (!unread) {
-            bar.classList.add("unread");
-            label.innerText = "🔔 You have new notifications!";
-            unread = true;
+        const data = JSON.parse(typeof event.data === "string" ? event.data : decoder.decode(event.data));
+        if (data.type === "ping") {
+            socket.send("pong");
+            return;
         }
-
-        const li = document.createElement("li");
-        li.innerText = msg;
-        list.prepend(li);
+        // under load the server may coalesce several events into one frame
+        const events = data.events !== undefined ? data.events : [data];
+        events.forEach(showNotification);
     };
 
     socket.onclose = (event) => {
@@ -47,6 +45,42 @@ function connectWebSocket() {
     };
 }
 
+function showNotification(data) {
+    if (data.id !== undefined) {
+        if (seenIds.has(data.id)) {
+            return;
+        }
+        seenIds.add(data.id);
+        if (seenIds.size > SEEN_IDS_LIMIT) {
+            // a Set iterates in insertion order, drop the oldest entry
+            seenIds.delete(seenIds.values().next().value);
+        }
+        lastId = lastId === null ? data.id : Math.max(lastId, data.id);
+    }
+    const msg = data.message;
+
+    const bar = document.getElementById("notification");
+    const label = document.getElementById("notification-label");
+    const list = document.getElementById("notification-list");
+
+    // 显示通知栏（初次）
+    if (!notificationVisible) {
+        bar.style.display = "block";
+        notificationVisible = true;
+    }
+
+    // 有未读消息，变黄+修改文案
+    if (!unread) {
+        bar.classList.add("unread");
+        label.innerText = "🔔 You have new notifications!";
+        unread = true;
+    }
+
+    const li = document.createElement("li");
+    li.innerText = msg;
+    list.prepend(li);
+}
+
 function toggleDetails() {
     const details = document.getElementById("notification-details");
     const bar = document.getElementById("notification");
@@ -0,0 +1,169 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Hashable
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after `ttl` seconds.
+
+    `get_or_load` collapses concurrent misses for the same key into a single
+    loader call (single-flight), the other callers wait for its result.
+    `get_or_load_async` does the same for coroutine loaders on the event loop.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0, timer: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._timer = timer
+        self._lock = threading.Lock()
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._inflight: dict[Hashable, Future] = {}
+        self._inflight_async: dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _lookup(self, key: Hashable) -> Any:
+        # caller must hold the lock
+        entry = self._data.get(key)
+        if entry is None:
+            return _MISSING
+        expires_at, value = entry
+        if expires_at <= self._timer():
+            del self._data[key]
+            return _MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        # caller must hold the lock
+        self._data[key] = (self._timer() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            value = self._lookup(key)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._store(key, value)
+
+    def get_or_load(self, key: Hashable, loader: Callable[[Hashable], Any]) -> Any:
+        """Return the cached value or load it; `None` results are not cached."""
+        with self._lock:
+            value = self._lookup(key)
+            if value is not _MISSING:
+                self.hits += 1
+                return value
+            self.misses += 1
+            future = self._inflight.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                self._inflight[key] = future
+
+        if not is_owner:
+            return future.result()
+
+        try:
+            value = loader(key)
+        except BaseException as e:
+            with self._lock:
+                if self._inflight.get(key) is future:
+                    del self._inflight[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            # an invalidate() during the load drops the marker, the value may be stale then
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+                if value is not None:
+                    self._store(key, value)
+        future.set_result(value)
+        return value
+
+    async def get_or_load_async(self, key: Hashable, loader: Callable[[Hashable], Awaitable[Any]]) -> Any:
+        """Async `get_or_load`, waiters await the owner's future instead of blocking a thread.
+        When the owner is cancelled (e.g. its client went away) the waiters load again."""
+        while True:
+            with self._lock:
+                value = self._lookup(key)
+                if value is not _MISSING:
+                    self.hits += 1
+                    return value
+                self.misses += 1
+                future = self._inflight_async.get(key)
+                is_owner = future is None
+                if is_owner:
+                    future = asyncio.get_running_loop().create_future()
+                    self._inflight_async[key] = future
+            if is_owner:
+                break
+            try:
+                # shield so a cancelled waiter doesn't cancel the owner's result for everyone else
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # the owner's cancellation isn't this waiter's, one of them becomes the new owner
+                if future.cancelled() and not asyncio.current_task().cancelling():
+                    continue
+                raise
+
+        try:
+            value = await loader(key)
+        except BaseException as e:
+            with self._lock:
+                if self._inflight_async.get(key) is future:
+                    del self._inflight_async[key]
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # retrieved by the waiters if there are any, don't warn when there are none
+                future.exception()
+            raise
+
+        with self._lock:
+            if self._inflight_async.get(key) is future:
+                del self._inflight_async[key]
+                if value is not None:
+                    self._store(key, value)
+        future.set_result(value)
+        return value
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+            self._inflight.pop(key, None)
+            self._inflight_async.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._inflight.clear()
+            self._inflight_async.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,61 @@
+import bisect
+import threading
+from typing import Sequence
+
+# Latency buckets in seconds, from sub-millisecond pool checkouts to multi-second stalls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Shards:
+    """Per-thread value slots: writers only touch their own thread's list so the hot
+    path takes no lock, readers sum every slot when they need the totals."""
+
+    def __init__(self, size: int):
+        self._size = size
+        self._local = threading.local()
+        self._slots: list[list[float]] = []
+
+    def slot(self) -> list[float]:
+        try:
+            return self._local.values
+        except AttributeError:
+            values = [0] * self._size
+            self._local.values = values
+            # list.append is atomic, the slot outlives its thread so no counts are lost
+            self._slots.append(values)
+            return values
+
+    def totals(self) -> list[float]:
+        totals = [0] * self._size
+        for values in list(self._slots):
+            for i, value in enumerate(values):
+                totals[i] += value
+        return totals
+
+
+class Histogram:
+    """Cumulative-bucket histogram, the same shape Prometheus exposes.
+
+    Each observation lands in `(buckets[i-1], buckets[i]]`, the last slot counts
+    everything above the largest bound. Observing is lock-free, see `Shards`.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        # one slot per bucket plus +Inf, then the sum
+        self._shards = Shards(len(self.buckets) + 2)
+
+    def observe(self, value: float) -> None:
+        values = self._shards.slot()
+        values[bisect.bisect_left(self.buckets, value)] += 1
+        values[-1] += value
+
+    def snapshot(self) -> dict:
+        """Cumulative counts per upper bound (`"+Inf"` last), total count and sum."""
+        *counts, total = self._shards.totals()
+        cumulative = {}
+        running = 0
+        for bound, n in zip((*self.buckets, "+Inf"), counts):
+            running += n
+            cumulative[bound] = running
+        return {"buckets": cumulative, "count": running, "sum": total}
@@ -0,0 +1,46 @@
+import sqlite3
+import threading
+
+_SQLITE_URL_PREFIX = "sqlite:///"
+
+
+def sqlite_url_path(url: str) -> str | None:
+    """The file of a `sqlite:///path/to/file.db` url, None for any other url."""
+    if url.startswith(_SQLITE_URL_PREFIX):
+        return url[len(_SQLITE_URL_PREFIX):]
+    return None
+
+
+class LocalSqlite:
+    """Connections to a SQLite file on the local disk, the state the workers of one host share.
+
+    A connection must not be used by two threads at once, so each thread opens its own.
+    They run in WAL mode, readers don't wait for the writer, and wait up to `timeout`
+    seconds for another worker's write lock.
+    """
+
+    def __init__(self, path: str, timeout: float = 5):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: list[sqlite3.Connection] = []
+
+    def connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # closed from whichever thread calls close()
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self) -> None:
+        """Close the connections of every thread, a thread using it again opens a new one."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
@@ -0,0 +1,189 @@
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Iterable, Sequence
+
+from app.utils.histogram import DEFAULT_BUCKETS, Histogram, Shards
+
+# Metrics live per worker process. Recording is lock-free (see `Shards`) and everything
+# else, label rendering and the values read from other components, only runs on scrape.
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Timer:
+    __slots__ = ("_histogram", "_start")
+
+    def __init__(self, histogram: Histogram):
+        self._histogram = histogram
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._histogram.observe(time.perf_counter() - self._start)
+
+
+class _CounterChild:
+    __slots__ = ("_shards",)
+
+    def __init__(self):
+        self._shards = Shards(1)
+
+    def inc(self, amount: float = 1) -> None:
+        self._shards.slot()[0] += amount
+
+    def value(self) -> float:
+        return self._shards.totals()[0]
+
+
+class _TimedHistogram(Histogram):
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    @abstractmethod
+    def collect(self) -> list[str]:
+        ...
+
+
+class _RecordedMetric(_Metric):
+    """A metric recorded in this process, one child per label values."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._children: dict[tuple, object] = {}
+
+    @abstractmethod
+    def _new_child(self):
+        ...
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            # setdefault keeps the first child if two threads race on a new label set
+            child = self._children.setdefault(values, self._new_child())
+        return child
+
+
+class Counter(_RecordedMetric):
+    kind = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+    def collect(self) -> list[str]:
+        return [
+            f"{self.name}{_labels(self.labelnames, values)} {_number(child.value())}"
+            for values, child in list(self._children.items())
+        ]
+
+
+class HistogramMetric(_RecordedMetric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def _new_child(self) -> _TimedHistogram:
+        return _TimedHistogram(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self) -> _Timer:
+        return self.labels().time()
+
+    def collect(self) -> list[str]:
+        return render_histogram(self.name, self.labelnames,
+                                ((values, child.snapshot()) for values, child in list(self._children.items())))
+
+
+def render_histogram(name: str, labelnames: Sequence[str], snapshots: Iterable[tuple[tuple, dict]]) -> list[str]:
+    lines = []
+    for values, snapshot in snapshots:
+        for bound, count in snapshot["buckets"].items():
+            le = 'le="{}"'.format(bound if bound == "+Inf" else _number(bound))
+            lines.append(f"{name}_bucket{_labels(labelnames, values, le)} {count}")
+        lines.append(f"{name}_sum{_labels(labelnames, values)} {_number(snapshot['sum'])}")
+        lines.append(f"{name}_count{_labels(labelnames, values)} {snapshot['count']}")
+    return lines
+
+
+class Callback(_Metric):
+    """Values owned by another component, read when scraped: `fn` returns
+    {label values: number} for counters and gauges, {label values: snapshot} for histograms."""
+
+    def __init__(self, kind: str, name: str, documentation: str, labelnames: Sequence[str],
+                 fn: Callable[[], dict[tuple, object]]):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self._fn = fn
+
+    def collect(self) -> list[str]:
+        values = self._fn()
+        if self.kind == "histogram":
+            return render_histogram(self.name, self.labelnames, values.items())
+        return [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}" for labels, value in values.items()]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> HistogramMetric:
+        return self._register(HistogramMetric(name, documentation, labelnames, buckets))
+
+    def callback(self, kind: str, name: str, documentation: str, fn: Callable[[], dict],
+                 labelnames: Sequence[str] = ()) -> Callback:
+        return self._register(Callback(kind, name, documentation, labelnames, fn))
+
+    def render(self) -> str:
+        """Prometheus text exposition format 0.0.4."""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.header())
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
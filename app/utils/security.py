@@ -1,18 +1,211 @@
+import asyncio
 import logging
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import lru_cache
 from passlib.context import CryptContext
 
+from app.utils.metrics import registry
+
 logger = logging.getLogger(__name__)
 
 # Password hashing context
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt cost factor of new hashes, each extra round doubles the time of a hash. Stored hashes
+# with another cost are rehashed on the next login. Unset keeps passlib's default (12).
+BCRYPT_ROUNDS = os.getenv("BCRYPT_ROUNDS")
+# Time one hash should take on this host, in ms. When set (and BCRYPT_ROUNDS isn't) the rounds
+# are calibrated at startup, pin BCRYPT_ROUNDS instead when hosts of different speeds share a database.
+BCRYPT_TARGET_MS = os.getenv("BCRYPT_TARGET_MS")
+# Never calibrate below this, fewer rounds make offline brute force too cheap
+BCRYPT_MIN_ROUNDS = 10
+BCRYPT_MAX_ROUNDS = 20
+# Rounds timed by the calibration, cheap enough to repeat, the rest is extrapolated
+_CALIBRATION_ROUNDS = 8
+
+# bcrypt is CPU-bound, so hashing runs in a process pool sized to the host's cores.
+# Set PASSWORD_HASH_WORKERS=0 to fall back to the event loop's default thread pool.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", os.cpu_count() or 1))
+# Upper bound of hash/verify jobs in flight; extra callers wait instead of piling up in the pool queue
+PASSWORD_HASH_MAX_CONCURRENCY = int(
+    os.getenv("PASSWORD_HASH_MAX_CONCURRENCY", max(PASSWORD_HASH_WORKERS, 1) * 2)
+)
+
+# Callers allowed to wait for a slot, more are shed with HashPoolBusy instead of queueing without bound
+PASSWORD_HASH_MAX_WAITING = int(os.getenv("PASSWORD_HASH_MAX_WAITING", PASSWORD_HASH_MAX_CONCURRENCY * 4))
+# Retry-After sent with requests shed for a full hashing queue
+PASSWORD_HASH_RETRY_AFTER = int(os.getenv("PASSWORD_HASH_RETRY_AFTER", "1"))
+
+HASH_WAIT_SECONDS = registry.histogram(
+    "password_hash_wait_seconds", "Time waiting for a free hashing slot", ("op",))
+HASH_SECONDS = registry.histogram(
+    "password_hash_seconds", "Time hashing or verifying a password in the worker pool", ("op",))
+HASH_SHED = registry.counter("password_hash_shed_total", "Hash jobs rejected because the queue was full", ("op",))
+
+_hash_pool: Executor | None = None
+_hash_semaphore: asyncio.Semaphore | None = None
+_hash_semaphore_loop: asyncio.AbstractEventLoop | None = None
+# callers waiting for a slot that may be shed, bulk work waiting its turn doesn't count
+_hash_waiting = 0
+
+
+class HashPoolBusy(Exception):
+    """Raised instead of waiting when too many callers already wait for a hashing slot."""
+
+    def __init__(self, retry_after: int = PASSWORD_HASH_RETRY_AFTER):
+        super().__init__("Password hashing is saturated")
+        self.retry_after = retry_after
+
+
+@lru_cache
+def _bcrypt_with(rounds: int):
+    return pwd_context.handler("bcrypt").using(rounds=rounds)
+
 
-def get_password_hash(password: str) -> str:
-    """Hash plain password using bcrypt."""
-    return pwd_context.hash(password)
+def get_password_hash(password: str, rounds: int | None = None) -> str:
+    """Hash plain password using bcrypt, with the configured rounds unless given."""
+    if rounds is None:
+        return pwd_context.hash(password)
+    return _bcrypt_with(rounds).hash(password)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Compare plain password with hashed password."""
-    logger.info("Verifying password: input='%s', hash='%s'", plain_password, hashed_password)
     return pwd_context.verify(plain_password, hashed_password)
+
+
+def bcrypt_rounds() -> int:
+    return pwd_context.handler("bcrypt").default_rounds
+
+
+def set_bcrypt_rounds(rounds: int) -> None:
+    """Hash new passwords with `rounds` and flag hashes of any other cost in `needs_rehash`."""
+    pwd_context.update(bcrypt__default_rounds=rounds, bcrypt__min_rounds=rounds, bcrypt__max_rounds=rounds)
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    return pwd_context.needs_update(hashed_password)
+
+
+def calibrate_bcrypt_rounds(target_seconds: float, samples: int = 5) -> int:
+    """Most rounds whose hash fits in `target_seconds` on this host, within the allowed range."""
+    handler = _bcrypt_with(_CALIBRATION_ROUNDS)
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        handler.hash("calibration")
+        timings.append(time.perf_counter() - start)
+    # the fastest run is the least disturbed by other load on the host
+    base = min(timings)
+    rounds = _CALIBRATION_ROUNDS
+    while rounds < BCRYPT_MAX_ROUNDS and base * 2 ** (rounds + 1 - _CALIBRATION_ROUNDS) <= target_seconds:
+        rounds += 1
+    if rounds < BCRYPT_MIN_ROUNDS:
+        logger.warning("bcrypt needs more than %.0f ms per hash here, using the minimum of %d rounds",
+                       target_seconds * 1000, BCRYPT_MIN_ROUNDS)
+    return max(rounds, BCRYPT_MIN_ROUNDS)
+
+
+def configure_password_hashing() -> int:
+    """Apply BCRYPT_ROUNDS, or calibrate for BCRYPT_TARGET_MS, called at startup before the pool runs."""
+    if BCRYPT_ROUNDS:
+        rounds = int(BCRYPT_ROUNDS)
+    elif BCRYPT_TARGET_MS:
+        rounds = calibrate_bcrypt_rounds(float(BCRYPT_TARGET_MS) / 1000)
+        logger.info("Calibrated bcrypt to %d rounds for %s ms per hash", rounds, BCRYPT_TARGET_MS)
+    else:
+        rounds = bcrypt_rounds()
+    set_bcrypt_rounds(rounds)
+    return rounds
+
+
+def _get_hash_pool() -> Executor | None:
+    global _hash_pool
+    if PASSWORD_HASH_WORKERS <= 0:
+        return None
+    if _hash_pool is None:
+        _hash_pool = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+    return _hash_pool
+
+
+def _get_hash_semaphore() -> asyncio.Semaphore:
+    # asyncio primitives are bound to one loop, recreate it if the loop changed (e.g. between tests)
+    global _hash_semaphore, _hash_semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _hash_semaphore is None or _hash_semaphore_loop is not loop:
+        _hash_semaphore = asyncio.Semaphore(PASSWORD_HASH_MAX_CONCURRENCY)
+        _hash_semaphore_loop = loop
+    return _hash_semaphore
+
+
+async def _run_in_hash_pool(op: str, func, *args, shed: bool = True):
+    global _hash_waiting
+    semaphore = _get_hash_semaphore()
+    if shed and semaphore.locked() and _hash_waiting >= PASSWORD_HASH_MAX_WAITING:
+        HASH_SHED.labels(op).inc()
+        raise HashPoolBusy()
+    start = time.perf_counter()
+    if shed:
+        _hash_waiting += 1
+    try:
+        await semaphore.acquire()
+    finally:
+        if shed:
+            _hash_waiting -= 1
+    try:
+        HASH_WAIT_SECONDS.labels(op).observe(time.perf_counter() - start)
+        loop = asyncio.get_running_loop()
+        with HASH_SECONDS.labels(op).time():
+            return await loop.run_in_executor(_get_hash_pool(), func, *args)
+    finally:
+        semaphore.release()
+
+
+async def hash_password_async(password: str) -> str:
+    """Hash plain password in the worker pool without blocking the event loop."""
+    # the rounds go with the job, pool processes don't see changes made after they started
+    return await _run_in_hash_pool("hash", get_password_hash, password, bcrypt_rounds())
+
+
+def _hash_many(passwords: list[str], rounds: int) -> list[str]:
+    return [get_password_hash(password, rounds) for password in passwords]
+
+
+def _bulk_hash_concurrency() -> int:
+    # one pool process and one semaphore slot stay free, queueing chunks in the pool's own
+    # FIFO queue would make a login wait for everything submitted before it
+    slots = PASSWORD_HASH_MAX_CONCURRENCY
+    if PASSWORD_HASH_WORKERS > 0:
+        slots = min(slots, PASSWORD_HASH_WORKERS)
+    return max(1, slots - 1)
+
+
+async def hash_passwords_async(passwords: list[str], chunk_size: int = 4) -> list[str]:
+    """Hash many passwords across the pool workers. Fewer chunks are in flight than there are
+    workers, so a login waits at most for one chunk. Imports wait for their turn instead of being shed."""
+    rounds = bcrypt_rounds()
+    chunks = [passwords[i:i + chunk_size] for i in range(0, len(passwords), chunk_size)]
+    results: list[list[str]] = [[] for _ in chunks]
+    pending = iter(range(len(chunks)))
+
+    async def worker():
+        for index in pending:
+            results[index] = await _run_in_hash_pool("hash_batch", _hash_many, chunks[index], rounds, shed=False)
+
+    await asyncio.gather(*(worker() for _ in range(min(_bulk_hash_concurrency(), len(chunks)))))
+    return [hashed for chunk in results for hashed in chunk]
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify plain password in the worker pool without blocking the event loop."""
+    return await _run_in_hash_pool("verify", verify_password, plain_password, hashed_password)
+
+
+def shutdown_hash_pool() -> None:
+    """Stop the worker processes, called when the app shuts down."""
+    global _hash_pool
+    if _hash_pool is not None:
+        _hash_pool.shutdown(wait=False, cancel_futures=True)
+        _hash_pool = None
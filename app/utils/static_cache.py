@@ -0,0 +1,125 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+from dataclasses import dataclass
+from pathlib import Path
+
+import brotli
+from starlette.requests import Request
+from starlette.responses import Response
+
+logger = logging.getLogger(__name__)
+
+# Smaller files are served as is, compressing them saves less than the header costs
+MIN_COMPRESS_SIZE = 256
+
+
+@dataclass(frozen=True, slots=True)
+class StaticAsset:
+    media_type: str
+    # encoding ("identity", "gzip", "br") -> (body, strong ETag of that representation)
+    variants: dict[str, tuple[bytes, str]]
+    mtime_ns: int
+    size: int
+
+
+def _build_asset(path: Path) -> StaticAsset:
+    stat = path.stat()
+    body = path.read_bytes()
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    variants = {"identity": (body, f'"{digest}"')}
+    if len(body) >= MIN_COMPRESS_SIZE:
+        # mtime=0 keeps the gzip bytes, and so the ETag, stable across restarts
+        variants["gzip"] = (gzip.compress(body, compresslevel=9, mtime=0), f'"{digest}-gz"')
+        variants["br"] = (brotli.compress(body, quality=11), f'"{digest}-br"')
+    media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    if media_type.startswith("text/") or media_type == "application/javascript":
+        media_type += "; charset=utf-8"
+    return StaticAsset(media_type, variants, stat.st_mtime_ns, stat.st_size)
+
+
+def _accepted_encodings(header: str) -> set[str]:
+    accepted = set()
+    for part in header.split(","):
+        name, *params = part.split(";")
+        quality = 1.0
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    # If-None-Match uses the weak comparison, a W/ prefix still matches
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class StaticCache:
+    """The files of a directory tree held in memory with precompressed variants and ETags,
+    keyed by their path relative to the directory.
+
+    With `reload`, each lookup checks the file's mtime and size and rebuilds it when it
+    changed, for development. Otherwise serving touches no disk at all.
+    """
+
+    def __init__(self, directory: Path, reload: bool = False):
+        self.directory = directory
+        self.reload = reload
+        self._assets: dict[str, StaticAsset] = {}
+        self.load()
+
+    def load(self) -> None:
+        assets = {}
+        for path in sorted(self.directory.rglob("*")):
+            if path.is_file():
+                assets[path.relative_to(self.directory).as_posix()] = _build_asset(path)
+        self._assets = assets
+
+    def get(self, name: str) -> StaticAsset | None:
+        asset = self._assets.get(name)
+        if not self.reload:
+            return asset
+        path = (self.directory / name).resolve()
+        # only files inside the directory, never a path outside of it
+        if not path.is_relative_to(self.directory.resolve()) or not path.is_file():
+            return asset
+        stat = path.stat()
+        if asset is None or (stat.st_mtime_ns, stat.st_size) != (asset.mtime_ns, asset.size):
+            logger.info("Reloading static file %s", name)
+            asset = _build_asset(path)
+            self._assets[name] = asset
+        return asset
+
+    def response(self, request: Request, name: str, cache_control: str) -> Response:
+        """Serve the best encoding the client accepts, or a 304 when its copy is current.
+
+        A HEAD request gets the same headers as a GET, without the body.
+        """
+        asset = self.get(name)
+        if asset is None:
+            return Response(status_code=404)
+        accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+        encoding = next((e for e in ("br", "gzip") if e in accepted and e in asset.variants), "identity")
+        body, etag = asset.variants[encoding]
+        headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        if request.method == "HEAD":
+            headers["Content-Length"] = str(len(body))
+            return Response(media_type=asset.media_type, headers=headers)
+        return Response(body, media_type=asset.media_type, headers=headers)
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import math
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+class Timer:
+    __slots__ = ("callback", "slot", "rounds")
+
+    def __init__(self, callback: Callable[[], None], slot: int, rounds: int):
+        self.callback = callback
+        self.slot = slot
+        self.rounds = rounds
+
+
+class TimerWheel:
+    """Hashed timer wheel: one task ticks for every timer, schedule and cancel are O(1).
+
+    Timers fire on tick boundaries, so a delay is rounded up to a multiple of `tick`.
+    Delays longer than a full turn are kept in their slot for extra `rounds`.
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 512):
+        self.tick = tick
+        self.slots = slots
+        self._wheel: list[set[Timer]] = [set() for _ in range(slots)]
+        self._cursor = 0
+        self._task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return sum(len(bucket) for bucket in self._wheel)
+
+    def schedule(self, delay: float, callback: Callable[[], None]) -> Timer:
+        ticks = max(1, math.ceil(delay / self.tick))
+        timer = Timer(callback, (self._cursor + ticks) % self.slots, (ticks - 1) // self.slots)
+        self._wheel[timer.slot].add(timer)
+        return timer
+
+    def cancel(self, timer: Timer) -> None:
+        self._wheel[timer.slot].discard(timer)
+
+    def advance(self) -> None:
+        """Move one tick forward and fire the timers that are due."""
+        self._cursor = (self._cursor + 1) % self.slots
+        bucket = self._wheel[self._cursor]
+        for timer in list(bucket):
+            if timer.rounds > 0:
+                timer.rounds -= 1
+                continue
+            bucket.discard(timer)
+            try:
+                timer.callback()
+            except Exception:
+                logger.exception("Timer callback failed")
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time() + self.tick
+        while True:
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+            # catch up on ticks missed while the loop was busy instead of drifting
+            while next_tick <= loop.time():
+                self.advance()
+                next_tick += self.tick
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,236 @@
+# benchmarks/bench_app.py
+"""End-to-end numbers for the auth and notification hot paths, one JSON object per scenario.
+
+  python -m benchmarks.bench_app                          # in-process (httpx ASGI transport)
+  python -m benchmarks.bench_app --target uvicorn         # spawns a local uvicorn process
+  python -m benchmarks.bench_app --target http://127.0.0.1:8000 --database-url mysql+pymysql://...
+  python -m benchmarks.bench_app --output runs/today.jsonl
+
+Both local targets run against a fresh SQLite file unless --database-url is given
+(the async URL is derived by swapping the driver). Every result carries the git
+revision and the parameters, compare two runs with `python -m benchmarks.compare`.
+The local targets turn the login rate limits and load shedding off, start a remote
+server with the same settings (see UNLIMITED) to benchmark it.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+
+import httpx
+
+# app modules read their configuration at import, they are imported once the database is chosen
+PASSWORD = "benchmark-password"
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(q * (len(ordered) - 1)))]
+
+
+def summarize(scenario: str, latencies: list[float], errors: int, elapsed: float, **params) -> dict:
+    return {
+        "scenario": scenario,
+        **params,
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "per_second": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+    }
+
+
+async def drive(requests: list, concurrency: int, call) -> tuple[list[float], int, float]:
+    """Run `call(item)` for every item with `concurrency` workers, returns latencies, errors and wall time."""
+    latencies, errors = [], 0
+    pending = iter(requests)
+
+    async def worker():
+        nonlocal errors
+        for item in pending:
+            start = time.perf_counter()
+            try:
+                resp = await call(item)
+                resp.raise_for_status()
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+
+async def run_http_scenarios(client: httpx.AsyncClient, users: int, requests: int, concurrency: int) -> list[dict]:
+    prefix = uuid.uuid4().hex[:8]
+    emails = [f"bench-{prefix}-{i}@example.com" for i in range(users)]
+    results = []
+
+    latencies, errors, elapsed = await drive(
+        emails, concurrency, lambda email: client.post("/register", json={"email": email, "password": PASSWORD}))
+    results.append(summarize("register", latencies, errors, elapsed, concurrency=concurrency))
+
+    logins = [emails[i % users] for i in range(requests)]
+    latencies, errors, elapsed = await drive(
+        logins, concurrency, lambda email: client.post("/login", data={"email": email, "password": PASSWORD}))
+    results.append(summarize("login", latencies, errors, elapsed, concurrency=concurrency))
+
+    resp = await client.post("/login", data={"email": emails[0], "password": PASSWORD})
+    # the cookie is marked secure, send it by hand over plain http
+    headers = {"Cookie": f"access_token={resp.cookies['access_token']}"}
+    latencies, errors, elapsed = await drive(
+        range(requests), concurrency, lambda _: client.get("/welcome", headers=headers))
+    results.append(summarize("welcome", latencies, errors, elapsed, concurrency=concurrency))
+    return results
+
+
+async def run_fanout(clients: int, rounds: int) -> dict:
+    from app.services.noti_bus import InProcessBus
+    from app.services.noti_service import NotificationManager
+    from benchmarks.bench_sse_vs_websocket import Delivery, FakeWebSocket
+
+    manager = NotificationManager(bus=InProcessBus(), ping_interval=0)
+    delivery = Delivery()
+    for i in range(clients):
+        await manager.subscribe(f"user{i}@example.com", FakeWebSocket(delivery))
+
+    latencies = []
+    for i in range(rounds):
+        delivery.expect(clients)
+        start = time.perf_counter()
+        await manager.broadcast(f"New user registered: user{i}@example.com")
+        await delivery.done.wait()
+        latencies.append(time.perf_counter() - start)
+    await manager.close()
+    return {
+        **summarize("fanout", latencies, 0, sum(latencies), clients=clients),
+        "deliveries_per_second": round(clients * rounds / sum(latencies)),
+    }
+
+
+# every request comes from one IP with a small pool of emails and more concurrent logins than
+# the hashing queue admits, the limits and load shedding would reject most of them
+UNLIMITED = {"RATE_LIMIT_PER_IP": "0", "RATE_LIMIT_PER_EMAIL": "0", "PASSWORD_HASH_MAX_WAITING": "1000000"}
+
+
+def configure_database(database_url: str | None) -> tuple[str, str]:
+    if database_url is None:
+        path = os.path.join(tempfile.mkdtemp(), "bench.db")
+        database_url = f"sqlite:///{path}"
+    async_url = database_url.replace("sqlite://", "sqlite+aiosqlite://", 1).replace("mysql+pymysql://", "mysql+aiomysql://", 1)
+    return database_url, async_url
+
+
+async def run_in_process(args) -> list[dict]:
+    database_url, async_url = configure_database(args.database_url)
+    os.environ["DATABASE_URL"], os.environ["ASYNC_DATABASE_URL"] = database_url, async_url
+    for name, value in UNLIMITED.items():
+        os.environ.setdefault(name, value)
+    from app.database import dispose_engines, init_db
+    from app.main import app
+    from app.services.noti_service import noti_manager
+    from app.services.outbox import outbox_dispatcher
+    from app.utils.security import shutdown_hash_pool
+
+    # the lifespan minus logging setup, which would interleave with the results on stdout
+    init_db()
+    await noti_manager.start()
+    await outbox_dispatcher.start()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            return await run_http_scenarios(client, args.users, args.requests, args.concurrency)
+    finally:
+        await outbox_dispatcher.stop()
+        await noti_manager.close()
+        await dispose_engines()
+        shutdown_hash_pool()
+
+
+async def wait_until_ready(client: httpx.AsyncClient, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if (await client.get("/hello")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError("server did not start")
+        await asyncio.sleep(0.2)
+
+
+async def run_over_http(args) -> list[dict]:
+    server = None
+    base_url = args.target
+    if args.target == "uvicorn":
+        database_url, async_url = configure_database(args.database_url)
+        env = {**UNLIMITED, **os.environ, "DATABASE_URL": database_url, "ASYNC_DATABASE_URL": async_url,
+               "PORT": str(args.port), "HOST": "127.0.0.1", "WEB_CONCURRENCY": str(args.workers)}
+        server = subprocess.Popen([sys.executable, "-m", "app"], env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        base_url = f"http://127.0.0.1:{args.port}"
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+            await wait_until_ready(client)
+            return await run_http_scenarios(client, args.users, args.requests, args.concurrency)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+
+def run_metadata(target: str) -> dict:
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        revision = None
+    return {
+        "run_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision": revision,
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "target": target,
+    }
+
+
+async def main(args) -> list[dict]:
+    if args.target == "in-process":
+        results = await run_in_process(args)
+    else:
+        results = await run_over_http(args)
+    for clients in args.fanout_clients:
+        results.append(await run_fanout(clients, args.fanout_rounds))
+    metadata = run_metadata(args.target)
+    return [{**metadata, **result} for result in results]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", default="in-process",
+                        help="in-process, uvicorn (spawned locally) or the base URL of a running server")
+    parser.add_argument("--database-url", help="sync URL of the database, a fresh SQLite file by default")
+    parser.add_argument("--users", type=int, default=200, help="registrations, also the pool of login users")
+    parser.add_argument("--requests", type=int, default=500, help="logins and /welcome requests")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--fanout-clients", type=int, nargs="*", default=[1000, 10000])
+    parser.add_argument("--fanout-rounds", type=int, default=20)
+    parser.add_argument("--output", help="append the results to this JSON lines file")
+    args = parser.parse_args()
+
+    results = asyncio.run(main(args))
+    lines = [json.dumps(result) for result in results]
+    print("\n".join(lines))
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
@@ -0,0 +1,85 @@
+# benchmarks/bench_auth_lookup.py
+"""CPU time per user lookup by email: full ORM User through a session vs the prebuilt
+projected statement on a plain connection that the auth paths use.
+
+  python -m benchmarks.bench_auth_lookup --users 10000 --lookups 5000
+
+Runs against a temporary SQLite file through aiosqlite, so the numbers include the
+driver's thread but no network round trip.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, Session, create_engine, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.models.user import User
+from app.services.user_service import _fetch_user
+
+
+async def orm_lookup(engine, email: str):
+    # what load_user and authenticate_user did before: a new select(User) and a hydrated model
+    async with AsyncSession(engine) as session:
+        user = (await session.exec(select(User).where(User.email == email))).first()
+    user.model_dump()
+    return user
+
+
+async def projected_lookup(engine, email: str):
+    return await _fetch_user(engine, email)
+
+
+def create_database(path: str, users: int) -> None:
+    engine = create_engine(f"sqlite:///{path}")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all(User(email=f"user{i}@example.com", hashed_password="$2b$12$" + "x" * 53) for i in range(users))
+        session.commit()
+    engine.dispose()
+
+
+async def run_scenario(name: str, lookup, engine, emails: list[str]) -> dict:
+    # warm the connection pool and the compiled statement cache
+    for email in emails[:100]:
+        await lookup(engine, email)
+
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    for email in emails:
+        await lookup(engine, email)
+    cpu, wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+
+    return {
+        "lookup": name,
+        "lookups": len(emails),
+        "cpu_us_per_lookup": round(cpu / len(emails) * 1e6, 1),
+        "wall_us_per_lookup": round(wall / len(emails) * 1e6, 1),
+    }
+
+
+async def main(users: int, lookups: int) -> list[dict]:
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    create_database(path, users)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    emails = [f"user{random.randrange(users)}@example.com" for _ in range(lookups)]
+    try:
+        return [
+            await run_scenario("orm", orm_lookup, engine, emails),
+            await run_scenario("projected", projected_lookup, engine, emails),
+        ]
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--lookups", type=int, default=5_000)
+    args = parser.parse_args()
+    for result in asyncio.run(main(args.users, args.lookups)):
+        print(json.dumps(result))
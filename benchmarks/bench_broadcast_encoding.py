@@ -0,0 +1,98 @@
+# benchmarks/bench_broadcast_encoding.py
+"""CPU cost of one broadcast to N sockets, per wire encoding.
+
+  python -m benchmarks.bench_broadcast_encoding --recipients 10000 --payload-size 200
+
+The fake socket does what the ASGI server does with a send: encode text frames
+to UTF-8 and, when permessage-deflate is negotiated, compress with the
+connection's own deflate context.
+"""
+import argparse
+import asyncio
+import json
+import time
+import zlib
+
+from app.services.noti_bus import InProcessBus
+from app.services.noti_service import NotificationManager
+
+
+class Delivery:
+    """Counts frames handed to the fake sockets and wakes the benchmark when all arrived."""
+
+    def __init__(self):
+        self.expected = 0
+        self.count = 0
+        self.done = asyncio.Event()
+
+    def expect(self, count: int):
+        self.expected = count
+        self.count = 0
+        self.done.clear()
+
+    def record(self):
+        self.count += 1
+        if self.count == self.expected:
+            self.done.set()
+
+
+class FakeWebSocket:
+    def __init__(self, deflate: bool, delivery: Delivery):
+        self.compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS) if deflate else None
+        self.delivery = delivery
+        self.bytes_sent = 0
+
+    async def send(self, message: dict):
+        data = message.get("bytes")
+        if data is None:
+            data = message["text"].encode("utf-8")
+        if self.compressor is not None:
+            data = self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        self.bytes_sent += len(data)
+        self.delivery.record()
+
+
+async def run_scenario(recipients: int, payload: str, binary: bool, deflate: bool, rounds: int) -> dict:
+    manager = NotificationManager(queue_size=rounds + 1, bus=InProcessBus())
+    delivery = Delivery()
+    sockets = [FakeWebSocket(deflate, delivery) for _ in range(recipients)]
+    for i, websocket in enumerate(sockets):
+        await manager.subscribe(f"user{i}@example.com", websocket, binary=binary)
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for _ in range(rounds):
+        delivery.expect(recipients)
+        await manager.broadcast(payload)
+        await delivery.done.wait()
+    cpu = (time.process_time() - cpu_start) / rounds
+    wall = (time.perf_counter() - wall_start) / rounds
+    await manager.close()
+
+    return {
+        "scenario": f"{'binary' if binary else 'text'}{'+deflate' if deflate else ''}",
+        "recipients": recipients,
+        "payload_bytes": len(payload.encode()),
+        "cpu_ms_per_broadcast": round(cpu * 1000, 3),
+        "wall_ms_per_broadcast": round(wall * 1000, 3),
+        "wire_bytes_per_broadcast": sum(s.bytes_sent for s in sockets) // rounds,
+    }
+
+
+async def main(recipients: int, payload_size: int, rounds: int) -> list[dict]:
+    payload = ("New user registered: user@example.com " * (payload_size // 38 + 1))[:payload_size]
+    results = []
+    for binary in (False, True):
+        for deflate in (False, True):
+            results.append(await run_scenario(recipients, payload, binary, deflate, rounds))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recipients", type=int, default=10_000)
+    parser.add_argument("--payload-size", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    for result in asyncio.run(main(args.recipients, args.payload_size, args.rounds)):
+        print(json.dumps(result))
@@ -0,0 +1,106 @@
+# benchmarks/bench_sse_vs_websocket.py
+"""Memory per connection and broadcast fan-out time, WebSocket vs Server-Sent Events subscribers.
+
+  python -m benchmarks.bench_sse_vs_websocket --connections 10000
+
+Each WebSocket client is a writer task plus a handler task parked in receive(),
+each SSE client is the task iterating its stream like StreamingResponse does.
+Transport buffers of the ASGI server are not included.
+"""
+import argparse
+import asyncio
+import json
+import time
+import tracemalloc
+
+from app.services.noti_bus import InProcessBus
+from app.services.noti_service import NotificationManager
+
+
+class Delivery:
+    def __init__(self):
+        self.expected = 0
+        self.count = 0
+        self.done = asyncio.Event()
+
+    def expect(self, count: int):
+        self.expected = count
+        self.count = 0
+        self.done.clear()
+
+    def record(self):
+        self.count += 1
+        if self.count == self.expected:
+            self.done.set()
+
+
+class FakeWebSocket:
+    def __init__(self, delivery: Delivery):
+        self.delivery = delivery
+
+    async def send(self, message: dict):
+        self.delivery.record()
+
+
+async def connect_websocket(manager: NotificationManager, i: int, delivery: Delivery, parked: asyncio.Future):
+    await manager.subscribe(f"user{i}@example.com", FakeWebSocket(delivery))
+    # the handler task waiting in websocket.receive_text()
+    await parked
+
+
+async def connect_sse(manager: NotificationManager, i: int, delivery: Delivery):
+    subscription = await manager.subscribe_sse(f"user{i}@example.com")
+    async for _ in subscription.stream():
+        delivery.record()
+
+
+async def run_scenario(kind: str, connections: int, rounds: int) -> dict:
+    manager = NotificationManager(bus=InProcessBus(), ping_interval=0)
+    delivery = Delivery()
+    parked = asyncio.get_running_loop().create_future()
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    if kind == "websocket":
+        tasks = [asyncio.create_task(connect_websocket(manager, i, delivery, parked)) for i in range(connections)]
+    else:
+        tasks = [asyncio.create_task(connect_sse(manager, i, delivery)) for i in range(connections)]
+    while len(manager.connections) < connections:
+        await asyncio.sleep(0)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    memory = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+
+    start = time.perf_counter()
+    for i in range(rounds):
+        delivery.expect(connections)
+        await manager.broadcast(f"New user registered: user{i}@example.com")
+        await delivery.done.wait()
+    fanout = (time.perf_counter() - start) / rounds
+
+    parked.cancel()
+    await manager.close()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    return {
+        "transport": kind,
+        "connections": connections,
+        "bytes_per_connection": memory // connections,
+        "fanout_ms": round(fanout * 1000, 3),
+        "deliveries_per_second": round(connections / fanout),
+    }
+
+
+async def main(connections: int, rounds: int) -> list[dict]:
+    return [await run_scenario(kind, connections, rounds) for kind in ("websocket", "sse")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connections", type=int, default=10_000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    for result in asyncio.run(main(args.connections, args.rounds)):
+        print(json.dumps(result))
@@ -0,0 +1,48 @@
+# benchmarks/compare.py
+"""Compare two benchmark runs saved with --output, one JSON object per matching scenario.
+
+  python -m benchmarks.compare runs/before.jsonl runs/after.jsonl
+
+When a file holds several runs of a scenario the last one is used.
+"""
+import argparse
+import json
+
+METRICS = ("per_second", "p50_ms", "p99_ms")
+# fields that make two results comparable, everything else is a measurement or metadata
+KEY_FIELDS = ("target", "scenario", "concurrency", "clients")
+
+
+def load(path: str) -> dict[tuple, dict]:
+    results = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                result = json.loads(line)
+                results[tuple(result.get(field) for field in KEY_FIELDS)] = result
+    return results
+
+
+def compare(before: dict[tuple, dict], after: dict[tuple, dict]) -> list[dict]:
+    rows = []
+    for key, new in after.items():
+        old = before.get(key)
+        if old is None:
+            continue
+        row = {field: value for field, value in zip(KEY_FIELDS, key) if value is not None}
+        row.update({"before": old.get("revision"), "after": new.get("revision")})
+        for metric in METRICS:
+            if old.get(metric) and new.get(metric) is not None:
+                row[metric] = [old[metric], new[metric]]
+                row[f"{metric}_change_pct"] = round((new[metric] - old[metric]) / old[metric] * 100, 1)
+        rows.append(row)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args()
+    for row in compare(load(args.before), load(args.after)):
+        print(json.dumps(row))
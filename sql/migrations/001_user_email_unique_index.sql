@@ -0,0 +1,7 @@
+-- Add a unique index on user.email for tables created before the index existed.
+-- New databases get the index from SQLModel.metadata.create_all().
+
+-- Duplicated emails must be cleaned up first, list them with:
+-- SELECT email, COUNT(*) FROM `user` GROUP BY email HAVING COUNT(*) > 1;
+
+ALTER TABLE `user` ADD UNIQUE INDEX ix_user_email (email);
@@ -1,32 +1,51 @@
 
+import os
+import tempfile
+
 import pytest_asyncio
-from sqlmodel import SQLModel, create_engine, Session
-from app.database import get_session
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app import database
+from app.database import ReplicaRouter, get_async_session
 from app.main import app
+from app.services import jwt_auth
+from app.services.rate_limit import rate_limiter
 from httpx import AsyncClient, ASGITransport
-from sqlalchemy.pool import StaticPool
-
-# Create a shared in-memory SQLite engine for testing
-test_engine = create_engine(
-    "sqlite://",
-    connect_args={"check_same_thread": False},
-    poolclass=StaticPool
-)
+
+# Create a shared SQLite database file for testing, the async request path and the
+# sync background workers open their own connections to it
+_db_path = os.path.join(tempfile.mkdtemp(), "test.db")
+test_engine = create_engine(f"sqlite:///{_db_path}", connect_args={"check_same_thread": False})
+test_async_engine = create_async_engine(f"sqlite+aiosqlite:///{_db_path}")
+
 # Automatically reset the database schema before each test
 @pytest_asyncio.fixture(scope="function", autouse=True)
 def setup_database():
     SQLModel.metadata.drop_all(test_engine)
     SQLModel.metadata.create_all(test_engine)
 
+# Expose the test engine to tests that inspect the database directly
+@pytest_asyncio.fixture(scope="function")
+def db_engine():
+    return test_engine
+
 # Provide an HTTPX AsyncClient with FastAPI app and session override
 @pytest_asyncio.fixture(scope="function")
-async def client():
-    def override_get_session():
-        with Session(test_engine) as session:
+async def client(monkeypatch):
+    async def override_get_async_session():
+        async with AsyncSession(test_async_engine, expire_on_commit=False) as session:
             yield session
 
-    app.dependency_overrides[get_session] = override_get_session
+    app.dependency_overrides[get_async_session] = override_get_async_session
+    # user lookups open their own sessions outside of dependency injection
+    monkeypatch.setattr(database, "replica_router", ReplicaRouter(test_async_engine))
+    jwt_auth.user_cache.clear()
+    jwt_auth.revocation_store.clear()
+    rate_limiter.store.clear()
     transport = ASGITransport(app=app)
 
     async with AsyncClient(transport=transport, base_url="http://test") as ac:
         yield ac
+    # connections are bound to this test's event loop
+    await test_async_engine.dispose()
@@ -1,4 +1,13 @@
 import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, Session, create_engine, select
+
+from app import database
+from app.database import ReplicaRouter
+from app.models.notification import Notification
+from app.models.user import User
+from app.services.user_service import drain_rehashes
+from app.utils.security import HashPoolBusy, get_password_hash, pwd_context, set_bcrypt_rounds
 
 @pytest.mark.asyncio
 async def test_register_and_login_flow(client):
@@ -53,3 +62,193 @@ async def test_login_and_register_errors(client):
     })
     assert resp.status_code == 401
     assert "Invalid credentials" in resp.text
+
+
+@pytest.mark.asyncio
+async def test_token_is_rejected_after_logout(client):
+    await client.post("/register", json={"email": "bob@example.com", "password": "secret123"})
+    resp = await client.post("/login", data={"email": "bob@example.com", "password": "secret123"})
+    token = resp.cookies["access_token"]
+
+    client.cookies.set("access_token", token)
+    resp = await client.get("/welcome")
+    assert resp.status_code == 200
+
+    await client.post("/logout")
+
+    # Replaying the old token must not authenticate anymore
+    client.cookies.set("access_token", token)
+    resp = await client.get("/welcome")
+    assert resp.status_code == 303
+    assert resp.headers["location"] == "/login"
+
+
+@pytest.mark.asyncio
+async def test_register_writes_notification_to_outbox(client, db_engine):
+    resp = await client.post("/register", json={"email": "carol@example.com", "password": "secret123"})
+    assert resp.status_code == 200
+
+    with Session(db_engine) as session:
+        notification = session.exec(select(Notification)).one()
+    assert notification.message == "New user registered: carol@example.com"
+    assert notification.dispatched_at is None
+
+    # a rejected registration must not leave an event behind
+    resp = await client.post("/register", json={"email": "carol@example.com", "password": "secret123"})
+    assert resp.status_code == 400
+    with Session(db_engine) as session:
+        assert len(session.exec(select(Notification)).all()) == 1
+
+
+@pytest.mark.asyncio
+async def test_sse_requires_login(client):
+    resp = await client.get("/sse/notifications")
+    assert resp.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_metrics_report_request_and_login_stages(client):
+    await client.post("/register", json={"email": "carol@example.com", "password": "secret123"})
+    await client.post("/login", data={"email": "carol@example.com", "password": "secret123"})
+
+    resp = await client.get("/metrics")
+
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = resp.text
+    assert 'http_requests_total{method="POST",route="/login",status="200"}' in body
+    assert 'password_hash_seconds_count{op="verify"}' in body
+    assert 'db_session_seconds_count{use="user_lookup"}' in body
+    assert 'db_session_seconds_count{use="register"}' in body
+    assert "noti_connections 0" in body
+
+
+@pytest.mark.asyncio
+async def test_pages_are_cached_and_revalidated(client):
+    resp = await client.get("/login", headers={"Accept-Encoding": "gzip"})
+    assert resp.status_code == 200
+    assert resp.headers["content-encoding"] == "gzip"
+    assert "<html" in resp.text.lower()
+
+    resp = await client.get("/login", headers={"Accept-Encoding": "gzip", "If-None-Match": resp.headers["etag"]})
+    assert resp.status_code == 304
+
+    resp = await client.get("/static/welcome.js", headers={"Accept-Encoding": "gzip"})
+    assert resp.status_code == 200
+    assert resp.headers["cache-control"].startswith("public, max-age=")
+
+    resp = await client.head("/static/welcome.js", headers={"Accept-Encoding": "br"})
+    assert resp.status_code == 200
+    assert resp.headers["content-encoding"] == "br"
+    assert resp.content == b""
+
+    resp = await client.get("/static/missing.js")
+    assert resp.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_admin_import_requires_token_and_imports_users(client, db_engine, monkeypatch):
+    body = '{"email": "dave@example.com", "password": "secret123"}\n{"email": "erin@example.com", "password": "secret123"}\n'
+
+    resp = await client.post("/admin/users/import?format=jsonl", content=body)
+    assert resp.status_code == 403
+
+    monkeypatch.setattr("app.api.admin.ADMIN_TOKEN", "admin-secret")
+    resp = await client.post("/admin/users/import?format=jsonl", content=body,
+                             headers={"X-Admin-Token": "admin-secret"})
+    assert resp.status_code == 200
+    assert resp.json()["imported"] == 2
+
+    # imported users can log in, and the import produced a single notification
+    resp = await client.post("/login", data={"email": "erin@example.com", "password": "secret123"})
+    assert resp.status_code == 200
+    with Session(db_engine) as session:
+        assert [n.message for n in session.exec(select(Notification)).all()] == ["2 users imported"]
+
+
+@pytest.mark.asyncio
+async def test_login_is_rate_limited_per_email(client, monkeypatch):
+    monkeypatch.setattr("app.services.rate_limit.rate_limiter.per_email", 2)
+    await client.post("/register", json={"email": "frank@example.com", "password": "secret123"})
+    # successful logins don't count toward the email's limit
+    for _ in range(3):
+        resp = await client.post("/login", data={"email": "frank@example.com", "password": "secret123"})
+        assert resp.status_code == 200
+    for _ in range(2):
+        resp = await client.post("/login", data={"email": "frank@example.com", "password": "wrong"})
+        assert resp.status_code == 401
+
+    resp = await client.post("/login", data={"email": "frank@example.com", "password": "wrong"})
+    assert resp.status_code == 429
+    assert int(resp.headers["retry-after"]) > 0
+
+
+@pytest.mark.asyncio
+async def test_register_counts_duplicate_emails(client, monkeypatch):
+    monkeypatch.setattr("app.services.rate_limit.rate_limiter.per_email", 1)
+    resp = await client.post("/register", json={"email": "ivan@example.com", "password": "secret123"})
+    assert resp.status_code == 200
+    resp = await client.post("/register", json={"email": "ivan@example.com", "password": "secret123"})
+    assert resp.status_code == 400
+
+    resp = await client.post("/register", json={"email": "ivan@example.com", "password": "secret123"})
+    assert resp.status_code == 429
+
+
+@pytest.mark.asyncio
+async def test_saturated_hashing_returns_503(client, mocker):
+    mocker.patch("app.services.user_service.hash_password_async", side_effect=HashPoolBusy(retry_after=2))
+
+    resp = await client.post("/register", json={"email": "gina@example.com", "password": "secret123"})
+
+    assert resp.status_code == 503
+    assert resp.headers["retry-after"] == "2"
+
+
+@pytest.mark.asyncio
+async def test_login_rehashes_password_with_current_cost(client, db_engine):
+    saved = pwd_context.to_dict()
+    set_bcrypt_rounds(5)
+    try:
+        with Session(db_engine) as session:
+            session.add(User(email="hank@example.com", hashed_password=get_password_hash("secret123", rounds=4)))
+            session.commit()
+
+        resp = await client.post("/login", data={"email": "hank@example.com", "password": "secret123"})
+        assert resp.status_code == 200
+        await drain_rehashes()
+
+        with Session(db_engine) as session:
+            hashed = session.exec(select(User).where(User.email == "hank@example.com")).one().hashed_password
+        assert hashed.startswith("$2b$05$")
+        resp = await client.post("/login", data={"email": "hank@example.com", "password": "secret123"})
+        assert resp.status_code == 200
+    finally:
+        pwd_context.load(saved)
+
+
+# Should log a just registered user in on another worker while the replica lags, through the recent write cookie
+@pytest.mark.asyncio
+async def test_login_after_register_reads_primary_on_any_worker(client, monkeypatch, tmp_path):
+    resp = await client.post("/register", json={"email": "frank@example.com", "password": "secret123"})
+    assert resp.status_code == 200
+    assert "recent_write" in resp.cookies
+    # secure cookies aren't sent back over the test's plain http by themselves
+    client.cookies.set("recent_write", resp.cookies["recent_write"])
+
+    # another worker: nothing noted in memory, its replica doesn't have the row yet
+    replica_path = tmp_path / "replica.db"
+    replica_sync = create_engine(f"sqlite:///{replica_path}")
+    SQLModel.metadata.create_all(replica_sync)
+    replica_sync.dispose()
+    replica = create_async_engine(f"sqlite+aiosqlite:///{replica_path}")
+    monkeypatch.setattr(database, "replica_router", ReplicaRouter(database.replica_router.primary, [replica]))
+    try:
+        resp = await client.post("/login", data={"email": "frank@example.com", "password": "secret123"})
+        assert resp.status_code == 200
+
+        client.cookies.delete("recent_write")
+        resp = await client.post("/login", data={"email": "frank@example.com", "password": "secret123"})
+        assert resp.status_code == 401
+    finally:
+        await replica.dispose()
@@ -0,0 +1,41 @@
+# tests/unit/conftest.py
+
+import pytest
+
+
+class FakeTimer:
+    """Clock passed as `timer` to the code under test, tests move it by setting `now`."""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def timer():
+    return FakeTimer()
+
+
+@pytest.fixture
+def make_websocket(mocker):
+    """Build WebSocket stubs whose `send` is an AsyncMock, optionally raising `side_effect`."""
+
+    def factory(side_effect=None):
+        websocket = mocker.MagicMock()
+        websocket.send = mocker.AsyncMock(side_effect=side_effect)
+        websocket.close = mocker.AsyncMock()
+        return websocket
+
+    return factory
+
+
+@pytest.fixture
+def sent():
+    """Payloads of the ASGI messages passed to a stub's websocket.send."""
+
+    def payloads(websocket):
+        return [c.args[0].get("text", c.args[0].get("bytes")) for c in websocket.send.await_args_list]
+
+    return payloads
@@ -0,0 +1,184 @@
+# tests/unit/test_cache.py
+
+import asyncio
+import threading
+import time
+
+import pytest
+from app.utils.cache import TTLCache
+
+
+# Should return cached values and count hits/misses
+def test_get_or_load_caches_value():
+    cache = TTLCache(maxsize=10, ttl=60)
+    calls = []
+
+    def loader(key):
+        calls.append(key)
+        return key.upper()
+
+    assert cache.get_or_load("a", loader) == "A"
+    assert cache.get_or_load("a", loader) == "A"
+    assert calls == ["a"]
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+# Should reload entries once their TTL has passed
+def test_entries_expire_after_ttl(timer):
+    cache = TTLCache(maxsize=10, ttl=5, timer=timer)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+
+    timer.now += 5
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+# Should evict the least recently used entry when full
+def test_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+# Should not cache None results
+def test_none_is_not_cached():
+    cache = TTLCache(maxsize=10, ttl=60)
+    calls = []
+
+    def loader(key):
+        calls.append(key)
+        return None
+
+    assert cache.get_or_load("a", loader) is None
+    assert cache.get_or_load("a", loader) is None
+    assert len(calls) == 2
+
+
+# Should collapse concurrent misses for one key into a single load
+def test_concurrent_misses_are_single_flight():
+    cache = TTLCache(maxsize=10, ttl=60)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def loader(key):
+        calls.append(key)
+        started.set()
+        release.wait(timeout=5)
+        return "value"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load("a", loader))) for _ in range(5)]
+    threads[0].start()
+    started.wait(timeout=5)
+    for t in threads[1:]:
+        t.start()
+    # give the waiters time to block on the in-flight load
+    time.sleep(0.05)
+    release.set()
+    for t in threads:
+        t.join(timeout=5)
+
+    assert calls == ["a"]
+    assert results == ["value"] * 5
+
+
+# Should propagate loader errors and allow a retry
+def test_loader_error_is_not_cached():
+    cache = TTLCache(maxsize=10, ttl=60)
+
+    def failing(key):
+        raise RuntimeError("db down")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_load("a", failing)
+    assert cache.get_or_load("a", lambda key: 1) == 1
+
+
+# A value loaded while the key was invalidated must not be stored
+def test_invalidate_during_load_discards_result():
+    cache = TTLCache(maxsize=10, ttl=60)
+
+    def loader(key):
+        cache.invalidate(key)
+        return "stale"
+
+    assert cache.get_or_load("a", loader) == "stale"
+    assert cache.get("a") is None
+
+
+# Concurrent async misses should share one loader call
+@pytest.mark.asyncio
+async def test_async_concurrent_misses_are_single_flight():
+    cache = TTLCache(maxsize=10, ttl=60)
+    release = asyncio.Event()
+    calls = []
+
+    async def loader(key):
+        calls.append(key)
+        await release.wait()
+        return "value"
+
+    tasks = [asyncio.create_task(cache.get_or_load_async("a", loader)) for _ in range(5)]
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await asyncio.gather(*tasks) == ["value"] * 5
+    assert calls == ["a"]
+    assert await cache.get_or_load_async("a", loader) == "value"
+    assert calls == ["a"]
+
+
+# Should propagate async loader errors to every waiter and allow a retry
+@pytest.mark.asyncio
+async def test_async_loader_error_is_not_cached():
+    cache = TTLCache(maxsize=10, ttl=60)
+
+    async def failing(key):
+        await asyncio.sleep(0)
+        raise RuntimeError("db down")
+
+    results = await asyncio.gather(
+        cache.get_or_load_async("a", failing), cache.get_or_load_async("a", failing), return_exceptions=True
+    )
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+    async def loader(key):
+        return 1
+
+    assert await cache.get_or_load_async("a", loader) == 1
+
+
+# Should let waiters load again when the owner is cancelled, instead of cancelling them too
+@pytest.mark.asyncio
+async def test_async_owner_cancellation_is_not_propagated():
+    cache = TTLCache(maxsize=10, ttl=60)
+    release = asyncio.Event()
+    calls = []
+
+    async def loader(key):
+        calls.append(key)
+        await release.wait()
+        return "value"
+
+    owner = asyncio.create_task(cache.get_or_load_async("a", loader))
+    await asyncio.sleep(0)
+    waiters = [asyncio.create_task(cache.get_or_load_async("a", loader)) for _ in range(3)]
+    await asyncio.sleep(0)
+    owner.cancel()
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await asyncio.gather(*waiters) == ["value"] * 3
+    assert owner.cancelled()
+    # one waiter took over the load
+    assert calls == ["a", "a"]
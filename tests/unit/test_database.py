@@ -0,0 +1,154 @@
+# tests/unit/test_database.py
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import create_engine, exc
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, Session
+
+from app import database
+from app.database import InstrumentedAsyncQueuePool, InstrumentedQueuePool, ReplicaRouter
+from app.models.user import User, UserRecord
+from app.services import user_service
+from app.services.user_service import get_user_by_email
+from app.utils.histogram import Histogram
+
+
+# Should count observations per bucket cumulatively
+def test_histogram_snapshot():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+
+    snapshot = histogram.snapshot()
+
+    assert snapshot["buckets"] == {0.1: 2, 1.0: 3, "+Inf": 4}
+    assert snapshot["count"] == 4
+    assert snapshot["sum"] == pytest.approx(3.65)
+
+
+# Should record checkout waits and count pool timeouts
+def test_pool_records_wait_time_and_timeouts(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=InstrumentedQueuePool, pool_size=1, max_overflow=0, pool_timeout=0.01,
+    )
+    conn = engine.connect()
+    with pytest.raises(exc.TimeoutError):
+        engine.connect()
+    conn.close()
+
+    stats = database._pool_stats(engine)
+
+    assert stats["timeouts"] == 1
+    assert stats["wait_time"]["count"] == 2
+    assert stats["checked_in"] == 1
+    engine.dispose()
+
+
+# Should open the requested connections concurrently so they all stay in the pool
+@pytest.mark.asyncio
+async def test_warm_up_pool_fills_pool(tmp_path, monkeypatch):
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'warm.db'}", poolclass=InstrumentedAsyncQueuePool, pool_size=3
+    )
+    monkeypatch.setattr(database, "async_engine", engine)
+
+    assert await database.warm_up_pool(3) == 3
+    assert engine.sync_engine.pool.checkedin() == 3
+    await engine.dispose()
+
+
+# Two SQLite files stand in for the primary and a replica that hasn't caught up
+@pytest_asyncio.fixture
+async def primary_and_replica(tmp_path):
+    engines = []
+    for name in ("primary", "replica"):
+        path = tmp_path / f"{name}.db"
+        sync_engine = create_engine(f"sqlite:///{path}")
+        SQLModel.metadata.create_all(sync_engine)
+        with Session(sync_engine) as session:
+            session.add(User(email="both@example.com", hashed_password=name))
+            if name == "primary":
+                session.add(User(email="new@example.com", hashed_password=name))
+            session.commit()
+        sync_engine.dispose()
+        engines.append(create_async_engine(f"sqlite+aiosqlite:///{path}"))
+    yield engines
+    for engine in engines:
+        await engine.dispose()
+
+
+# Should read from the replica and take its misses as final, without a query on the primary
+@pytest.mark.asyncio
+async def test_reads_go_to_replica_without_fallback_on_miss(primary_and_replica, monkeypatch, mocker):
+    primary, replica = primary_and_replica
+    monkeypatch.setattr(database, "replica_router", ReplicaRouter(primary, [replica]))
+    fetch = mocker.spy(user_service, "_fetch_user")
+
+    user = await get_user_by_email("both@example.com")
+    assert isinstance(user, UserRecord)
+    assert user.hashed_password == "replica"
+    assert await get_user_by_email("missing@example.com") is None
+    # not replicated yet and not written by this worker
+    assert await get_user_by_email("new@example.com") is None
+    assert all(c.args[0] is replica for c in fetch.call_args_list)
+
+
+# Should retry on the primary when the replica fails
+@pytest.mark.asyncio
+async def test_replica_error_falls_back_to_primary(primary_and_replica, monkeypatch, tmp_path):
+    primary, _ = primary_and_replica
+    broken = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'missing' / 'replica.db'}")
+    router = ReplicaRouter(primary, [broken])
+    monkeypatch.setattr(database, "replica_router", router)
+
+    assert (await get_user_by_email("new@example.com")).hashed_password == "primary"
+    assert router.healthy_replicas() == []
+    await broken.dispose()
+
+
+# Should read a just written key from the primary until the window passes
+@pytest.mark.asyncio
+async def test_read_your_writes_sticks_to_primary(primary_and_replica, monkeypatch):
+    primary, replica = primary_and_replica
+    router = ReplicaRouter(primary, [replica])
+    monkeypatch.setattr(database, "replica_router", router)
+
+    router.note_write("both@example.com")
+
+    assert router.read_engine("both@example.com") is primary
+    assert (await get_user_by_email("both@example.com")).hashed_password == "primary"
+    assert router.read_engine("other@example.com") is replica
+
+
+# Should read the key of another worker's write from the primary inside stick_to_primary only
+@pytest.mark.asyncio
+async def test_stick_to_primary(primary_and_replica, monkeypatch):
+    primary, replica = primary_and_replica
+    router = ReplicaRouter(primary, [replica])
+    monkeypatch.setattr(database, "replica_router", router)
+
+    with router.stick_to_primary("new@example.com"):
+        assert (await get_user_by_email("new@example.com")).hashed_password == "primary"
+        assert router.read_engine("both@example.com") is replica
+    assert await get_user_by_email("new@example.com") is None
+
+
+# Should rotate over healthy replicas and skip the ones failing health checks
+@pytest.mark.asyncio
+async def test_round_robin_skips_unhealthy_replicas(primary_and_replica, tmp_path):
+    primary, replica = primary_and_replica
+    broken = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'missing' / 'replica.db'}")
+    router = ReplicaRouter(primary, [replica, broken])
+
+    assert {router.read_engine(), router.read_engine()} == {replica, broken}
+
+    await router.check()
+
+    assert router.healthy_replicas() == [replica]
+    assert {router.read_engine(), router.read_engine()} == {replica}
+
+    router.mark_down(replica)
+    assert router.read_engine() is primary
+    await broken.dispose()
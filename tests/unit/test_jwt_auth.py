@@ -1,61 +1,184 @@
 import pytest
 import jwt
-from fastapi import WebSocket
-from app.services.jwt_auth import extract_email_from_ws_cookie, load_user
+from datetime import timedelta
+from fastapi import HTTPException, WebSocket
+from starlette.requests import Request
+from app.services.jwt_auth import (
+    extract_email_from_ws_cookie,
+    load_user,
+    invalidate_user,
+    user_cache,
+    create_user_token,
+    authenticate_request,
+    revoke_request_token,
+    revocation_store,
+    manager,
+    SECRET_KEY,
+    TOKEN_VERSION,
+)
 from app.models.user import User
 
 
-def test_extract_email_exceptions(mocker):
+@pytest.fixture(autouse=True)
+def clear_user_cache():
+    user_cache.clear()
+    yield
+    user_cache.clear()
+    revocation_store.clear()
+
+
+@pytest.mark.asyncio
+async def test_extract_email_exceptions(mocker):
     websocket = mocker.Mock()
 
     # Case 1: Missing token
     websocket.cookies = {}
     with pytest.raises(ValueError, match="Missing token"):
-        extract_email_from_ws_cookie(websocket)
+        await extract_email_from_ws_cookie(websocket)
 
     # Case 2: Invalid token
     websocket.cookies = {"access_token": "invalid"}
     mocker.patch("app.services.jwt_auth.jwt.decode", side_effect=jwt.DecodeError("bad token"))
     with pytest.raises(jwt.DecodeError):
-        extract_email_from_ws_cookie(websocket)
+        await extract_email_from_ws_cookie(websocket)
 
     # Case 3: Missing 'sub'
     mocker.patch("app.services.jwt_auth.jwt.decode", return_value={})
     with pytest.raises(ValueError, match="Missing 'sub' in token"):
-        extract_email_from_ws_cookie(websocket)
+        await extract_email_from_ws_cookie(websocket)
+
+
+def _mock_lookup(mocker, result):
+    return mocker.patch("app.services.jwt_auth.get_user_by_email", return_value=result)
 
 
 # Should return user if found in DB
-def test_load_user_found(mocker):
+@pytest.mark.asyncio
+async def test_load_user_found(mocker):
     mock_user = User(email="user@example.com", hashed_password="xxx")
-    mock_query = mocker.MagicMock()
-    mock_query.first.return_value = mock_user
+    _mock_lookup(mocker, mock_user)
 
-    mock_session = mocker.MagicMock()
-    mock_session.exec.return_value = mock_query
-    mock_session.__enter__.return_value = mock_session
-    mock_session.__exit__.return_value = None
+    user = await load_user("user@example.com")
 
-    mocker.patch("app.services.jwt_auth.Session", return_value=mock_session)
+    assert user.email == "user@example.com"
 
-    user = load_user("user@example.com")
 
-    assert user.email == "user@example.com"
+# Should return None if user not found
+@pytest.mark.asyncio
+async def test_load_user_not_found(mocker):
+    _mock_lookup(mocker, None)
 
+    user = await load_user("nonexist@example.com")
 
+    assert user is None
 
-# Should return None if user not found
-def test_load_user_not_found(mocker):
-    mock_query = mocker.MagicMock()
-    mock_query.first.return_value = None
 
-    mock_session = mocker.MagicMock()
-    mock_session.exec.return_value = mock_query
-    mock_session.__enter__.return_value = mock_session
-    mock_session.__exit__.return_value = None
+# Should serve repeated lookups from the cache until invalidated
+@pytest.mark.asyncio
+async def test_load_user_is_cached(mocker):
+    mock_user = User(email="cached@example.com", hashed_password="xxx")
+    lookup = _mock_lookup(mocker, mock_user)
 
-    mocker.patch("app.services.jwt_auth.Session", return_value=mock_session)
+    assert await load_user("cached@example.com") is mock_user
+    assert await load_user("cached@example.com") is mock_user
+    assert lookup.call_count == 1
 
-    user = load_user("nonexist@example.com")
+    invalidate_user("cached@example.com")
+    await load_user("cached@example.com")
+    assert lookup.call_count == 2
 
-    assert user is None
+
+def _request_with_token(token):
+    return Request({"type": "http", "headers": [(b"cookie", f"access_token={token}".encode())]})
+
+
+# Should embed id and version claims only in stateless mode
+def test_create_user_token_claims(mocker):
+    user = User(id=7, email="user@example.com", hashed_password="xxx")
+
+    payload = jwt.decode(create_user_token(user, timedelta(minutes=5)), SECRET_KEY, algorithms=["HS256"])
+    assert "uid" not in payload
+
+    mocker.patch("app.services.jwt_auth.JWT_STATELESS_AUTH", True)
+    payload = jwt.decode(create_user_token(user, timedelta(minutes=5)), SECRET_KEY, algorithms=["HS256"])
+    assert payload["sub"] == "user@example.com"
+    assert payload["uid"] == 7
+    assert payload["ver"] == TOKEN_VERSION
+
+
+# Should authorize from claims without loading the user
+@pytest.mark.asyncio
+async def test_authenticate_request_stateless_skips_db(mocker):
+    mocker.patch("app.services.jwt_auth.JWT_STATELESS_AUTH", True)
+    user = User(id=7, email="user@example.com", hashed_password="xxx")
+    token = create_user_token(user, timedelta(minutes=5))
+    loader = mocker.patch("app.services.jwt_auth._query_user")
+
+    identity = await authenticate_request(_request_with_token(token))
+
+    assert identity.email == "user@example.com"
+    assert identity.user_id == 7
+    loader.assert_not_called()
+
+
+# Should fall back to the DB when the token version is stale
+@pytest.mark.asyncio
+async def test_authenticate_request_stale_version_loads_user(mocker):
+    mocker.patch("app.services.jwt_auth.JWT_STATELESS_AUTH", True)
+    user = User(id=7, email="user@example.com", hashed_password="xxx")
+    token = create_user_token(user, timedelta(minutes=5))
+    mocker.patch("app.services.jwt_auth.TOKEN_VERSION", TOKEN_VERSION + 1)
+    loader = mocker.patch("app.services.jwt_auth._query_user", return_value=user)
+
+    identity = await authenticate_request(_request_with_token(token))
+
+    assert identity.email == "user@example.com"
+    loader.assert_called_once_with("user@example.com")
+
+
+# Should reject a websocket token without current claims when the user is gone
+@pytest.mark.asyncio
+async def test_extract_email_stateless_unknown_user(mocker):
+    mocker.patch("app.services.jwt_auth.JWT_STATELESS_AUTH", True)
+    mocker.patch("app.services.jwt_auth._query_user", return_value=None)
+    websocket = mocker.Mock()
+    websocket.cookies = {"access_token": manager.create_access_token(data={"sub": "gone@example.com"})}
+
+    with pytest.raises(ValueError, match="Unknown user"):
+        await extract_email_from_ws_cookie(websocket)
+
+
+# Should reject a token after it has been revoked
+@pytest.mark.asyncio
+async def test_revoked_token_is_rejected(mocker):
+    mocker.patch("app.services.jwt_auth.JWT_STATELESS_AUTH", True)
+    user = User(id=7, email="user@example.com", hashed_password="xxx")
+    token = create_user_token(user, timedelta(minutes=5))
+    request = _request_with_token(token)
+    websocket = mocker.Mock()
+    websocket.cookies = {"access_token": token}
+
+    assert (await authenticate_request(request)).email == "user@example.com"
+
+    await revoke_request_token(request)
+
+    with pytest.raises(HTTPException):
+        await authenticate_request(request)
+    with pytest.raises(ValueError, match="Token revoked"):
+        await extract_email_from_ws_cookie(websocket)
+
+
+# Should revoke the user's older tokens with the logged out one, and accept tokens issued afterwards
+@pytest.mark.asyncio
+async def test_revocation_covers_older_tokens_only(mocker):
+    mocker.patch("app.services.jwt_auth.JWT_STATELESS_AUTH", True)
+    user = User(id=7, email="user@example.com", hashed_password="xxx")
+    other_tab = _request_with_token(create_user_token(user, timedelta(minutes=5)))
+    request = _request_with_token(create_user_token(user, timedelta(minutes=5)))
+
+    await revoke_request_token(request)
+    fresh = _request_with_token(create_user_token(user, timedelta(minutes=5)))
+
+    with pytest.raises(HTTPException):
+        await authenticate_request(other_tab)
+    assert (await authenticate_request(fresh)).email == "user@example.com"
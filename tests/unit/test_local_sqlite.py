@@ -0,0 +1,31 @@
+# tests/unit/test_local_sqlite.py
+
+import threading
+
+from app.utils.local_sqlite import LocalSqlite, sqlite_url_path
+
+
+# Should take the file of sqlite:/// urls only
+def test_sqlite_url_path():
+    assert sqlite_url_path("sqlite:///tmp/state.db") == "tmp/state.db"
+    assert sqlite_url_path("sqlite:////var/lib/state.db") == "/var/lib/state.db"
+    assert sqlite_url_path("memory") is None
+    assert sqlite_url_path("redis://localhost") is None
+
+
+# Should open one connection per thread and close them all at once
+def test_connection_per_thread(tmp_path):
+    db = LocalSqlite(str(tmp_path / "state.db"))
+    main = db.connect()
+    other = []
+    thread = threading.Thread(target=lambda: other.append(db.connect()))
+    thread.start()
+    thread.join()
+
+    assert db.connect() is main
+    assert other[0] is not main
+    assert main.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+
+    db.close()
+    assert db.connect() is not main
+    db.close()
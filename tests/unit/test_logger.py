@@ -0,0 +1,42 @@
+# tests/unit/test_logger.py
+
+import json
+import logging
+
+from app.logger import JsonFormatter, RateLimitFilter, parse_rate_limits
+
+
+def _record(name: str, level: int = logging.INFO, msg: str = "hello %s", args=("world",)):
+    return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+
+# Should render one JSON object with the formatted message
+def test_json_formatter():
+    line = JsonFormatter().format(_record("app.api.user"))
+
+    entry = json.loads(line)
+    assert entry["message"] == "hello world"
+    assert entry["logger"] == "app.api.user"
+    assert entry["level"] == "INFO"
+
+
+# Should parse "module=rate" pairs
+def test_parse_rate_limits():
+    assert parse_rate_limits("app.services=5, app.api.user=0.5") == {"app.services": 5.0, "app.api.user": 0.5}
+    assert parse_rate_limits("") == {}
+
+
+# Should drop INFO records above the rate, keep warnings and report the suppressed count
+def test_rate_limit_filter(timer):
+    rate_filter = RateLimitFilter({"app.services": 2}, timer=timer)
+
+    passed = [rate_filter.filter(_record("app.services.noti_service")) for _ in range(5)]
+    assert passed == [True, True, False, False, False]
+    assert rate_filter.filter(_record("app.services.noti_service", level=logging.WARNING))
+    # other modules are not limited
+    assert rate_filter.filter(_record("app.api.user"))
+
+    timer.now += 1.0
+    record = _record("app.services.outbox")
+    assert rate_filter.filter(record)
+    assert "3 similar records suppressed" in record.getMessage()
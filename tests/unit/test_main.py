@@ -0,0 +1,24 @@
+# tests/unit/test_main.py
+
+from app import __main__
+
+
+# Should have the server send protocol pings on the heartbeat settings, so text clients are checked too
+def test_serve_configures_protocol_pings(mocker, monkeypatch):
+    run = mocker.patch.object(__main__.uvicorn, "run")
+    load_env = mocker.patch("app.config.load_env")
+    monkeypatch.setenv("NOTI_PING_INTERVAL", "10")
+    monkeypatch.setenv("NOTI_MAX_MISSED_PONGS", "3")
+
+    __main__.serve(None)
+
+    # .env files are read before the settings
+    load_env.assert_called_once()
+    assert run.call_args.kwargs["ws_ping_interval"] == 10
+    assert run.call_args.kwargs["ws_ping_timeout"] == 30
+
+    monkeypatch.setenv("NOTI_PING_INTERVAL", "0")
+    __main__.serve(None)
+
+    assert run.call_args.kwargs["ws_ping_interval"] is None
+    assert run.call_args.kwargs["ws_ping_timeout"] is None
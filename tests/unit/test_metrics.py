@@ -0,0 +1,66 @@
+# tests/unit/test_metrics.py
+
+import threading
+
+from app.utils.metrics import Registry
+
+
+# Should render counters per label set in Prometheus text format
+def test_counter_render():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests", ("route",))
+    requests.labels("/login").inc()
+    requests.labels("/login").inc(2)
+    requests.labels('/a"b').inc()
+
+    body = registry.render()
+
+    assert "# TYPE requests_total counter" in body
+    assert 'requests_total{route="/login"} 3' in body
+    assert 'requests_total{route="/a\\"b"} 1' in body
+
+
+# Should render cumulative buckets, sum and count
+def test_histogram_render():
+    registry = Registry()
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    latency.observe(0.05)
+    latency.observe(0.5)
+    with latency.time():
+        pass
+
+    body = registry.render()
+
+    assert 'latency_seconds_bucket{le="0.1"} 2' in body
+    assert 'latency_seconds_bucket{le="1"} 3' in body
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in body
+    assert "latency_seconds_count 3" in body
+
+
+# Should read callback values only when rendering
+def test_callback_render():
+    registry = Registry()
+    state = {"connections": 1}
+    registry.callback("gauge", "connections", "Open connections", lambda: {(): state["connections"]})
+
+    state["connections"] = 5
+
+    assert "connections 5" in registry.render()
+
+
+# Should not lose increments made concurrently from several threads
+def test_counter_is_exact_across_threads():
+    registry = Registry()
+    counter = registry.counter("events_total", "Events")
+
+    def work():
+        for _ in range(10000):
+            counter.inc()
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert "events_total 40000" in registry.render()
@@ -0,0 +1,87 @@
+# tests/unit/test_noti_bus.py
+
+import asyncio
+import json
+import sqlite3
+import time
+
+import pytest
+from app.services.noti_bus import InProcessBus, SqliteBus, create_notification_bus
+from app.services.noti_service import NotificationManager
+
+
+# Should hand published events straight to the bound callback
+def test_in_process_bus_delivers_locally():
+    bus = InProcessBus()
+    received = []
+    bus.bind(received.extend)
+    bus.publish({"message": "hi"})
+    assert received == [{"message": "hi"}]
+
+
+# Should reach sockets held by a manager in another worker
+@pytest.mark.asyncio
+async def test_sqlite_bus_reaches_other_workers(tmp_path, make_websocket, sent):
+    path = str(tmp_path / "bus.db")
+    worker_a = NotificationManager(bus=SqliteBus(path, poll_interval=0.01))
+    worker_b = NotificationManager(bus=SqliteBus(path, poll_interval=0.01))
+    await worker_a.start()
+    await worker_b.start()
+    ws_a = make_websocket()
+    ws_b = make_websocket()
+    await worker_a.subscribe("a@example.com", ws_a)
+    await worker_b.subscribe("b@example.com", ws_b)
+
+    try:
+        await worker_a.broadcast("Hello")
+        await worker_a.broadcast("World")
+        for _ in range(100):
+            if len(sent(ws_b)) == 2:
+                break
+            await asyncio.sleep(0.01)
+        await worker_a.drain()
+        await worker_b.drain()
+    finally:
+        await worker_a.close()
+        await worker_b.close()
+
+    # local subscribers get it once, without a round trip through the bus
+    assert sent(ws_a) == ["Hello", "World"]
+    assert sent(ws_b) == ["Hello", "World"]
+
+
+# Should let a running exchange finish before the final flush and close
+@pytest.mark.asyncio
+async def test_sqlite_bus_stop_waits_for_running_exchange(tmp_path):
+    bus = SqliteBus(str(tmp_path / "bus.db"), poll_interval=0.01)
+    bus.bind(lambda events: None)
+    exchange = bus._exchange
+    running, overlaps = 0, []
+
+    def slow_exchange(outgoing):
+        nonlocal running
+        running += 1
+        overlaps.append(running)
+        time.sleep(0.05)
+        try:
+            return exchange(outgoing)
+        finally:
+            running -= 1
+
+    bus._exchange = slow_exchange
+    await bus.start()
+    bus.publish({"message": "first"})
+    await asyncio.sleep(0.02)
+    bus.publish({"message": "last"})
+    await bus.stop()
+
+    assert max(overlaps) == 1
+    conn = sqlite3.connect(tmp_path / "bus.db")
+    assert [json.loads(p)["message"] for p, in conn.execute("SELECT payload FROM noti_bus ORDER BY id")] == [
+        "first", "last"]
+    conn.close()
+
+
+def test_create_notification_bus_rejects_unknown_url():
+    with pytest.raises(ValueError):
+        create_notification_bus("amqp://localhost")
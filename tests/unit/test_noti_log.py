@@ -0,0 +1,144 @@
+# tests/unit/test_noti_log.py
+
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel, Session, create_engine
+
+from app.models.notification import Notification
+from app.services.noti_bus import InProcessBus
+from app.services.noti_log import NotificationLog
+from app.services.noti_service import NotificationManager
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+def add_notifications(engine, count):
+    with Session(engine) as session:
+        for i in range(count):
+            session.add(Notification(message=f"event {i + 1}", dispatched_at=datetime.now(timezone.utc)))
+        session.commit()
+
+
+# Should keep the newest events in id order and skip duplicates
+def test_ring_buffer_since():
+    log = NotificationLog(size=3)
+    for i in (1, 2, 2, 3, 4):
+        log.append({"id": i, "message": f"event {i}"})
+
+    assert len(log) == 3
+    assert log.oldest_id() == 2
+    assert [e["id"] for e in log.since(2)] == [3, 4]
+    assert log.since(4) == []
+
+
+# Should keep ids that arrive late, e.g. outbox batches relayed by another worker
+def test_ring_buffer_accepts_late_ids():
+    log = NotificationLog(size=4)
+    for i in (1, 2, 5, 3, 5, 4, 0):
+        log.append({"id": i, "message": f"event {i}"})
+
+    assert [e["id"] for e in log.since(0)] == [2, 3, 4, 5]
+    assert [e["id"] for e in log.since(2)] == [3, 4, 5]
+
+
+# Should read the newest dispatched rows of a range from the database
+@pytest.mark.asyncio
+async def test_read_range_from_database(engine):
+    add_notifications(engine, 5)
+    log = NotificationLog(engine=engine)
+
+    assert [e["id"] for e in await log.read_range(1, 5, limit=10)] == [2, 3, 4]
+    assert [e["id"] for e in await log.read_range(0, None, limit=2)] == [4, 5]
+
+
+# Should replay missed events from the ring buffer before live ones, without a DB query
+@pytest.mark.asyncio
+async def test_subscribe_replays_from_ring(mocker, make_websocket, sent):
+    log = NotificationLog()
+    read_range = mocker.patch.object(log, "read_range")
+    manager = NotificationManager(bus=InProcessBus(), log=log)
+    for i in range(1, 4):
+        await manager.broadcast(f"event {i}", id=i)
+
+    websocket = make_websocket()
+    try:
+        await manager.subscribe("user@example.com", websocket, last_id=1)
+        await manager.broadcast("event 4", id=4)
+        await manager.drain()
+    finally:
+        await manager.close()
+
+    assert sent(websocket) == ["event 2", "event 3", "event 4"]
+    read_range.assert_not_called()
+
+
+# Should fall back to the database for events older than the ring buffer
+@pytest.mark.asyncio
+async def test_subscribe_replays_from_database(engine, make_websocket, sent):
+    add_notifications(engine, 5)
+    manager = NotificationManager(bus=InProcessBus(), log=NotificationLog(size=2, engine=engine), replay_limit=3)
+    await manager.broadcast("event 4", id=4)
+    await manager.broadcast("event 5", id=5)
+
+    websocket = make_websocket()
+    try:
+        await manager.subscribe("user@example.com", websocket, format="json", last_id=0)
+        await manager.drain()
+    finally:
+        await manager.close()
+
+    # only the newest replay_limit events are sent
+    assert sent(websocket) == [
+        '{"id":3,"message":"event 3"}',
+        '{"id":4,"message":"event 4"}',
+        '{"id":5,"message":"event 5"}',
+    ]
+
+
+# Should fill the ring from the database on start, so reconnects after a restart skip the database
+@pytest.mark.asyncio
+async def test_start_loads_ring_from_database(engine, mocker, make_websocket, sent):
+    add_notifications(engine, 5)
+    log = NotificationLog(size=3, engine=engine)
+    manager = NotificationManager(bus=InProcessBus(), log=log)
+    await manager.start()
+    read_range = mocker.spy(log, "read_range")
+
+    behind, current = make_websocket(), make_websocket()
+    try:
+        assert log.oldest_id() == 3 and log.newest_id() == 5
+        await manager.subscribe("user@example.com", behind, last_id=3)
+        await manager.subscribe("user@example.com", current, last_id=5)
+        await manager.drain()
+    finally:
+        await manager.close()
+
+    assert sent(behind) == ["event 4", "event 5"]
+    assert sent(current) == []
+    read_range.assert_not_called()
+
+
+# Should subscribe the client to live events when the replay read fails, without closing it
+@pytest.mark.asyncio
+async def test_replay_failure_keeps_live_delivery(mocker, make_websocket, sent):
+    log = NotificationLog()
+    mocker.patch.object(log, "read_range", side_effect=RuntimeError("database unreachable"))
+    manager = NotificationManager(bus=InProcessBus(), log=log)
+
+    websocket = make_websocket()
+    try:
+        await manager.subscribe("user@example.com", websocket, last_id=1)
+        await manager.broadcast("event 2", id=2)
+        await manager.drain()
+    finally:
+        await manager.close()
+
+    assert sent(websocket) == ["event 2"]
+    websocket.close.assert_not_called()
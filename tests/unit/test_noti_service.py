@@ -1,24 +1,46 @@
 # tests/unit/test_noti_service.py
 
+import asyncio
+import json
+
 import pytest
-from app.services.noti_service import NotificationManager
+from starlette.requests import Request
+
+from app.api import user
+from app.services.noti_service import Frame, NotificationManager
+
+
+@pytest.fixture
+async def managers():
+    created = []
+
+    def factory(**kwargs):
+        manager = NotificationManager(**kwargs)
+        created.append(manager)
+        return manager
+
+    yield factory
+    for manager in created:
+        await manager.close()
+    await asyncio.sleep(0)
 
 
 # Should store websocket in active_connections after subscribe
 @pytest.mark.asyncio
-async def test_subscribe_adds_connection(mocker):
-    manager = NotificationManager()
-    websocket = mocker.MagicMock()
-    websocket.send_text = mocker.AsyncMock()
-    await manager.subscribe("user@example.com", websocket)
+async def test_subscribe_adds_connection(managers, make_websocket):
+    manager = managers()
+    websocket = make_websocket()
+    subscription = await manager.subscribe("user@example.com", websocket)
     assert "user@example.com" in manager.active_connections
-    assert manager.active_connections["user@example.com"] == websocket
+    assert manager.active_connections["user@example.com"] == {subscription}
+    assert subscription.websocket == websocket
 
 
 # Should remove websocket from active_connections
-def test_unsubscribe_removes_connection(mocker):
-    manager = NotificationManager()
-    manager.active_connections["user@example.com"] = mocker.MagicMock()
+@pytest.mark.asyncio
+async def test_unsubscribe_removes_connection(managers, make_websocket):
+    manager = managers()
+    await manager.subscribe("user@example.com", make_websocket())
     manager.unsubscribe("user@example.com")
     assert "user@example.com" not in manager.active_connections
 
@@ -32,35 +54,289 @@ def test_unsubscribe_nonexistent_key(mocker):
 
 # Should broadcast message to all websockets
 @pytest.mark.asyncio
-async def test_broadcast_sends_to_all(mocker):
-    manager = NotificationManager()
-    ws1 = mocker.MagicMock()
-    ws1.send_text = mocker.AsyncMock()
-    ws2 = mocker.MagicMock()
-    ws2.send_text = mocker.AsyncMock()
-    manager.active_connections = {
-        "user1@example.com": ws1,
-        "user2@example.com": ws2,
-    }
+async def test_broadcast_sends_to_all(managers, make_websocket, sent):
+    manager = managers()
+    ws1 = make_websocket()
+    ws2 = make_websocket()
+    await manager.subscribe("user1@example.com", ws1)
+    await manager.subscribe("user2@example.com", ws2)
     await manager.broadcast("Hello")
-    ws1.send_text.assert_awaited_once_with("Hello")
-    ws2.send_text.assert_awaited_once_with("Hello")
+    await manager.drain()
+    assert sent(ws1) == ["Hello"]
+    assert sent(ws2) == ["Hello"]
 
 
-# Should remove connection if send_text raises exception
+# Should remove connection if send raises exception
 @pytest.mark.asyncio
-async def test_broadcast_handles_send_failure(mocker):
-    manager = NotificationManager()
-    good_ws = mocker.MagicMock()
-    good_ws.send_text = mocker.AsyncMock()
-    bad_ws = mocker.MagicMock()
-    bad_ws.send_text = mocker.AsyncMock(side_effect=Exception("fail"))
-    manager.active_connections = {
-        "good@example.com": good_ws,
-        "bad@example.com": bad_ws,
-    }
+async def test_broadcast_handles_send_failure(managers, make_websocket, sent):
+    manager = managers()
+    good_ws = make_websocket()
+    bad_ws = make_websocket(side_effect=Exception("fail"))
+    await manager.subscribe("good@example.com", good_ws)
+    await manager.subscribe("bad@example.com", bad_ws)
     await manager.broadcast("Notify")
+    await manager.drain()
     assert "good@example.com" in manager.active_connections
     assert "bad@example.com" not in manager.active_connections
-    good_ws.send_text.assert_awaited_once_with("Notify")
-    bad_ws.send_text.assert_awaited_once_with("Notify")
+    assert sent(good_ws) == ["Notify"]
+    assert sent(bad_ws) == ["Notify"]
+
+
+# A stalled client must not delay broadcast or the other subscribers
+@pytest.mark.asyncio
+async def test_broadcast_does_not_wait_for_slow_client(managers, make_websocket, sent):
+    manager = managers(send_timeout=0.05)
+    stalled = asyncio.Event()
+
+    async def hang(message):
+        await stalled.wait()
+
+    slow_ws = make_websocket(side_effect=hang)
+    fast_ws = make_websocket()
+    await manager.subscribe("slow@example.com", slow_ws)
+    await manager.subscribe("fast@example.com", fast_ws)
+
+    await asyncio.wait_for(manager.broadcast("Hello"), timeout=0.01)
+    await asyncio.sleep(0)
+    assert sent(fast_ws) == ["Hello"]
+
+    # the slow client is evicted once its send times out
+    await manager.drain()
+    assert "slow@example.com" not in manager.active_connections
+    assert "fast@example.com" in manager.active_connections
+
+
+# Should apply the overflow policy when a client's queue is full
+@pytest.mark.asyncio
+async def test_broadcast_queue_overflow_policies(managers, make_websocket):
+    never = asyncio.Event()
+
+    async def hang(message):
+        await never.wait()
+
+    manager = managers(queue_size=1, overflow_policy="drop_message")
+    await manager.subscribe("slow@example.com", make_websocket(side_effect=hang))
+    for _ in range(3):
+        await manager.broadcast("Hello")
+    assert "slow@example.com" in manager.active_connections
+
+    manager = managers(queue_size=1, overflow_policy="disconnect")
+    await manager.subscribe("slow@example.com", make_websocket(side_effect=hang))
+    for _ in range(3):
+        await manager.broadcast("Hello")
+    assert "slow@example.com" not in manager.active_connections
+
+
+def test_unknown_overflow_policy():
+    with pytest.raises(ValueError):
+        NotificationManager(overflow_policy="block")
+
+
+# A second tab must not replace or be removed with the first one
+@pytest.mark.asyncio
+async def test_multiple_sockets_per_user(managers, make_websocket, sent):
+    manager = managers()
+    tab1 = make_websocket()
+    tab2 = make_websocket()
+    sub1 = await manager.subscribe("user@example.com", tab1)
+    sub2 = await manager.subscribe("user@example.com", tab2)
+    assert manager.active_connections["user@example.com"] == {sub1, sub2}
+
+    manager.unsubscribe_connection(sub1)
+    assert manager.active_connections["user@example.com"] == {sub2}
+
+    await manager.broadcast("Hello")
+    await manager.drain()
+    assert sent(tab1) == []
+    assert sent(tab2) == ["Hello"]
+
+    manager.unsubscribe("user@example.com")
+    assert "user@example.com" not in manager.active_connections
+    assert not manager.connections
+
+
+# Should only reach the target user's sockets
+@pytest.mark.asyncio
+async def test_send_to_user(managers, make_websocket, sent):
+    manager = managers()
+    alice_tab1 = make_websocket()
+    alice_tab2 = make_websocket()
+    bob = make_websocket()
+    await manager.subscribe("alice@example.com", alice_tab1)
+    await manager.subscribe("alice@example.com", alice_tab2)
+    await manager.subscribe("bob@example.com", bob)
+
+    await manager.send_to_user("alice@example.com", "Hi Alice")
+    await manager.drain()
+
+    assert sent(alice_tab1) == ["Hi Alice"]
+    assert sent(alice_tab2) == ["Hi Alice"]
+    assert sent(bob) == []
+
+
+# Should only reach sockets subscribed to the topic
+@pytest.mark.asyncio
+async def test_publish_to_topic(managers, make_websocket, sent):
+    manager = managers()
+    admin = make_websocket()
+    other = make_websocket()
+    admin_sub = await manager.subscribe("admin@example.com", admin, topics=["signups"])
+    await manager.subscribe("other@example.com", other)
+
+    await manager.publish("signups", "New signup")
+    await manager.drain()
+    assert sent(admin) == ["New signup"]
+    assert sent(other) == []
+
+    manager.unsubscribe_topic(admin_sub, "signups")
+    assert "signups" not in manager.topics
+    manager.unsubscribe_connection(admin_sub)
+    assert not manager.topics
+
+
+# Should serialize a frame once per format and share it between recipients
+@pytest.mark.asyncio
+async def test_frames_are_shared_between_recipients(managers, make_websocket, sent):
+    manager = managers()
+    ws1 = make_websocket()
+    ws2 = make_websocket()
+    ws_json = make_websocket()
+    await manager.subscribe("user1@example.com", ws1, binary=True)
+    await manager.subscribe("user2@example.com", ws2, binary=True)
+    await manager.subscribe("user3@example.com", ws_json, format="json")
+
+    await manager.broadcast("Hello")
+    await manager.drain()
+
+    assert ws1.send.await_args.args[0] is ws2.send.await_args.args[0]
+    assert sent(ws1) == [b"Hello"]
+    assert json.loads(sent(ws_json)[0]) == {"message": "Hello"}
+
+
+# Should gather broadcasts within the window into one frame per socket
+@pytest.mark.asyncio
+async def test_coalescing_batches_broadcasts(managers, make_websocket, sent):
+    manager = managers(coalesce_window=0.02, coalesce_max_batch=100)
+    websocket = make_websocket()
+    json_ws = make_websocket()
+    await manager.subscribe("user@example.com", websocket)
+    await manager.subscribe("json@example.com", json_ws, format="json")
+
+    for i in range(3):
+        await manager.broadcast(f"event {i}", id=i + 1)
+    assert sent(websocket) == []
+
+    await asyncio.sleep(0.05)
+    await manager.drain()
+    assert sent(websocket) == ["event 0\nevent 1\nevent 2"]
+    assert json.loads(sent(json_ws)[0]) == {
+        "events": [{"id": 1, "message": "event 0"}, {"id": 2, "message": "event 1"}, {"id": 3, "message": "event 2"}]
+    }
+
+
+# Should send a full batch without waiting for the window, a lone event keeps the default format
+@pytest.mark.asyncio
+async def test_coalescing_flushes_on_max_batch(managers, make_websocket, sent):
+    manager = managers(coalesce_window=60, coalesce_max_batch=2)
+    websocket = make_websocket()
+    await manager.subscribe("user@example.com", websocket)
+
+    await manager.broadcast("a")
+    await manager.broadcast("b")
+    await manager.broadcast("c")
+    await asyncio.sleep(0)
+    assert sent(websocket) == ["a\nb"]
+
+    await manager.drain()
+    assert sent(websocket) == ["a\nb", "c"]
+
+
+# Should ping json clients and evict them after too many missed pongs
+@pytest.mark.asyncio
+async def test_heartbeat_evicts_dead_connections(managers, make_websocket, sent):
+    manager = managers(ping_interval=1, max_missed_pongs=1)
+    ticks_per_ping = round(manager.ping_interval / manager.wheel.tick)
+    alive_ws = make_websocket()
+    dead_ws = make_websocket()
+    text_ws = make_websocket()
+    alive = await manager.subscribe("alive@example.com", alive_ws, format="json")
+    await manager.subscribe("dead@example.com", dead_ws, format="json")
+    await manager.subscribe("text@example.com", text_ws)
+
+    for _ in range(ticks_per_ping):
+        manager.wheel.advance()
+    await manager.drain()
+    assert json.loads(sent(alive_ws)[0]) == {"type": "ping"}
+    assert sent(text_ws) == []
+
+    manager.mark_alive(alive)
+    for _ in range(ticks_per_ping):
+        manager.wheel.advance()
+
+    assert "dead@example.com" not in manager.active_connections
+    assert "alive@example.com" in manager.active_connections
+    assert manager.stats()["heartbeat_evictions"] == 1
+    assert manager.stats()["pings_sent"] == 3
+
+
+# Should stream broadcasts to SSE clients as encoded event-stream messages
+@pytest.mark.asyncio
+async def test_sse_subscription_streams_events(managers):
+    manager = managers()
+    subscription = await manager.subscribe_sse("sse@example.com", format="json")
+    stream = subscription.stream()
+
+    await manager.broadcast("Hello", id=7)
+    assert await anext(stream) == b'id: 7\ndata: {"id":7,"message":"Hello"}\n\n'
+
+    # unsubscribing ends the stream
+    manager.unsubscribe_connection(subscription)
+    with pytest.raises(StopAsyncIteration):
+        await anext(stream)
+
+
+# Should keep idle SSE streams open with comment pings and never evict them for missed pongs
+@pytest.mark.asyncio
+async def test_sse_keepalive_pings(managers):
+    manager = managers(ping_interval=1, max_missed_pongs=1)
+    ticks_per_ping = round(manager.ping_interval / manager.wheel.tick)
+    subscription = await manager.subscribe_sse("sse@example.com")
+    stream = subscription.stream()
+
+    for _ in range(3 * ticks_per_ping):
+        manager.wheel.advance()
+
+    assert [await anext(stream) for _ in range(3)] == [b": ping\n\n"] * 3
+    assert "sse@example.com" in manager.active_connections
+    manager.unsubscribe_connection(subscription)
+
+
+# Should register an SSE client only once its response body starts streaming
+@pytest.mark.asyncio
+async def test_sse_handler_registers_when_streaming(mocker):
+    manager = NotificationManager()
+    mocker.patch.object(user, "noti_manager", manager)
+    mocker.patch.object(user, "extract_email_from_ws_cookie", return_value="sse@example.com")
+    request = Request({"type": "http", "method": "GET", "headers": []})
+
+    response = await user.notifications_sse_handler(request, topics="", format="text", last_id=None)
+    # a client gone before the body starts leaves no subscription behind
+    assert manager.connections == set()
+
+    body = response.body_iterator
+    first = asyncio.ensure_future(anext(body))
+    await asyncio.sleep(0)
+    assert "sse@example.com" in manager.active_connections
+    await manager.broadcast("Hello")
+    assert await first == b"data: Hello\n\n"
+
+    await body.aclose()
+    assert manager.connections == set()
+    await manager.close()
+
+
+# Multi-line text payloads need one data field per line
+def test_frame_sse_message_text_batch():
+    frame = Frame({"events": [{"id": 1, "message": "a"}, {"id": 2, "message": "b"}]})
+    assert frame.sse_message() == b"id: 2\ndata: a\ndata: b\n\n"
+    assert frame.sse_message() is frame.sse_message()
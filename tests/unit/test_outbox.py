@@ -0,0 +1,76 @@
+# tests/unit/test_outbox.py
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel, Session, create_engine, select
+
+from app.models.notification import Notification
+from app.services.outbox import OutboxDispatcher
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+# Should publish pending rows in id order and mark them dispatched
+@pytest.mark.asyncio
+async def test_dispatch_once_publishes_and_marks(mocker, engine):
+    with Session(engine) as session:
+        session.add(Notification(message="first"))
+        session.add(Notification(message="second"))
+        session.commit()
+
+    manager = mocker.Mock()
+    manager.broadcast = mocker.AsyncMock()
+    dispatcher = OutboxDispatcher(manager, engine=engine, batch_size=10)
+
+    assert await dispatcher.dispatch_once() == 2
+    assert [c.args[0] for c in manager.broadcast.await_args_list] == ["first", "second"]
+    assert [c.kwargs["id"] for c in manager.broadcast.await_args_list] == [1, 2]
+
+    with Session(engine) as session:
+        assert all(n.dispatched_at is not None for n in session.exec(select(Notification)))
+
+    # already dispatched rows are not published again
+    assert await dispatcher.dispatch_once() == 0
+    assert manager.broadcast.await_count == 2
+
+
+# Rows stay pending when publishing fails, so they are retried (at-least-once)
+@pytest.mark.asyncio
+async def test_dispatch_once_keeps_rows_on_failure(mocker, engine):
+    with Session(engine) as session:
+        session.add(Notification(message="first"))
+        session.commit()
+
+    manager = mocker.Mock()
+    manager.broadcast = mocker.AsyncMock(side_effect=RuntimeError("bus down"))
+    dispatcher = OutboxDispatcher(manager, engine=engine)
+
+    with pytest.raises(RuntimeError):
+        await dispatcher.dispatch_once()
+
+    with Session(engine) as session:
+        assert session.exec(select(Notification)).one().dispatched_at is None
+
+
+# Should delete only the rows dispatched longer than the retention ago
+@pytest.mark.asyncio
+async def test_purge_dispatched_keeps_recent_and_pending_rows(mocker, engine):
+    now = datetime.now(timezone.utc)
+    with Session(engine) as session:
+        for i in range(3):
+            session.add(Notification(message=f"old {i}", dispatched_at=now - timedelta(hours=2)))
+        session.add(Notification(message="recent", dispatched_at=now))
+        session.add(Notification(message="pending"))
+        session.commit()
+    dispatcher = OutboxDispatcher(mocker.Mock(), engine=engine, batch_size=2, retention=3600)
+
+    assert await dispatcher.purge_dispatched() == 3
+    with Session(engine) as session:
+        assert [n.message for n in session.exec(select(Notification))] == ["recent", "pending"]
@@ -0,0 +1,96 @@
+# tests/unit/test_rate_limit.py
+
+import pytest
+from app.services.rate_limit import (
+    InMemoryRateLimitStore,
+    RateLimiter,
+    SqliteRateLimitStore,
+    create_rate_limit_store,
+)
+
+
+# Should allow `limit` hits per sliding window and tell when the next one is allowed
+@pytest.mark.asyncio
+async def test_memory_store_sliding_window(timer):
+    store = InMemoryRateLimitStore(timer=timer)
+    assert await store.hit("k", limit=2, window=10) == 0
+    timer.now = 1004
+    assert await store.hit("k", limit=2, window=10) == 0
+
+    assert await store.hit("k", limit=2, window=10) == pytest.approx(6)
+    # the first hit left the window, one slot is free again
+    timer.now = 1010
+    assert await store.hit("k", limit=2, window=10) == 0
+    assert await store.hit("k", limit=2, window=10) == pytest.approx(4)
+
+
+# Should stay within maxsize by evicting the least recently used key
+@pytest.mark.asyncio
+async def test_memory_store_is_bounded(timer):
+    store = InMemoryRateLimitStore(maxsize=2, timer=timer)
+    await store.hit("a", 1, 10)
+    await store.hit("b", 1, 10)
+    await store.hit("a", 1, 10)
+    await store.hit("c", 1, 10)
+
+    assert len(store) == 2
+    # "b" was evicted, its budget starts over
+    assert await store.hit("b", 1, 10) == 0
+    assert await store.hit("c", 1, 10) > 0
+
+
+# Should share the counts between two stores on the same file, as workers would
+@pytest.mark.asyncio
+async def test_sqlite_store_is_shared(tmp_path):
+    path = str(tmp_path / "limits.db")
+    first, second = SqliteRateLimitStore(path), SqliteRateLimitStore(path)
+
+    assert await first.hit("k", limit=2, window=60) == 0
+    assert await second.hit("k", limit=2, window=60) == 0
+    assert 0 < await first.hit("k", limit=2, window=60) <= 60
+
+    second.clear()
+    assert await first.hit("k", limit=2, window=60) == 0
+
+
+# Should delete the expired rows of every key, not only of the keys hit again
+@pytest.mark.asyncio
+async def test_sqlite_store_purges_stale_keys(tmp_path, mocker):
+    store = SqliteRateLimitStore(str(tmp_path / "limits.db"))
+    clock = mocker.patch("app.services.rate_limit.time.time", return_value=1000.0)
+    for i in range(3):
+        await store.hit(f"ip:{i}", limit=5, window=60)
+
+    clock.return_value = 1061
+    await store.hit("ip:new", limit=5, window=60)
+
+    assert store._db.connect().execute("SELECT key FROM rate_limit_hit").fetchall() == [("ip:new",)]
+
+
+# Should count every attempt per IP but only failures per email
+@pytest.mark.asyncio
+async def test_limiter_counts_ip_attempts_and_email_failures(timer):
+    store = InMemoryRateLimitStore(timer=timer)
+    limiter = RateLimiter(store, per_ip=3, per_email=2, window=60)
+
+    # successful attempts from many addresses don't lock the email out
+    for i in range(5):
+        assert await limiter.check("login", f"10.0.1.{i}", "alice@example.com") == 0
+    await limiter.record_failure("login", "Alice@example.com")
+    await limiter.record_failure("login", "alice@example.com")
+    assert await limiter.check("login", "10.0.0.9", "alice@example.com") > 0
+
+    assert await limiter.check("login", "10.0.0.1", "bob@example.com") == 0
+    assert await limiter.check("login", "10.0.0.1", "carol@example.com") == 0
+    assert await limiter.check("login", "10.0.0.1", "dave@example.com") == 0
+    assert await limiter.check("login", "10.0.0.1", "erin@example.com") > 0
+    # other actions have their own budget
+    assert await limiter.check("register", "10.0.0.1", "erin@example.com") == 0
+
+
+# Should build the store from its url and reject unknown ones
+def test_create_rate_limit_store(tmp_path):
+    assert isinstance(create_rate_limit_store("memory"), InMemoryRateLimitStore)
+    assert isinstance(create_rate_limit_store(f"sqlite:///{tmp_path / 'l.db'}"), SqliteRateLimitStore)
+    with pytest.raises(ValueError):
+        create_rate_limit_store("redis://localhost")
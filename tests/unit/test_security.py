@@ -1,6 +1,20 @@
 # tests/unit/test_security.py
 
-from app.utils.security import get_password_hash, verify_password
+import asyncio
+
+import pytest
+from app.utils.security import (
+    HashPoolBusy,
+    calibrate_bcrypt_rounds,
+    get_password_hash,
+    hash_passwords_async,
+    needs_rehash,
+    pwd_context,
+    set_bcrypt_rounds,
+    verify_password,
+    hash_password_async,
+    verify_password_async,
+)
 
 def test_get_password_hash_returns_hash():
     password = "my_secret"
@@ -20,3 +34,100 @@ def test_verify_password_incorrect():
     wrong_password = "not_my_secret"
     hashed = get_password_hash(password)
     assert verify_password(wrong_password, hashed) is False
+
+
+# Async variants should produce hashes that interoperate with the sync helpers
+@pytest.mark.asyncio
+async def test_hash_and_verify_password_async():
+    password = "my_secret"
+    hashed = await hash_password_async(password)
+    assert hashed.startswith("$2")
+    assert verify_password(password, hashed) is True
+    assert await verify_password_async(password, hashed) is True
+    assert await verify_password_async("not_my_secret", hashed) is False
+
+
+# Should run in the loop's default executor when the process pool is disabled
+@pytest.mark.asyncio
+async def test_hash_password_async_without_process_pool(mocker):
+    mocker.patch("app.utils.security.PASSWORD_HASH_WORKERS", 0)
+    hashed = await hash_password_async("my_secret")
+    assert verify_password("my_secret", hashed) is True
+
+
+# Should shed callers beyond the waiting limit, while bulk hashing still waits its turn
+@pytest.mark.asyncio
+async def test_full_hash_queue_sheds_requests(mocker):
+    mocker.patch("app.utils.security.PASSWORD_HASH_WORKERS", 0)
+    mocker.patch("app.utils.security.PASSWORD_HASH_MAX_CONCURRENCY", 1)
+    mocker.patch("app.utils.security.PASSWORD_HASH_MAX_WAITING", 0)
+    running = asyncio.create_task(hash_password_async("my_secret"))
+    await asyncio.sleep(0)
+
+    with pytest.raises(HashPoolBusy) as exc:
+        await verify_password_async("my_secret", "$2b$12$" + "a" * 53)
+    assert exc.value.retry_after >= 1
+
+    hashed, = await hash_passwords_async(["other"])
+    assert verify_password("other", hashed) is True
+    assert verify_password("my_secret", await running) is True
+
+
+@pytest.fixture
+def restore_pwd_context():
+    saved = pwd_context.to_dict()
+    yield
+    pwd_context.load(saved)
+
+
+# Should hash with the configured rounds and flag hashes of any other cost
+def test_set_bcrypt_rounds_flags_other_costs(restore_pwd_context):
+    cheap = get_password_hash("my_secret", rounds=4)
+    set_bcrypt_rounds(5)
+
+    current = get_password_hash("my_secret")
+
+    assert current.startswith("$2b$05$")
+    assert needs_rehash(current) is False
+    assert needs_rehash(cheap) is True
+    assert needs_rehash(get_password_hash("my_secret", rounds=6)) is True
+
+
+# Should extrapolate from the timed runs, each round doubling the cost, within the allowed range
+def test_calibrate_bcrypt_rounds(mocker):
+    # every timed hash at 8 rounds takes 10 ms
+    mocker.patch("app.utils.security.time.perf_counter", side_effect=[0, 0.01] * 10)
+
+    assert calibrate_bcrypt_rounds(0.25) == 12
+    assert calibrate_bcrypt_rounds(0.001) == 10
+
+
+# Should not count bulk hashing waiting its turn against the limit of interactive callers
+@pytest.mark.asyncio
+async def test_bulk_hashing_does_not_shed_logins(mocker):
+    mocker.patch("app.utils.security.PASSWORD_HASH_WORKERS", 0)
+    mocker.patch("app.utils.security.PASSWORD_HASH_MAX_CONCURRENCY", 1)
+    mocker.patch("app.utils.security.PASSWORD_HASH_MAX_WAITING", 1)
+    bulk = asyncio.create_task(hash_passwords_async(["a", "b", "c"], chunk_size=1))
+    await asyncio.sleep(0)
+
+    hashed = get_password_hash("my_secret", rounds=4)
+    assert await verify_password_async("my_secret", hashed) is True
+    assert len(await bulk) == 3
+
+
+# Should leave a hashing slot free so a login doesn't wait for the whole batch
+@pytest.mark.asyncio
+async def test_bulk_hashing_leaves_a_slot_for_logins(mocker, restore_pwd_context):
+    mocker.patch("app.utils.security.PASSWORD_HASH_WORKERS", 0)
+    mocker.patch("app.utils.security.PASSWORD_HASH_MAX_CONCURRENCY", 2)
+    set_bcrypt_rounds(8)
+    bulk = asyncio.create_task(hash_passwords_async([f"p{i}" for i in range(16)], chunk_size=1))
+    await asyncio.sleep(0)
+
+    hashed = await hash_password_async("my_secret")
+
+    assert not bulk.done()
+    assert verify_password("my_secret", hashed) is True
+    hashes = await bulk
+    assert [verify_password(f"p{i}", h) for i, h in enumerate(hashes)] == [True] * 16
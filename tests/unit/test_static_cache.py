@@ -0,0 +1,111 @@
+# tests/unit/test_static_cache.py
+
+import gzip
+import os
+
+import brotli
+from starlette.requests import Request
+
+from app.utils.static_cache import StaticCache
+
+PAGE = "<html><body>" + "hello " * 100 + "</body></html>"
+
+
+def _request(method="GET", **headers):
+    raw = [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()]
+    return Request({"type": "http", "method": method, "headers": raw})
+
+
+def _cache(tmp_path, reload=False):
+    (tmp_path / "page.html").write_text(PAGE)
+    (tmp_path / "tiny.js").write_text("let a = 1;")
+    return StaticCache(tmp_path, reload=reload)
+
+
+# Should serve the gzip variant with an ETag when the client accepts it
+def test_serves_gzip_variant(tmp_path):
+    cache = _cache(tmp_path)
+
+    resp = cache.response(_request(accept_encoding="gzip, deflate"), "page.html", "no-cache")
+
+    assert resp.headers["content-encoding"] == "gzip"
+    assert gzip.decompress(resp.body).decode() == PAGE
+    assert resp.headers["etag"].endswith('-gz"')
+    assert resp.headers["vary"] == "Accept-Encoding"
+    assert resp.headers["cache-control"] == "no-cache"
+
+
+# Should prefer brotli over gzip when the client accepts both
+def test_serves_brotli_variant(tmp_path):
+    cache = _cache(tmp_path)
+
+    resp = cache.response(_request(accept_encoding="gzip, br"), "page.html", "x")
+
+    assert resp.headers["content-encoding"] == "br"
+    assert brotli.decompress(resp.body).decode() == PAGE
+    assert resp.headers["etag"].endswith('-br"')
+
+
+# Should answer HEAD with the headers of the GET and no body
+def test_head_has_no_body(tmp_path):
+    cache = _cache(tmp_path)
+    get = cache.response(_request(accept_encoding="gzip"), "page.html", "x")
+
+    resp = cache.response(_request("HEAD", accept_encoding="gzip"), "page.html", "x")
+
+    assert resp.status_code == 200
+    assert resp.body == b""
+    assert resp.headers["content-length"] == str(len(get.body))
+    assert resp.headers["etag"] == get.headers["etag"]
+    assert resp.headers["content-encoding"] == "gzip"
+
+
+# Should fall back to identity for small files and clients without gzip
+def test_serves_identity(tmp_path):
+    cache = _cache(tmp_path)
+
+    assert "content-encoding" not in cache.response(_request(accept_encoding="gzip"), "tiny.js", "x").headers
+    resp = cache.response(_request(accept_encoding="gzip;q=0"), "page.html", "x")
+    assert "content-encoding" not in resp.headers
+    assert resp.body.decode() == PAGE
+
+
+# Should answer a conditional request for the current representation with 304
+def test_if_none_match_returns_304(tmp_path):
+    cache = _cache(tmp_path)
+    etag = cache.response(_request(accept_encoding="gzip"), "page.html", "x").headers["etag"]
+
+    resp = cache.response(_request(accept_encoding="gzip", if_none_match=etag), "page.html", "x")
+    assert resp.status_code == 304
+    assert resp.body == b""
+
+    # a different representation doesn't match
+    resp = cache.response(_request(if_none_match=etag), "page.html", "x")
+    assert resp.status_code == 200
+
+
+# Should not touch the disk without reload, and pick up changes with it
+def test_reload_on_change(tmp_path):
+    cache = _cache(tmp_path)
+    dev_cache = _cache(tmp_path, reload=True)
+    path = tmp_path / "page.html"
+    path.write_text("changed")
+    os.utime(path, ns=(0, 0))
+
+    assert cache.response(_request(), "page.html", "x").body.decode() == PAGE
+    assert dev_cache.response(_request(), "page.html", "x").body == b"changed"
+    assert dev_cache.response(_request(), "../page.html", "x").status_code == 404
+    assert cache.response(_request(), "missing.html", "x").status_code == 404
+
+
+# Should serve files of subdirectories by their relative path
+def test_serves_subdirectories(tmp_path):
+    (tmp_path / "css").mkdir()
+    (tmp_path / "css" / "site.css").write_text("body {}")
+    cache = _cache(tmp_path)
+    dev_cache = StaticCache(tmp_path, reload=True)
+    (tmp_path / "css" / "new.css").write_text("p {}")
+
+    assert cache.response(_request(), "css/site.css", "x").body == b"body {}"
+    assert dev_cache.response(_request(), "css/new.css", "x").body == b"p {}"
+    assert dev_cache.response(_request(), "css/../../page.html", "x").status_code == 404
@@ -0,0 +1,57 @@
+# tests/unit/test_timer_wheel.py
+
+import asyncio
+
+import pytest
+from app.utils.timer_wheel import TimerWheel
+
+
+# Should fire timers on the tick their delay rounds up to
+def test_timer_fires_after_delay():
+    wheel = TimerWheel(tick=1.0, slots=8)
+    fired = []
+    wheel.schedule(3, lambda: fired.append("a"))
+    wheel.schedule(2.5, lambda: fired.append("b"))
+
+    wheel.advance()
+    wheel.advance()
+    assert fired == []
+    wheel.advance()
+    assert sorted(fired) == ["a", "b"]
+    assert len(wheel) == 0
+
+
+# Delays longer than one turn of the wheel should wait extra rounds
+def test_timer_longer_than_one_turn():
+    wheel = TimerWheel(tick=1.0, slots=4)
+    fired = []
+    wheel.schedule(10, lambda: fired.append("a"))
+
+    for _ in range(9):
+        wheel.advance()
+    assert fired == []
+    wheel.advance()
+    assert fired == ["a"]
+
+
+# Cancelled timers should never fire
+def test_cancel_timer():
+    wheel = TimerWheel(tick=1.0, slots=4)
+    fired = []
+    timer = wheel.schedule(1, lambda: fired.append("a"))
+    wheel.cancel(timer)
+    wheel.advance()
+    assert fired == []
+
+
+# The background task should advance the wheel in real time
+@pytest.mark.asyncio
+async def test_wheel_task_ticks():
+    wheel = TimerWheel(tick=0.01, slots=16)
+    fired = asyncio.Event()
+    wheel.schedule(0.02, fired.set)
+    wheel.start()
+    try:
+        await asyncio.wait_for(fired.wait(), timeout=1)
+    finally:
+        await wheel.stop()
@@ -0,0 +1,93 @@
+# tests/unit/test_token_revocation.py
+
+import time
+
+import pytest
+from app.services.token_revocation import (
+    InMemoryRevocationStore,
+    SqliteRevocationStore,
+    create_revocation_store,
+)
+
+
+# Should revoke the user's tokens issued up to the cutoff until it expires
+@pytest.mark.asyncio
+async def test_memory_store_expires_entries(timer):
+    store = InMemoryRevocationStore(timer=timer)
+    await store.revoke("a@example.com", issued_at=990, expires_at=1010)
+
+    assert await store.is_revoked("a@example.com", issued_at=990) is True
+    assert await store.is_revoked("a@example.com", issued_at=980) is True
+    # logged in again after the logout
+    assert await store.is_revoked("a@example.com", issued_at=995) is False
+    assert await store.is_revoked("b@example.com", issued_at=990) is False
+
+    timer.now = 1010
+    assert await store.is_revoked("a@example.com", issued_at=990) is False
+
+
+# Should ignore tokens that are already expired
+@pytest.mark.asyncio
+async def test_memory_store_skips_expired_tokens(timer):
+    store = InMemoryRevocationStore(timer=timer)
+    await store.revoke("a@example.com", issued_at=900, expires_at=999)
+    assert len(store) == 0
+
+
+# Should keep one entry per user however often they log out, with the latest cutoff and expiry
+@pytest.mark.asyncio
+async def test_memory_store_keeps_one_entry_per_user(timer):
+    store = InMemoryRevocationStore(timer=timer)
+    for i in range(100):
+        await store.revoke("a@example.com", issued_at=900 + i, expires_at=1100 + i)
+    await store.revoke("a@example.com", issued_at=950, expires_at=1050)
+
+    assert len(store) == 1
+    assert len(store._heap) == 1
+    assert await store.is_revoked("a@example.com", issued_at=999) is True
+
+    timer.now = 1150
+    assert await store.is_revoked("a@example.com", issued_at=999) is True
+    timer.now = 1199
+    await store.revoke("b@example.com", issued_at=1190, expires_at=1300)
+    assert len(store) == 1
+
+
+# Should never drop live revocations beyond maxsize, only report it
+@pytest.mark.asyncio
+async def test_memory_store_keeps_live_entries_beyond_maxsize(caplog, timer):
+    store = InMemoryRevocationStore(maxsize=2, timer=timer)
+    await store.revoke("a", issued_at=990, expires_at=1100)
+    await store.revoke("b", issued_at=990, expires_at=1050)
+    await store.revoke("c", issued_at=990, expires_at=1200)
+
+    assert len(store) == 3
+    assert [await store.is_revoked(subject, 990) for subject in ("a", "b", "c")] == [True] * 3
+    assert "above its maxsize" in caplog.text
+
+    # expired entries still make room
+    timer.now = 1150
+    await store.revoke("d", issued_at=1140, expires_at=1300)
+    assert len(store) == 2
+
+
+# Should share revocations between store instances on the same file
+@pytest.mark.asyncio
+async def test_sqlite_store_is_shared(tmp_path):
+    path = str(tmp_path / "revoked.db")
+    writer = SqliteRevocationStore(path)
+    reader = SqliteRevocationStore(path)
+    now = time.time()
+
+    await writer.revoke("a@example.com", issued_at=now - 10, expires_at=now + 60)
+    await writer.revoke("a@example.com", issued_at=now - 20, expires_at=now + 30)
+    await writer.revoke("old@example.com", issued_at=now - 10, expires_at=now - 1)
+
+    assert await reader.is_revoked("a@example.com", now - 10) is True
+    assert await reader.is_revoked("a@example.com", now - 5) is False
+    assert await reader.is_revoked("old@example.com", now - 10) is False
+
+
+def test_create_revocation_store_rejects_unknown_url():
+    with pytest.raises(ValueError):
+        create_revocation_store("redis://localhost")
@@ -0,0 +1,96 @@
+# tests/unit/test_user_import.py
+
+import json
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, Session, select
+
+from app import database
+from app.database import ReplicaRouter
+from app.models.notification import Notification
+from app.models.user import User
+from app.services.user_import import _lines, import_users
+from app.utils.security import get_password_hash, verify_password
+
+HASHED = get_password_hash("prehashed")
+
+
+async def _stream(text: str, size: int = 7):
+    # small chunks split lines and multi-byte characters between reads
+    data = text.encode()
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+# A SQLite file with one existing user, used as the primary
+@pytest_asyncio.fixture
+async def sync_engine(tmp_path, monkeypatch):
+    path = tmp_path / "import.db"
+    engine = create_engine(f"sqlite:///{path}")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(User(email="existing@example.com", hashed_password=HASHED))
+        session.commit()
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    monkeypatch.setattr(database, "replica_router", ReplicaRouter(async_engine))
+    yield engine
+    await async_engine.dispose()
+    engine.dispose()
+
+
+# Should reassemble lines split across chunks
+@pytest.mark.asyncio
+async def test_lines_are_split_across_chunks():
+    lines = [line async for line in _lines(_stream("a,é\r\nbb\n\nlast"))]
+
+    assert lines == ["a,é", "bb", "", "last"]
+
+
+# Should import plain and pre-hashed passwords and report what was skipped
+@pytest.mark.asyncio
+async def test_import_csv_reports_duplicates_and_errors(sync_engine):
+    text = (
+        "email,password,hashed_password\n"
+        "plain@example.com,secret,\n"
+        f"hashed@example.com,,{HASHED}\n"
+        "existing@example.com,secret,\n"
+        "plain@example.com,other,\n"
+        "not-an-email,secret,\n"
+        "bad@example.com,,$2b$12$short\n"
+    )
+
+    report = await import_users(_stream(text), "csv")
+
+    assert (report.total, report.imported, report.duplicates, report.invalid) == (6, 2, 2, 2)
+    assert sorted(report.duplicate_emails) == ["existing@example.com", "plain@example.com"]
+    assert report.errors == ["line 6: invalid email", "line 7: hashed_password is not a bcrypt hash"]
+    with Session(sync_engine) as session:
+        users = {user.email: user for user in session.exec(select(User)).all()}
+        notifications = session.exec(select(Notification)).all()
+    assert verify_password("secret", users["plain@example.com"].hashed_password)
+    assert users["hashed@example.com"].hashed_password == HASHED
+    # one summary notification for the whole import
+    assert [n.message for n in notifications] == ["2 users imported"]
+
+
+# Should find duplicates across batches through the rows already committed
+@pytest.mark.asyncio
+async def test_import_jsonl_in_batches(sync_engine):
+    records = [{"email": f"user{i}@example.com", "hashed_password": HASHED} for i in range(5)]
+    records.append({"email": "user0@example.com", "hashed_password": HASHED})
+    text = "\n".join(json.dumps(record) for record in records) + "\n[1]\n"
+
+    report = await import_users(_stream(text), "jsonl", batch_size=2)
+
+    assert (report.total, report.imported, report.duplicates, report.invalid) == (7, 5, 1, 1)
+    assert report.duplicate_emails == ["user0@example.com"]
+
+
+# Should reject a CSV without the needed columns before importing anything
+@pytest.mark.asyncio
+async def test_import_csv_requires_header(sync_engine):
+    with pytest.raises(ValueError):
+        await import_users(_stream("name,password\nx,y\n"), "csv")